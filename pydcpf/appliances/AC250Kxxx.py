@@ -23,6 +23,8 @@ class Device(core.Device):
     Communications goes over a serial line with a baudrate of 9600, bytesize of 8, no bit parity, 1 stopbit and no flow control
     """
 
+    idempotent_instructions = frozenset(['NAP???', 'OUT?', 'ID?']) #getters
+
 
     def __init__(self, address, internal_address=0xff, **kwargs):
         """Initialize a new Device object with the specified address communicating through the specified serial port.
@@ -136,7 +138,7 @@ class Device(core.Device):
         status : bool
             True if output is activated, False otherwise
         """
-        if str(self.query(DATA='OUT?')[-1]) == '1': #should be 'OUT1'
+        if self.query(DATA='OUT?')[-1] == '1': #should be 'OUT1'
             return True
         else: #should be 'OUT0'
             return False
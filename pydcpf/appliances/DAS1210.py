@@ -18,12 +18,138 @@
 """API for the DAS1210 device made by Paouch s.r.o. used at the GOLEM reactor, FJFI, CVUT"""
 
 from . import spinel_core
-import struct
+from .. import storage
+import os
 
 
 ranges = [0.25, 0.5, 1, 2.5, 5, 10]
 
 
+def _range_identifier(value):
+    try:
+        return ranges.index(value)
+    except ValueError:
+        raise ValueError("Invalid range specified, possible ranges are: " + repr(ranges))
+
+
+def _range_from_identifier(identifier):
+    try:
+        return ranges[identifier]
+    except IndexError:
+        raise ValueError("Device reports unexpected range with identifier %i" % identifier)
+
+
+
+class Download(object):
+    """State of a resumable data download from one channel, see :meth:`Device.download_data`
+
+    Received blocks are tracked in a bitmap with one bit per block.
+    The bitmap may be also written through to a file, so that it survives the process together with the blocks written to a sink.
+
+    Attributes
+    ----------
+    channel : int
+        channel number
+    packet_size : int
+        number of data points in one block
+    block_count : int
+        number of blocks to download
+    blocks : list of buffers or None
+        received blocks, None for blocks not received yet
+        None if the blocks are written to a sink
+    sink : object or None
+        sink the blocks are written to, see :mod:`storage`
+    bitmap : bytearray
+        bit *i* of byte *i / 8* is set if block number *i* was received
+    """
+
+
+    def __init__(self, length, channel, packet_size=4096, bitmap_path=None, sink=None):
+        """Initialize a download of *length* data points from *channel*
+
+        Parameters
+        ----------
+        length, channel, packet_size
+            same meaning as in :meth:`Device.get_data`
+        bitmap_path : str, optional
+            file in which the bitmap of received blocks is kept, requires a *sink*
+            If the file exists, the download continues from the state recorded in it
+        sink : object, optional
+            If specified, the blocks are written into it with sink.write_block(channel, offset, data)
+            instead of being kept in memory, e.g. a :class:`storage.MemmapSink`
+            To resume in another process, the sink must be reopened too, e.g. with storage.MemmapSink(path)
+
+        Raises
+        ------
+        ValueError
+            if *bitmap_path* is given without a *sink*, the blocks kept in memory would not survive the process
+        """
+        if bitmap_path is not None and sink is None:
+            raise ValueError("a sink is required with a bitmap file, blocks kept in memory are lost with the process")
+        self.channel = channel
+        self.packet_size = packet_size
+        self.block_count = length / packet_size
+        self.sink = sink
+        if sink is None:
+            self.blocks = [None] * self.block_count
+        else:
+            self.blocks = None
+        bitmap_size = (self.block_count + 7) / 8
+        self.bitmap = bytearray(bitmap_size)
+        self._bitmap_file = None
+        if bitmap_path is not None:
+            #updated in place, truncating it first would lose the state if the process crashed meanwhile
+            self._bitmap_file = open(bitmap_path, 'r+b' if os.path.exists(bitmap_path) else 'w+b')
+            saved = self._bitmap_file.read(bitmap_size)
+            self.bitmap[:len(saved)] = saved
+            if len(saved) < bitmap_size: #new or short file
+                self._bitmap_file.seek(len(saved))
+                self._bitmap_file.write(self.bitmap[len(saved):])
+                self._bitmap_file.flush()
+
+
+    def offset(self, index):
+        """Return the offset of the block number *index* in data points"""
+        return index * self.packet_size
+
+
+    def is_received(self, index):
+        """Return True if the block number *index* was received"""
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+
+    def store(self, index, data):
+        """Store the *data* of block number *index* and mark it as received"""
+        if self.sink is None:
+            self.blocks[index] = data
+        else:
+            self.sink.write_block(self.channel, self.offset(index), data)
+        byte_index = index >> 3
+        self.bitmap[byte_index] |= 1 << (index & 7)
+        if self._bitmap_file is not None:
+            self._bitmap_file.seek(byte_index)
+            self._bitmap_file.write(chr(self.bitmap[byte_index]))
+            self._bitmap_file.flush()
+
+
+    def missing_blocks(self):
+        """Return the list of numbers of blocks not received yet"""
+        return [index for index in xrange(self.block_count) if not self.is_received(index)]
+
+
+    def is_complete(self):
+        """Return True if all blocks were received"""
+        return not self.missing_blocks()
+
+
+    def close(self):
+        """Close the bitmap file if any"""
+        if self._bitmap_file is not None:
+            self._bitmap_file.close()
+            self._bitmap_file = None
+
+
+
 class Device(spinel_core.Device):
     """Class representing the DAS1210 device
 
@@ -35,8 +161,12 @@ class Device(spinel_core.Device):
     Where possible, the method parameters default to the values that are set on device reset.
     Methods beginning with 'set_'  return the DATA portion of the packet, usually empty
     Methods beginning with 'get_' return some meaningful value, see their docstring for more.
+    Methods sending a single instruction are generated with :meth:`core.Device.register_command`,
+    those with a channel parameter have a *_many variant taking a list of channels and pipelining the queries.
     """
 
+    idempotent_instructions = frozenset(['\x71', '\x73', '\x75', '\x77', '\x51', '\xf5', '\xf3']) #getters and data block reads
+
 
     def __init__(self, ip_address, port=10001, **kwargs):
         """Initalize the device
@@ -54,8 +184,75 @@ class Device(spinel_core.Device):
         super(Device, self).__init__(address=(ip_address, port), protocol_module='pydcpf.protocols.spinel97', interface_module='pydcpf.interfaces.socket_interface', **kwargs)
     
     
-    def set_range(self, value=10, channel=0xff):
-        """Set the channel range.
+    def get_data(self, length, channel, packet_size=4096):
+        """Retreive a data sample of the specified length from the specified channel.
+
+        Parameters
+        ----------
+        length : int
+            number of data points in sample
+            should be a multiple of *packet_size*
+        channel : int
+            channel number
+        packet_size : int
+            number of data points to retreive in one packet
+            defaults to 4096 which is the optimum value with regards to the device IO capabilities
+            must not exceed 8192
+            
+        Returns
+        -------
+        data_array : list of buffers
+            
+        """
+        target = [] #will append to the list
+        for packet_i in xrange(length / packet_size): #number of packets needed, rounded up to inlude the requested length for sure
+            target.append(self.get_data_block(packet_i * packet_size, channel, packet_size))
+        return target
+
+
+    def download_data(self, download):
+        """Retreive the blocks of the *download* which were not received yet.
+
+        If retreiving a block fails, the exception is raised, but the blocks received so far are kept in *download*.
+        After reconnecting, call this method again to retreive only the missing blocks.
+
+        Parameters
+        ----------
+        download : :class:`Download`
+            state of the download
+
+        Returns
+        -------
+        data_array : list of buffers or None
+            the blocks of *download*, None if they were written to its sink
+        """
+        for index in download.missing_blocks():
+            download.store(index, self.get_data_block(download.offset(index), download.channel, download.packet_size))
+        return download.blocks
+
+    
+    def create_sink(self, path, channels, sample_format='>H'):
+        """Create a :class:`storage.MemmapSink` shot file for the specified channels
+
+        The range, sampling frequency and samples count of each channel are read from the device
+        and recorded in the file header.
+
+        Parameters
+        ----------
+        path : str
+            shot file path
+        channels : list of int
+            channel numbers
+        sample_format : str, optional
+            struct format of one sample
+        """
+        return storage.MemmapSink(path, [(channel, self.get_range(channel), self.get_sampling_frequency(channel), self.get_samples_count(channel))
+                                         for channel in channels], sample_format)
+
+
+
+Device.register_command('set_range', '\x70', [('value', 10), ('channel', 0xff)], request_format='B', encoder=_range_identifier, docstring=
+    """Set the channel range.
 
         Parameters
         ----------
@@ -68,45 +265,26 @@ class Device(spinel_core.Device):
         ------
         ValueError
             if specified range cannot be set (invalid value)
-        """
-        
-        try:
-            return self.query(INST='\x70', DATA=chr(ranges.index(value)), ADR=channel)
-        except ValueError:
-            raise ValueError("Invalid range specified, possible ranges are: " + repr(ranges))
-
-        
-    def get_range(self, channel):
-        """Return the range of the channel in Volts.
+        """)
+Device.register_command('get_range', '\x71', ['channel'], response_format='B', decoder=_range_from_identifier, docstring=
+    """Return the range of the channel in Volts.
         
         Inverse function to :func:`set_range`
-        """
-        try:
-            return ranges[ord(str(self.query(INST='\x71', ADR=channel)))]
-        except IndexError:
-            raise ValueError("Device reports unexpected range with identifier " + value)
-
- 
-    def set_trigger(self, trigger=True, channel=0xff):
-        """Set the trigger mode of the specified channel.
+        """)
+Device.register_command('set_trigger', '\x72', [('trigger', True), ('channel', 0xff)], request_format='B', encoder=int, docstring=
+    """Set the trigger mode of the specified channel.
 
         Parameters
         ----------
         trigger : bool
             if True, use a rising edge trigger mode
             if False, use falling edge trigger mode
-        """
-        return self.query(INST='\x72', DATA=chr(int(trigger)), ADR=channel)
-
-
-    def get_trigger(self, channel):
-        """Return the trigger mode as bool as described in the inverse function :func:`set_trigger`
-        """
-        return bool(ord(str(self.query(INST='\x73', ADR=channel))))
-
-    
-    def set_sampling_frequency(self, freq=1e6, channel=0xff):
-        """Set the sampling frequency of the specified channel.
+        """)
+Device.register_command('get_trigger', '\x73', ['channel'], response_format='B', decoder=bool, docstring=
+    """Return the trigger mode as bool as described in the inverse function :func:`set_trigger`
+        """)
+Device.register_command('set_sampling_frequency', '\x74', [('freq', 1e6), ('channel', 0xff)], request_format='B', encoder=lambda freq: int(1e7 / freq) - 1, docstring=
+    """Set the sampling frequency of the specified channel.
 
         Parameters
         ----------
@@ -117,18 +295,12 @@ class Device(spinel_core.Device):
             the possible frequencies are given by the formula freq = 1e7 / (byte + 1)
             where byte ranges from '\x07' to '\xff'
             Therefore, the specified freq is rounded down to the nearest possible value.
-        """
-        return self.query(INST='\x74', DATA=chr(int(1e7 / freq) - 1), ADR=channel)
-
-
-    def get_sampling_frequency(self, channel):
-        """Return the sampling frequency for the specified channel in Hz as a float
-        """
-        return 1e7 / (ord(str(self.query(INST='\x75', ADR=channel)) + 1))
-
-
-    def set_samples_count(self, count=524287, channel=0xff):
-        """Set the number of samples to record by the specified channel.
+        """)
+Device.register_command('get_sampling_frequency', '\x75', ['channel'], response_format='B', decoder=lambda byte: 1e7 / (byte + 1), docstring=
+    """Return the sampling frequency for the specified channel in Hz as a float
+        """)
+Device.register_command('set_samples_count', '\x76', [('count', 524287), ('channel', 0xff)], request_format='>i', docstring=
+    """Set the number of samples to record by the specified channel.
         The actual number is rounded up to the closest multiple of 8.
 
         Parameters
@@ -136,58 +308,25 @@ class Device(spinel_core.Device):
         count : int
             number of samples to set
             ranges from 0 to 524287 (default)
-        """
-        return self.query(INST='\x76', DATA=struct.pack('>i', count), ADR=channel)
-
-
-    def get_samples_count(self, channel):
-        """Return the number of samples that are recorded by the specified channel.
+        """)
+Device.register_command('get_samples_count', '\x77', ['channel'], response_format='>i', docstring=
+    """Return the number of samples that are recorded by the specified channel.
         Inverse function to :func:`set_samples_count`
-        """
-        return struct.unpack_from('>i', self.query(INST='\x77', ADR=channel))[0]
-
+        """)
+Device.register_command('get_data_block', '\x51', ['offset', 'channel', ('packet_size', 4096)], request_format='>ii', docstring=
+    """Retreive one block of *packet_size* data points starting at data point *offset* from the specified channel.
 
-    def get_data(self, length, channel, packet_size=4096):
-        """Retreive a data sample of the specified length from the specified channel.
-
-        Parameters
-        ----------
-        length : int
-            number of data points in sample
-            should be a multiple of *packet_size*
-        channel : int
-            channel number
-        packet_size : int
-            number of data points to retreive in one packet
-            defaults to 4096 which is the optimum value with regards to the device IO capabilities
-            must not exceed 8192
-            
         Returns
         -------
-        data_array : list of buffers
-            
-        """
-        target = [] #will append to the list
-        packet_size_raw = struct.pack('>i', packet_size) #this needs to be done only once
-        for packet_i in xrange(length / packet_size): #number of packets needed, rounded up to inlude the requested length for sure
-            target.append(self.query(INST='\x51', DATA=struct.pack('>i', packet_i * packet_size) + packet_size_raw, ADR=channel))
-        return target
-
-    
-    def get_data_ready(self, channel):
-        """Return True if data are ready, False otherwise
-        """
-        return bool(ord(str(self.query(INST='\xf5', ADR=channel))))
-
-
-    def set_ready(self, channel=0xff):
-        """Set the specified channel operational.
+        data : buffer
+        """)
+Device.register_command('get_data_ready', '\xf5', ['channel'], response_format='B', decoder=bool, docstring=
+    """Return True if data are ready, False otherwise
+        """)
+Device.register_command('set_ready', '\x78', [('channel', 0xff)], docstring=
+    """Set the specified channel operational.
         This must be done after the channel has recorded some data after trigger to empty the data memory buffer for the next measurement.
-        """
-        return self.query(INST='\x78', ADR=channel)
-
-
-    def get_version(self):
-        """Return a string describing the device and its version
-        """
-        return str(self.query(INST='\xf3', ADR=1))
+        """)
+Device.register_command('get_version', '\xf3', address_argument=None, packet_parameters={'ADR' : 1}, decoder=str, docstring=
+    """Return a string describing the device and its version
+        """)
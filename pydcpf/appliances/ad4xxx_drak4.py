@@ -20,6 +20,22 @@ import struct
 
 from .. import core
 
+
+def _decode_measured_value_state(values):
+    """Group the unpacked (channel number, status, value) triplets of the 4 channels"""
+    channels = []
+    for i in xrange(0, 12, 3):          # for all 4 channels
+        channel_nr, status, value = values[i:i + 3]
+        channels.append([channel_nr,
+                         # [ underflow, overflow, valid] ... [3. bit, 4. bit, 8. bit]
+                         # in docs bits are indexed form 0, so there it is 2.,3.,7.
+                         [bool(status & 8), bool(status & 16), bool(status & 128)],
+                         value,
+                         ]
+                        )
+    return channels
+
+
 class Device(core.Device):
     """Class representing a AD4ETH, AD4RS, AD4USB and Drak 4
     device made by Spinel s.r.o.
@@ -27,36 +43,12 @@ class Device(core.Device):
     The Spinel 97 protocol is used for communication
     """
 
+    idempotent_instructions = frozenset(['\x51', '\x58']) #measured values getters
+
     def __init__(self, address, **kwargs):
         super(Device, self).__init__(address, protocol_module='pydcpf.protocols.spinel97', **kwargs)
 
 
-    def get_inputs_measured_value_state(self, address=0xfe):
-        """Return the values measured and the state of the 4 channels
-
-        Returns
-        -------
-        channel_measured_values : list of [int, [bool,bool,bool], int]
-            list of 4 lists describing each channel:
-                channel_number: int
-                [underflow, overflow, valid]: list of bool
-                value: int
-        """
-        data = self.query(INST='\x51', DATA='\x00', ADR=address) # DATA for future compatibility according to docs
-        channels = []
-        for i in xrange(0, 4):          # for all 4 channels
-            offset = i*4
-            channel_nr, status, value = struct.unpack_from(">cBH", data[offset:offset + 4])
-            channels.append([ord(channel_nr),
-                             # [ underflow, overflow, valid] ... [3. bit, 4. bit, 8. bit]
-                             # in docs bits are indexed form 0, so there it is 2.,3.,7.
-                             [bool(status & 8), bool(status & 16), bool(status & 128)],
-                             value,
-                             ]
-                            )
-        return channels
-
-
     def get_inputs_measured_value(self, address=0xfe, *channels):
         """Return the last measured value by the specified channels
 
@@ -109,8 +101,8 @@ class Device(core.Device):
         output = []
         for (i, channel) in enumerate(channels):
             offset = i*18
-            channel_nr, status, int_value, float_value, str_value = struct.unpack_from(">cBHf10s", data[offset:offset + 18])
-            output.append([ord(channel_nr),
+            channel_nr, status, int_value, float_value, str_value = struct.unpack_from(">BBHf10s", data, offset)
+            output.append([channel_nr,
                              # [ underflow, overflow, valid] ... [3. bit, 4. bit, 8. bit]
                              # in docs bits are indexed form 0, so there it is 2.,3.,7.
                              [bool(status & 8), bool(status & 16), bool(status & 128)],
@@ -118,4 +110,19 @@ class Device(core.Device):
                              ]
                             )
         return output
-    
+
+
+
+Device.register_command('get_inputs_measured_value_state', '\x51', [('address', 0xfe)], response_format='>' + 'BBH' * 4, decoder=_decode_measured_value_state,
+                        address_argument='address', packet_parameters={'DATA' : '\x00'}, # DATA for future compatibility according to docs
+                        docstring=
+    """Return the values measured and the state of the 4 channels
+
+        Returns
+        -------
+        channel_measured_values : list of [int, [bool,bool,bool], int]
+            list of 4 lists describing each channel:
+                channel_number: int
+                [underflow, overflow, valid]: list of bool
+                value: int
+        """)
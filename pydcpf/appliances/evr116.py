@@ -19,6 +19,8 @@ from .. import core
 
 class Device(core.Device):
 
+    idempotent_instructions = frozenset(['p']) #position getter
+
 
     def __init__(self, address, **kwargs):
         """Initialize a device communicating with the EVR116 valve
@@ -27,6 +27,23 @@ _outputs_inputs_count_fmts = {
     }
 
 
+def _decode_inputs_outputs_state(data):
+    """Common code for decoding responses
+    describing inputs or outputs state
+
+    Note
+    ----
+        only for max 32 inputs/outputs
+    """
+    data_len = len(data)
+    fmt = _outputs_inputs_count_fmts[data_len]
+    state = [ bool(int(i)) for i in
+          ("%0" + "%ii" % 8**data_len) % int(bin(struct.unpack_from(fmt, data)[0])[2:]) # crunch down to padded binary string representation
+          ]
+    state.reverse()        # reverse in place as specified in docs
+    return state
+
+
 class Device(core.Device):
     """Class representing a connected Quido module
 
@@ -34,44 +51,13 @@ class Device(core.Device):
     becuse it's more reliable than the Spinel 66 protocol
     """
 
+    idempotent_instructions = frozenset(['\x30', '\x31']) #outputs and inputs state getters
+
 
     def __init__(self, address, **kwargs):
         super(Device, self).__init__(address, protocol_module='pydcpf.protocols.spinel97', **kwargs)
 
 
-    def _decode_inputs_outputs_state(self, data):
-        """Common code for decoding responses
-        describing inputs or outputs state
-
-        Note
-        ----
-            only for max 32 inputs/outputs
-        """
-        data_len = len(data)
-        fmt = _outputs_inputs_count_fmts[data_len]
-        state = [ bool(int(i)) for i in
-              ("%0" + "%ii" % 8**data_len) % int(bin(struct.unpack_from(fmt, data)[0])[2:]) # crunch down to padded binary string representation
-              ]
-        state.reverse()        # reverse in place as specified in docs
-        return state
-
-
-    def get_outputs_state(self, address):
-        """Return the state of all outputs as a list
-        on the device with the specified address
-
-        Returns
-        -------
-        outputs_state : list of bool
-            length depends of number of outputs on device
-            True if active (high voltage)
-            False if inactive (low voltage)
-        """
-        return self._decode_inputs_outputs_state(
-            self.query(INST='\x30', ADR=address)
-            )
-
-        
     def get_output_state(self, output_number, address):
         """Return the state of output given by *output_number*
         on the device with the specified address
@@ -110,8 +96,20 @@ class Device(core.Device):
             )
 
 
-    def get_inputs_state(self, address):
-        """Return the state of all inputs as a list
+
+Device.register_command('get_outputs_state', '\x30', ['address'], decoder=_decode_inputs_outputs_state, address_argument='address', docstring=
+    """Return the state of all outputs as a list
+        on the device with the specified address
+
+        Returns
+        -------
+        outputs_state : list of bool
+            length depends of number of outputs on device
+            True if active (high voltage)
+            False if inactive (low voltage)
+        """)
+Device.register_command('get_inputs_state', '\x31', ['address'], decoder=_decode_inputs_outputs_state, address_argument='address', docstring=
+    """Return the state of all inputs as a list
         on the device with the specified address
 
         Returns
@@ -120,7 +118,4 @@ class Device(core.Device):
             length depends of number of inputs on device
             True if active (high voltage)
             False if inactive (low voltage)
-        """
-        return self._decode_inputs_outputs_state(
-            self.query(INST='\x31', ADR=address)
-            )
+        """)
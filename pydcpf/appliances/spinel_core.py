@@ -32,8 +32,13 @@ class Device(core.Device):
         if address is the special broadcast or universal address,
         the device will not send a response
         """
-        if packet_parameters['ADR'] in [0xff, 0xfe, '%', '$']:
+        if not self._expects_response(packet_parameters):
             self.send_request(send_byte_count, **packet_parameters)
         else:
             return super(Device, self).query(send_byte_count, receive_byte_count, check_parameters, **packet_parameters)
 
+
+    def _expects_response(self, packet_parameters):
+        """The device does not reply to requests for the broadcast or universal address"""
+        return packet_parameters['ADR'] not in [0xff, 0xfe, '%', '$']
+
@@ -16,17 +16,104 @@
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 """This module provides the core class of the package: :class:`Device`"""
 
-from types import ModuleType
+import itertools
+import random
+import struct
+import threading
+import time
+
+from .interfaces import base as interface_base
+from . import registry
+
+
+
+class _NullLock(object):
+    """Stand-in for a lock used when the :class:`Device` is not thread-safe"""
+
+
+    def __enter__(self):
+        pass
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+class DeviceUnavailable(IOError):
+    """Raised while the device is known to be down after reconnecting failed"""
+    pass
+
+
+
+class RoundTripEstimator(object):
+    """Estimates the response timeout from measured round-trip times like the TCP retransmission timeout
+
+    The timeout is the smoothed round-trip time plus 4 times its smoothed mean deviation
+    clipped to the [*floor*, *ceiling*] interval and it is doubled on each timeout.
+
+    Attributes
+    ----------
+    smoothed_rtt : float or None
+        smoothed round-trip time in seconds, None until the first measurement
+    rtt_variance : float or None
+        smoothed mean deviation of the round-trip time in seconds
+    timeout : float
+        current timeout in seconds
+    """
+
+
+    def __init__(self, initial_timeout, floor, ceiling, alpha=0.125, beta=0.25):
+        self.floor = floor
+        self.ceiling = ceiling
+        self.alpha = alpha
+        self.beta = beta
+        self.smoothed_rtt = None
+        self.rtt_variance = None
+        self.timeout = initial_timeout
+
+
+    def update(self, rtt):
+        """Update the estimate with a measured round-trip time *rtt* in seconds"""
+        if self.smoothed_rtt is None:
+            self.smoothed_rtt = rtt
+            self.rtt_variance = rtt / 2.0
+        else:
+            self.rtt_variance += self.beta * (abs(self.smoothed_rtt - rtt) - self.rtt_variance)
+            self.smoothed_rtt += self.alpha * (rtt - self.smoothed_rtt)
+        self.timeout = min(max(self.smoothed_rtt + 4 * self.rtt_variance, self.floor), self.ceiling)
+
+
+    def backoff(self):
+        """Double the timeout after a timeout expired"""
+        self.timeout = min(self.timeout * 2, self.ceiling)
+
 
 
 class Device(object):
     """Core class used for communication with a device
 
     Uses a subclass of :class:`interfaces.base.Interface` class for data transmission and sublcasses of :class:`protocols.base.RequestPacket` and :class:`protocols.base.ResponsePacket` for data encoding and decoding respectively.
+
+    Attributes
+    ----------
+    statistics : dict
+        counters describing the link, e.g. 'discarded_bytes' of garbage dropped from the receive buffer
+    match_element : str or None
+        name of the element which the device copies from the request into its response (the *match_element* of the protocol module, e.g. SIG),
+        unless given by the caller, it is set to a new value for each query and responses with another value are dropped as late responses to earlier requests
+    idempotent_instructions : frozenset
+        instructions (values of the instruction element, see *instruction_timeouts*) whose queries may be safely repeated,
+        subclasses should list their getters here
     """
 
+    idempotent_instructions = frozenset()
 
-    def __init__(self, address, protocol_module, interface_module=None, timeout=1.0, send_byte_count=0, receive_byte_count=8192, connect=True, serve=False, **interface_kwargs):
+
+    def __init__(self, address, protocol_module, interface_module=None, timeout=1.0, send_byte_count=0, receive_byte_count=8192, connect=True, serve=False, thread_safe=False,
+                 adaptive_timeout=False, timeout_floor=0.005, timeout_ceiling=None, instruction_timeouts=None,
+                 reconnect=False, retries=0, idempotent_instructions=None, reconnect_attempts=3, backoff_initial=0.1, backoff_maximum=5.0, breaker_timeout=30.0,
+                 max_buffer_size=1048576, checksum_retries=0, packet_pool_size=0, flush_size=8192, flush_interval=None,
+                 adaptive_receive=False, **interface_kwargs):
         """Initialize the device
 
         Parameters
@@ -34,11 +121,14 @@ class Device(object):
         address : interface dependant
             The address of the physical device used to create the underlying interface
             if the *interface_module* is not specified, pydcpf.interfaces.serial module is used if address is a str or int referencing a serial port (e.g. '/dev/ttyUSB0', '/dev/ttyS0' or a number of the serial/COMM port) or the pydcpf.interfaces.socket module is used if address is a tuple of (str, int) (e.g. ('192.168.1.254', 10001)) for Interface creation.
+            It may be also an URL like 'tcp://192.168.1.254:10001' or 'serial:///dev/ttyUSB0', the scheme then selects the interface module, see :mod:`registry`
         protocol_module : str or module
             From where to load the packet classes, the module must provide a ResponsePacket and RequestPacket class (for many protocols they are the same)
+            a registered name like 'spinel97' or an import path, see :func:`registry.load_protocol`
         interface_module : str or module, optional
-            From where to load the Interface class
+            From where to load the Interface class, a registered URL scheme like 'tcp' or an import path
             If not specified, the module is guessed from the *address* parameter
+            The interface is created when it is first used, e.g. by :meth:`Device.connect`
         timeout : float, optional
             timeout for connecting, reading and writing
             if 0, no timeout is set
@@ -49,43 +139,156 @@ class Device(object):
         receive_byte_count : int or None, optional
             Size of byte chunks to receive at once
             If 0, the bytes will not be split into chunks
+            With *adaptive_receive* only used until the length of the packets is known
         connect : bool, optional
             If True, connect immediately after initialization
         serve : bool, optional
             If True, this device is expected to wait for a connection which may modify the way the device connects
+        thread_safe : bool, optional
+            If True, the device may be shared by several threads
+            request packets are then encoded into a new packet for each call outside of the internal lock
+            and :meth:`Device.query` holds the lock from sending the request until its response is received, so each caller gets its own response
+        adaptive_timeout : bool, optional
+            If True, the round-trip time of queries is measured and the read timeout is set from it (see :class:`RoundTripEstimator`)
+            *timeout* is then used only as the initial value and for connecting
+        timeout_floor : float, optional
+            minimum adaptive read timeout in seconds
+        timeout_ceiling : float, optional
+            maximum adaptive read timeout in seconds, defaults to *timeout*
+        instruction_timeouts : dict, optional
+            fixed read timeouts for slow instructions which are not used for the round-trip estimation
+            keys are values of the instruction element named by the *instruction_element* attribute of the protocol module (e.g. INST)
+        reconnect : bool, optional
+            If True, :meth:`Device.query` reconnects when the interface breaks (raises an :class:`EnvironmentError` other than a timeout)
+            The error is still raised afterwards unless the query is idempotent and can be retried
+        retries : int, optional
+            how many times an idempotent query is retried after a timeout or after reconnecting
+        idempotent_instructions : iterable, optional
+            overrides the :attr:`Device.idempotent_instructions` class attribute
+        reconnect_attempts : int, optional
+            number of connection attempts before giving up and raising :class:`DeviceUnavailable`
+        backoff_initial : float, optional
+            maximum delay in seconds before the second connection attempt, it is doubled for each further attempt
+            the actual delay is random between 0 and this value to spread out reconnecting devices
+        backoff_maximum : float, optional
+            maximum delay in seconds between connection attempts
+        breaker_timeout : float, optional
+            after all connection attempts failed, queries fail immediately with :class:`DeviceUnavailable` for this many seconds,
+            then a single connection attempt is made on the next query
+        max_buffer_size : int, optional
+            maximum size of the receive buffer in bytes, the oldest bytes are discarded when it is exceeded
+            must be larger than the longest packet
+        checksum_retries : int, optional
+            how many times an idempotent query is sent again when its response is corrupted, see :meth:`Device.query`
+        packet_pool_size : int, optional
+            maximum number of response packets kept for reuse, see :meth:`Device.release_packet`
+            if 0, a new packet is created for each response
+        flush_size : int, optional
+            requests sent with flush=False are buffered until their total size reaches this many bytes, see :meth:`Device.send_request`
+        flush_interval : float, optional
+            buffered requests are also flushed by a :meth:`Device.send_request` call this many seconds after the first one was buffered
+            there is no timer, so :meth:`Device.flush` must be called after the last one
+        adaptive_receive : bool, optional
+            If True, each read asks the interface for the bytes still missing from the packet being received,
+            known from its length field (see :meth:`protocols.base.ResponsePacket.missing_bytes`) or estimated from the lengths of the previous packets
+            The 'receive_calls' and 'chunk_sizes' statistics show how many reads a packet takes
         """
+        self.timeout = timeout
+        if adaptive_timeout:
+            if timeout_ceiling is None:
+                timeout_ceiling = timeout
+            self.round_trip = RoundTripEstimator(timeout, timeout_floor, timeout_ceiling)
+        else:
+            self.round_trip = None
+        if instruction_timeouts is None:
+            instruction_timeouts = {}
+        self.instruction_timeouts = instruction_timeouts
+        self._read_timeout = timeout
+        self.reconnect = reconnect
+        self.retries = retries
+        if idempotent_instructions is not None:
+            self.idempotent_instructions = frozenset(idempotent_instructions)
+        self.reconnect_attempts = reconnect_attempts
+        self.backoff_initial = backoff_initial
+        self.backoff_maximum = backoff_maximum
+        self.breaker_timeout = breaker_timeout
+        self._breaker_open_until = None #None if the device is not known to be down
+        self.max_buffer_size = max_buffer_size
+        self.checksum_retries = checksum_retries
+        self.statistics = {
+            'discarded_bytes' : 0, #garbage bytes dropped from the receive buffer
+            'resyncs' : 0, #number of times garbage was dropped
+            'packets' : 0, #received packets
+            'corrupted_packets' : 0, #received packets failing the check with one of corruption_errors
+            'stale_packets' : 0, #late responses to earlier requests dropped by a query
+            'retransmissions' : 0, #requests sent again because of a corrupted response
+            'receive_calls' : 0, #calls of the receive_data method of the interface
+            'received_bytes' : 0,
+            'chunk_sizes' : {}, #number of received chunks by their size rounded up to a power of 2
+            }
+        self.adaptive_receive = adaptive_receive
+        self._packet_length_estimate = None #moving average of the received packet lengths
         self.data_buffer = bytearray()
+        self.packet_pool_size = packet_pool_size
+        self._packet_pool = []
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._send_queue = [] #raw packets of buffered requests
+        self._send_queue_size = 0
+        self._send_queue_since = None #time when the first buffered request was queued
+        self.thread_safe = thread_safe
+        if thread_safe:
+            self._lock = threading.RLock()
+        else:
+            self._lock = _NullLock()
         self.serve = serve
+        scheme, address = registry.parse_address(address)
         self.address = address
         self.send_byte_count = send_byte_count
         self.receive_byte_count = receive_byte_count
-        if not isinstance(protocol_module, ModuleType):
-            protocol_module = __import__(protocol_module, fromlist=[''])
+        protocol_module = registry.load_protocol(protocol_module)
         self.protocol = protocol_module
+        self.instruction_element = getattr(protocol_module, 'instruction_element', 'INST')
+        self.corruption_errors = getattr(protocol_module, 'corruption_errors', ())
+        self.match_element = getattr(protocol_module, 'match_element', None)
+        self._match_values = itertools.count() #next() is atomic, so no lock is needed
         self._request_buffer_packet = protocol_module.RequestPacket()
-        if not isinstance(interface_module, ModuleType):
-            if interface_module is None:
-                if isinstance(address, (int, str)): #seems to be a serial device
-                    interface_module = 'pydcpf.interfaces.serial_interface'
-                elif isinstance(address, tuple) and len(address) == 2 and isinstance(address[0], str) and isinstance(address[1], int): #appears to be a socket address
-                    interface_module = 'pydcpf.interfaces.socket_interface'
-            interface_module = __import__(interface_module, fromlist=[''])
-        self.interface = interface_module.Interface(timeout, **interface_kwargs)
+        if interface_module is None:
+            interface_module = scheme
+        self._interface_module = interface_module
+        self._interface_kwargs = interface_kwargs
+        self._interface = None #created on first use
         if connect:
             self.connect()
             
         
+    @property
+    def interface(self):
+        """The :class:`interfaces.base.Interface` instance, created on first access"""
+        interface = self._interface
+        if interface is None:
+            interface_module = registry.load_interface(self._interface_module)
+            interface = self._interface = interface_module.Interface(self.timeout, **self._interface_kwargs)
+        return interface
+
+
+    @interface.setter
+    def interface(self, interface):
+        self._interface = interface
+
+
     def connect(self, address=None, serve=None):
         """Connect to the device, optionally override and set the Device.address ad Device.serve attributes (same form and meaning as in :meth:`Device.__init__`)"""
         if address is None:
             address = self.address
         else:
-            self.address = address
+            self.address = address = registry.parse_address(address)[1]
         if serve is None:
             serve = self.serve
         else:
             self.serve = serve
         self.interface.connect(address, serve)
+        self._read_timeout = self.timeout
 
 
     def disconnect(self):
@@ -96,6 +299,8 @@ class Device(object):
     def send_request_packet(self, packet, send_byte_count=None):
         """Send a request packet, optionally send *send_byte_count* size byte chunks at once
 
+        Buffered requests are flushed first
+
         Parameters
         ----------
         packet : RequestPacket
@@ -105,26 +310,81 @@ class Device(object):
         """
         if send_byte_count is None:
             send_byte_count = self.send_byte_count
-        raw_packet = packet.raw_packet
-        if send_byte_count == 0: #do not split the packet TODO possibly to loose checking, what about None or negative values?
+        with self._lock:
+            if self._send_queue:
+                self.flush()
+            self._send_raw_packet(packet.raw_packet, send_byte_count)
+
+
+    def _send_raw_packet(self, raw_packet, send_byte_count):
+        if send_byte_count == 0 or self.interface.datagram: #do not split the packet TODO possibly to loose checking, what about None or negative values?
             self.interface.send_data(raw_packet)
         else: #may split
+            view = memoryview(raw_packet) #slices without copying, which sockets and pyserial (tobytes) take directly
             for delimiter in xrange(0, len(raw_packet), send_byte_count):
-                self.interface.send_data(raw_packet[delimiter:delimiter + send_byte_count])
+                self.interface.send_data(view[delimiter:delimiter + send_byte_count])
+
 
-                
-    def send_request(self, send_byte_count=None, **packet_parameters):
+    def send_request(self, send_byte_count=None, flush=True, **packet_parameters):
         """Send a request, optionally send *send_byte_count* size byte chunks at once
 
         Parameters
         ----------
         send_byte_count : int, optional
             if specified, this will override the Device.send_byte_count attribute specified during initialization
+        flush : bool, optional
+            If False, the request is only buffered and sent together with the other buffered requests in one call by :meth:`Device.flush`,
+            which is called automatically when the buffered requests reach *flush_size* bytes or are older than *flush_interval*
+            (see :meth:`Device.__init__`), before receiving and before sending a request with flush=True
         **packet_parameters
             keyword arguments containing parameters for packet creation
         """
-        self._request_buffer_packet.__init__(**packet_parameters)
-        self.send_request_packet(self._request_buffer_packet, send_byte_count)
+        packet = self._make_request_packet(packet_parameters)
+        if flush:
+            self.send_request_packet(packet, send_byte_count)
+            return
+        with self._lock:
+            if not self._send_queue:
+                self._send_queue_since = time.time()
+            self._send_queue.append(packet.raw_packet) #packet.__init__ creates a new raw_packet, so the shared packet may be reused
+            self._send_queue_size += len(packet.raw_packet)
+            if self._send_queue_size >= self.flush_size or (self.flush_interval is not None and time.time() - self._send_queue_since >= self.flush_interval):
+                self.flush()
+
+
+    def _take_send_queue(self):
+        """Return the buffered raw packets and empty the buffer"""
+        send_queue = self._send_queue
+        self._send_queue = []
+        self._send_queue_size = 0
+        self._send_queue_since = None
+        return send_queue
+
+
+    def flush(self):
+        """Send all buffered requests, in one call of the interface if the requests are not split into chunks"""
+        with self._lock:
+            if not self._send_queue:
+                return
+            send_queue = self._take_send_queue()
+            if self.send_byte_count == 0:
+                self.interface.send_data_many(send_queue) #datagram interfaces still send each packet separately
+            else:
+                for raw_packet in send_queue:
+                    self._send_raw_packet(raw_packet, self.send_byte_count)
+
+
+    def _make_request_packet(self, packet_parameters):
+        """Encode a request packet from the *packet_parameters* dict
+
+        The shared request buffer packet is reused unless the device is thread-safe,
+        then a new packet is created so that the encoding can be done outside of the lock
+        """
+        if self.thread_safe:
+            return self.protocol.RequestPacket(**packet_parameters)
+        packet = self._request_buffer_packet
+        packet.__init__(**packet_parameters)
+        return packet
             
 
 
@@ -144,8 +404,10 @@ class Device(object):
             the data contained within the received packet DATA attribute
         """
         packet = self.receive_response_packet(receive_byte_count)
-        packet.check(**check_parameters)
-        return packet.DATA
+        self._check(packet, check_parameters)
+        data = packet.DATA
+        self.release_packet(packet)
+        return data
 
 
     def receive_response_packet(self, receive_byte_count=None, packet=None):
@@ -161,34 +423,478 @@ class Device(object):
         Returns
         -------
         packet : ResponsePacket
-            Packet created from the protocol module (specified during initialization) or the one passed to this method
+            Packet created from the protocol module (specified during initialization) or taken from the packet pool
+            or the one passed to this method
         """
         if packet is None:
-            packet = self.protocol.ResponsePacket()
+            try:
+                packet = self._packet_pool.pop()
+            except IndexError:
+                packet = self.protocol.ResponsePacket()
         if receive_byte_count is None:
             receive_byte_count = self.receive_byte_count
-        packet.raw_packet = self.data_buffer
-        while not packet.find():
-            packet.raw_packet.extend(self.interface.receive_data(receive_byte_count))
-        self.data_buffer = packet.raw_packet[packet.start + packet.length:]
+        with self._lock:
+            if self._send_queue: #the response may be to a buffered request
+                self.flush()
+            if self.interface.datagram: #already framed
+                packet.raw_packet = bytearray(self._receive_data(receive_byte_count))
+                packet.start, packet.length = 0, len(packet.raw_packet)
+                self.statistics['packets'] += 1
+                return packet
+            packet.raw_packet = raw_packet = self.data_buffer
+            packet.start = 0
+            while not packet.find():
+                garbage_count = packet.start
+                if garbage_count > 0: #resynchronize at the first position where a packet may begin
+                    del raw_packet[:garbage_count]
+                    self._discard(garbage_count)
+                    packet.start = 0
+                if self.adaptive_receive:
+                    raw_packet.extend(self._receive_data(self._missing_bytes(packet, receive_byte_count)))
+                else:
+                    raw_packet.extend(self._receive_data(receive_byte_count))
+                garbage_count = len(raw_packet) - self.max_buffer_size
+                if garbage_count > 0:
+                    del raw_packet[:garbage_count]
+                    self._discard(garbage_count)
+            if packet.start > 0: #garbage before the packet
+                self._discard(packet.start)
+            self.data_buffer = raw_packet[packet.start + packet.length:]
+            self.statistics['packets'] += 1
+            if self.adaptive_receive:
+                estimate = self._packet_length_estimate
+                if estimate is None:
+                    self._packet_length_estimate = float(packet.length)
+                else:
+                    self._packet_length_estimate = estimate + (packet.length - estimate) / 8.0
         return packet
 
+
+    def _receive_data(self, byte_count):
+        """Receive data from the interface and count the call in the statistics"""
+        data = self.interface.receive_data(byte_count)
+        statistics = self.statistics
+        statistics['receive_calls'] += 1
+        size = len(data)
+        statistics['received_bytes'] += size
+        size_class = 1 << (size - 1).bit_length() if size > 0 else 0
+        chunk_sizes = statistics['chunk_sizes']
+        chunk_sizes[size_class] = chunk_sizes.get(size_class, 0) + 1
+        return data
+
+
+    def _missing_bytes(self, packet, receive_byte_count):
+        """Return the number of bytes to receive to complete the *packet* after its find failed
+
+        *receive_byte_count* is used if the packet length is unknown and cannot be estimated,
+        or if the packet is already longer than the estimate
+        """
+        missing_bytes = getattr(packet, 'missing_bytes', None) #packets not derived from base.ResponsePacket lack it
+        missing = missing_bytes() if missing_bytes is not None else None
+        if missing is None:
+            estimate = self._packet_length_estimate
+            if estimate is None:
+                return receive_byte_count
+            missing = int(estimate + 0.5) - (len(packet.raw_packet) - packet.start) #the packet may begin at start
+            if missing <= 0: #longer than usual, single bytes would take a read each
+                return receive_byte_count
+        return min(missing, self.max_buffer_size)
+
+
+    def receive_calls_per_packet(self):
+        """Return the average number of reads from the interface per received packet"""
+        statistics = self.statistics
+        if statistics['packets'] == 0:
+            return 0.0
+        return statistics['receive_calls'] / float(statistics['packets'])
+
+
+    def release_packet(self, packet):
+        """Return a response *packet* no longer used by the caller to the packet pool
+
+        The packet object is then reused for one of the following responses, so it must not be accessed anymore.
+        Its DATA and other buffers remain valid, as each response is received into a new raw_packet.
+        Does nothing if the pool is full or disabled (*packet_pool_size* is 0).
+        """
+        pool = self._packet_pool
+        if len(pool) < self.packet_pool_size:
+            pool.append(packet)
+
+
+    def _discard(self, byte_count):
+        """Count *byte_count* bytes discarded from the receive buffer"""
+        statistics = self.statistics
+        statistics['discarded_bytes'] += byte_count
+        statistics['resyncs'] += 1
+
     
     def query(self, send_byte_count=None, receive_byte_count=None, check_parameters=dict(), **packet_parameters):
-        """Query the device
+        """Query the device and return the DATA of the response
 
         Essentially just a wraper around :method:`Device.send_request` and
-        :method:`Device.receive_response`
-        
+        :method:`Device.receive_response`, see :meth:`Device.query_packet` for details
+        """
+        packet = self.query_packet(send_byte_count, receive_byte_count, check_parameters, **packet_parameters)
+        data = packet.DATA
+        self.release_packet(packet)
+        return data
+
+
+    def query_packet(self, send_byte_count=None, receive_byte_count=None, check_parameters=dict(), **packet_parameters):
+        """Query the device and return the checked response packet
+
+        The elements of the packet may then be read without copies, e.g. with :meth:`ResponsePacket.element_int` or the DATA_view property.
+        The packet may be returned to the packet pool with :meth:`Device.release_packet` when it is no longer needed.
+
+        If the device is thread-safe, the lock is held only while sending the request and receiving the response,
+        the encoding and checking of the packets is done outside of it
+
+        If the response is corrupted (the check raises one of the *corruption_errors* of the protocol module)
+        and the query is idempotent, the request is sent again up to :attr:`Device.checksum_retries` times.
+        The receive buffer continues after the corrupted packet, so only the one packet is requested again.
+        """
+        self._set_match_value(packet_parameters)
+        request_packet = self._make_request_packet(packet_parameters)
+        retransmissions = 0
+        while True:
+            with self._lock:
+                packet = self._transact(request_packet, packet_parameters, send_byte_count, receive_byte_count)
+            try:
+                self._check(packet, check_parameters)
+            except self.corruption_errors:
+                if retransmissions >= self.checksum_retries or not self._is_idempotent(packet_parameters):
+                    raise
+                retransmissions += 1
+                self.statistics['retransmissions'] += 1
+                continue
+            return packet
+
+
+    def query_many(self, requests, send_byte_count=None, receive_byte_count=None, check_parameters=dict()):
+        """Send all requests first and then receive their responses, return the checked response packets
+
+        Pipelining saves one round-trip time per request compared to calling :meth:`Device.query_packet` repeatedly.
+        The requests are not retried or reconnected, the first error is raised after all responses were received or timed out.
+
+        Parameters
+        ----------
+        requests : list of dict
+            packet parameters of each request
+
+        Returns
+        -------
+        packets : list of ResponsePacket or None
+            response for each request, None for requests with no response expected (see :meth:`Device._expects_response`)
+        """
+        for packet_parameters in requests:
+            self._set_match_value(packet_parameters)
+        request_packets = [self.protocol.RequestPacket(**packet_parameters) for packet_parameters in requests]
+        packets = []
+        if send_byte_count is None:
+            send_byte_count = self.send_byte_count
+        with self._lock:
+            if send_byte_count == 0 and not self.interface.datagram: #all packets at once, after the buffered ones
+                self.interface.send_data_many(self._take_send_queue() + [request_packet.raw_packet for request_packet in request_packets])
+            else:
+                for request_packet in request_packets:
+                    self.send_request_packet(request_packet, send_byte_count)
+            for packet_parameters in requests:
+                if self._expects_response(packet_parameters):
+                    packets.append(self._receive_matching(packet_parameters, receive_byte_count))
+                else:
+                    packets.append(None)
+        for packet in packets:
+            if packet is not None:
+                self._check(packet, check_parameters)
+        return packets
+
+
+    def _set_match_value(self, packet_parameters):
+        """Set the match element in *packet_parameters* to a new value unless the caller set it"""
+        match_element = self.match_element
+        if match_element is not None and match_element not in packet_parameters:
+            packet_parameters[match_element] = next(self._match_values) % 256
+
+
+    def _receive_matching(self, packet_parameters, receive_byte_count):
+        """Receive the response packet to the request created from *packet_parameters*, drop late responses to earlier requests"""
+        match_element = self.match_element
+        while True:
+            packet = self.receive_response_packet(receive_byte_count)
+            if match_element is None or getattr(packet, match_element) == packet_parameters[match_element]:
+                return packet
+            self.statistics['stale_packets'] += 1
+            self.release_packet(packet)
+
+
+    def _drain(self):
+        """Discard the received data and whatever arrives within the read timeout, e.g. a late response to a timed out request"""
+        self.data_buffer = bytearray()
+        deadline = time.time() + (self._read_timeout or 0)
+        while time.time() < deadline:
+            try:
+                data = self._receive_data(self.receive_byte_count or self.max_buffer_size)
+            except interface_base.Timeout:
+                break
+            self._discard(len(data))
+
+
+    def _expects_response(self, packet_parameters):
+        """Return True if the device replies to the request created from *packet_parameters*"""
+        return True
+
+
+    @classmethod
+    def register_command(cls, name, instruction, arguments=(), request_format=None, response_format=None, encoder=None, decoder=None,
+                         address_argument='channel', address_element='ADR', packet_parameters=None, docstring=None):
+        """Generate the *name* method querying the device with the *instruction* and the *name*_many pipelined variant
+
+        The generated method takes the *arguments*, puts the *address_argument* into the *address_element* of the request
+        and packs the other arguments into DATA with the precompiled *request_format* struct.
+        The DATA of the response is unpacked with the precompiled *response_format* struct and returned,
+        a single value is returned as it is, not as a tuple.
+        The queries are made with :meth:`Device.query`, so overrides of it in subclasses (e.g. handling broadcast addresses) apply.
+        The *name*_many(addresses, ...) method takes a list of addresses instead of the *address_argument*,
+        pipelines the queries with :meth:`Device.query_many` and returns the list of results::
+
+            class Device(core.Device):
+            ...
+            Device.register_command('get_trigger', '\x73', ['channel'], response_format='B', decoder=bool)
+            device.get_trigger(1)
+            device.get_trigger_many([1, 2, 3])
+
+        Parameters
+        ----------
+        name : str
+            name of the method
+        instruction : str
+            value of the instruction element of the protocol (see the *instruction_element* of the protocol module)
+        arguments : list of str or (str, default) tuples, optional
+            arguments of the method in their order
+        request_format : str, optional
+            :mod:`struct` format of DATA of the request, required if there are other arguments than the *address_argument*
+        response_format : str, optional
+            :mod:`struct` format of DATA of the response, if None DATA is returned as it is
+        encoder : function, optional
+            encoder(*arguments) returns the value or tuple of values to pack into DATA of the request
+        decoder : function, optional
+            converts the unpacked value or DATA of the response to the returned value
+        address_argument : str or None, optional
+            name of the argument put into the *address_element*, None if there is none
+        address_element : str, optional
+            name of the request element addressing the device or channel
+        packet_parameters : dict, optional
+            constant elements of the request, e.g. {'ADR' : 1} or {'DATA' : '\x00'}
+        docstring : str, optional
+            documentation of the method
+        """
+        names = [argument if isinstance(argument, str) else argument[0] for argument in arguments]
+        defaults = dict(argument for argument in arguments if not isinstance(argument, str))
+        data_names = [argument_name for argument_name in names if argument_name != address_argument]
+        if data_names and request_format is None:
+            raise ValueError("request_format is required to pack the %s arguments" % ', '.join(data_names))
+        request_struct = struct.Struct(request_format) if request_format is not None else None
+        response_struct = struct.Struct(response_format) if response_format is not None else None
+        constants = dict(packet_parameters or {})
+
+        def bind(method_name, method_names, args, kwargs):
+            """Return a dict of argument values like a function call would"""
+            if len(args) > len(method_names):
+                raise TypeError("%s() takes at most %i arguments (%i given)" % (method_name, len(method_names), len(args)))
+            values = dict(zip(method_names, args))
+            for key, value in kwargs.iteritems():
+                if key not in method_names or key in values:
+                    raise TypeError("%s() got an unexpected or repeated keyword argument '%s'" % (method_name, key))
+                values[key] = value
+            for argument_name in method_names:
+                if argument_name not in values:
+                    try:
+                        values[argument_name] = defaults[argument_name]
+                    except KeyError:
+                        raise TypeError("%s() requires the argument '%s'" % (method_name, argument_name))
+            return values
+
+        def request(self, values):
+            """Return the packet parameters of the request"""
+            request_parameters = dict(constants)
+            request_parameters[self.instruction_element] = instruction
+            if address_argument is not None:
+                request_parameters[address_element] = values[address_argument]
+            if request_struct is not None:
+                encoded = [values[argument_name] for argument_name in data_names]
+                if encoder is not None:
+                    encoded = encoder(*encoded)
+                    if not isinstance(encoded, tuple):
+                        encoded = (encoded,)
+                request_parameters['DATA'] = request_struct.pack(*encoded)
+            return request_parameters
+
+        def result(data):
+            """Return the decoded result from the DATA of the response, None if there is no response"""
+            if data is None:
+                return None
+            value = data
+            if response_struct is not None:
+                value = response_struct.unpack_from(value)
+                if len(value) == 1:
+                    value = value[0]
+            if decoder is not None:
+                value = decoder(value)
+            return value
+
+        def command(self, *args, **kwargs):
+            return result(self.query(**request(self, bind(name, names, args, kwargs))))
+
+        other_names = [argument_name for argument_name in names if argument_name != address_argument]
+        def command_many(self, addresses, *args, **kwargs):
+            values = bind(name + '_many', other_names, args, kwargs)
+            requests = []
+            for address in addresses:
+                values[address_argument] = address
+                requests.append(request(self, values))
+            results = []
+            for packet in self.query_many(requests):
+                if packet is None:
+                    results.append(None)
+                else:
+                    results.append(result(packet.DATA)) #DATA stays valid after the release
+                    self.release_packet(packet)
+            return results
+
+        signature = ', '.join(argument if isinstance(argument, str) else '%s=%r' % argument for argument in arguments)
+        command.__name__ = name
+        command.__doc__ = "%s(%s)\n\n%s" % (name, signature, docstring or '')
+        setattr(cls, name, command)
+        if address_argument is not None:
+            command_many.__name__ = name + '_many'
+            command_many.__doc__ = "%s_many(addresses, ...)\n\nPipelined :meth:`%s` for each of the %s *addresses*, returns a list of results" % (name, name, address_argument)
+            setattr(cls, name + '_many', command_many)
+
+
+    def _check(self, packet, check_parameters):
+        """Check the received *packet* and count corrupted packets"""
+        try:
+            packet.check(**check_parameters)
+        except self.corruption_errors:
+            self.statistics['corrupted_packets'] += 1
+            raise
+
+
+    def packet_error_rate(self):
+        """Return the fraction of received packets that were corrupted"""
+        statistics = self.statistics
+        if statistics['packets'] == 0:
+            return 0.0
+        return statistics['corrupted_packets'] / float(statistics['packets'])
+
+
+    def _is_idempotent(self, packet_parameters):
+        """Return True if the query created from *packet_parameters* may be safely repeated"""
+        try:
+            return packet_parameters.get(self.instruction_element) in self.idempotent_instructions
+        except TypeError: #unhashable instruction
+            return False
+
+
+    def _transact(self, packet, packet_parameters, send_byte_count, receive_byte_count):
+        """Send the request *packet* created from *packet_parameters* and return the response packet
+
+        The lock must be held by the caller. Reconnects and retries the exchange as configured,
+        before retrying after a timeout the late response is drained, so it is not taken for the response to a later request
+        """
+        attempt = 0
+        while True:
+            if self._breaker_open_until is not None:
+                self._reconnect_after_breaker()
+            try:
+                return self._exchange(packet, packet_parameters, send_byte_count, receive_byte_count)
+            except interface_base.Timeout:
+                self.data_buffer = bytearray() #drop the partial response
+                if attempt >= self.retries or not self._is_idempotent(packet_parameters):
+                    raise
+                self._drain()
+            except EnvironmentError:
+                self.data_buffer = bytearray()
+                if not self.reconnect:
+                    raise
+                self._reconnect(self.reconnect_attempts)
+                if attempt >= self.retries or not self._is_idempotent(packet_parameters):
+                    raise
+            attempt += 1
+
+
+    def _reconnect(self, attempts):
+        """Reconnect the interface, make up to *attempts* connection attempts with exponential backoff and jitter
+
+        Raises
+        ------
+        DeviceUnavailable
+            if all attempts failed, the circuit breaker is then open for :attr:`Device.breaker_timeout` seconds
+        """
+        delay = self.backoff_initial
+        for attempt in xrange(attempts):
+            if attempt > 0:
+                time.sleep(random.uniform(0, delay))
+                delay = min(delay * 2, self.backoff_maximum)
+            try:
+                self.disconnect()
+            except EnvironmentError:
+                pass #the interface is probably already broken
+            try:
+                self.connect()
+            except EnvironmentError:
+                continue
+            self._breaker_open_until = None
+            return
+        self._breaker_open_until = time.time() + self.breaker_timeout
+        raise DeviceUnavailable("could not reconnect to %r, giving up for %g s" % (self.address, self.breaker_timeout))
+
+
+    def _reconnect_after_breaker(self):
+        """Fail fast while the circuit breaker is open, otherwise make a single connection attempt"""
+        if time.time() < self._breaker_open_until:
+            raise DeviceUnavailable("device at %r is down" % (self.address,))
+        self._reconnect(1)
+
+
+    def _set_read_timeout(self, timeout):
+        """Set the read timeout of the interface if it changed"""
+        if timeout != self._read_timeout:
+            self.interface.set_timeout(timeout)
+            self._read_timeout = timeout
+
+
+    def _exchange(self, packet, packet_parameters, send_byte_count, receive_byte_count):
+        """Make a single attempt at sending the request *packet* created from *packet_parameters* and receiving the response packet
+
+        The round-trip time is measured here if the timeout is adaptive
         """
-        self.send_request(send_byte_count, **packet_parameters)
-        return self.receive_response(receive_byte_count, **check_parameters)
+        round_trip = self.round_trip
+        if round_trip is None:
+            self.send_request_packet(packet, send_byte_count)
+            return self._receive_matching(packet_parameters, receive_byte_count)
+        try:
+            self._set_read_timeout(self.instruction_timeouts[packet_parameters.get(self.instruction_element)])
+            round_trip = None #slow instructions would skew the estimate
+        except (KeyError, TypeError): #TypeError if the instruction is unhashable
+            self._set_read_timeout(round_trip.timeout)
+        sent = time.time()
+        self.send_request_packet(packet, send_byte_count)
+        try:
+            response = self._receive_matching(packet_parameters, receive_byte_count)
+        except interface_base.Timeout:
+            if round_trip is not None:
+                round_trip.backoff()
+            raise
+        if round_trip is not None:
+            round_trip.update(time.time() - sent)
+        return response
     
 
 
 class Server(object):
     """Serves Devices
 
-    Has the ability to find out protocol they want to use for communication
+    Has the ability to find out protocol they want to use for communication, see :mod:`detect`
     """
     pass
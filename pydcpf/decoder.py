@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""Offline decoder of captured byte streams
+
+The capture file is split into chunks at packet boundaries found by the protocol,
+the chunks are framed, checked and decoded in a pool of processes
+and one row per packet is written to a CSV file or a numpy structured array (.npy file)::
+
+    python -m pydcpf.decoder capture.bin spinel97 -o packets.csv
+
+Each row contains the offset of the packet in the capture, its length, the values of the selected elements,
+the length of DATA and whether the packet passed its check.
+"""
+
+__all__ = ['decode', 'decode_range', 'find_boundaries']
+
+import argparse
+import csv
+import mmap
+import multiprocessing
+import os
+
+from . import registry
+
+
+WINDOW = 65536 #bytes fed to the packet at once, must be larger than the longest packet
+
+
+
+def _check_errors(protocol_module):
+    """Return the exceptions raised by the check of invalid packets of the *protocol_module*"""
+    return getattr(protocol_module, 'check_errors', getattr(protocol_module, 'corruption_errors', ()))
+
+
+def _passes_check(packet, check_errors):
+    """Return False if the check of the *packet* raises one of *check_errors*, other exceptions are not caught"""
+    try:
+        packet.check()
+    except check_errors:
+        return False
+    return True
+
+
+def default_columns(packet_class):
+    """Return the names of the elements of *packet_class* decoded by default, i.e. all but DATA"""
+    return sorted(name for name in packet_class.elements_definitions_dict if name != 'DATA')
+
+
+def _column_value(value):
+    """Convert an element value into a number or a string"""
+    if isinstance(value, (int, long, float)):
+        return value
+    value = str(value)
+    if len(value) == 1: #single byte elements like ADR or ACK
+        return ord(value)
+    return value
+
+
+def _open_capture(path):
+    with open(path, 'rb') as capture:
+        size = os.fstat(capture.fileno()).st_size
+        if size == 0:
+            return '', 0
+        return mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ), size
+
+
+def find_boundaries(path, packet_class, chunk_count, check_errors=()):
+    """Return a sorted list of offsets splitting the capture into at most *chunk_count* chunks at packet starts
+
+    The first offset is 0 and the last one is the capture size.
+    A packet found after a split point is a boundary only if its check does not raise one of *check_errors*
+    and it is followed directly by another packet or the end of the capture,
+    otherwise the search continues after its first byte, as it may lie in the data of another packet.
+    """
+    capture, size = _open_capture(path)
+    boundaries = [0]
+    packet = packet_class()
+    for i in xrange(1, chunk_count):
+        offset = size * i / chunk_count
+        if offset <= boundaries[-1]:
+            continue
+        packet.raw_packet = bytearray(capture[offset:offset + 2 * WINDOW]) #room for the following packet
+        position = 0
+        while packet.find(position):
+            start = packet.start
+            end = start + packet.length
+            if _passes_check(packet, check_errors) and (offset + end == size or (packet.find(end) and packet.start == end)):
+                boundaries.append(offset + start) #garbage before it belongs to the previous chunk
+                break
+            position = start + 1
+    boundaries.append(size)
+    return boundaries
+
+
+def decode_range(path, protocol, kind, columns, start, end):
+    """Decode the packets starting between the *start* and *end* offsets of the capture
+
+    Returns
+    -------
+    rows : list of tuples
+        (offset, length, values of *columns*..., DATA length, check passed) for each packet
+    """
+    protocol_module = registry.load_protocol(protocol)
+    packet_class = getattr(protocol_module, kind)
+    check_errors = _check_errors(protocol_module)
+    capture, size = _open_capture(path)
+    packet = packet_class()
+    packet.raw_packet = raw_packet = bytearray()
+    buffer_offset = start #offset of raw_packet[0] in the capture
+    read_offset = start
+    rows = []
+    while True:
+        packet.start = 0
+        if packet.find():
+            offset = buffer_offset + packet.start
+            if offset >= end:
+                break
+            valid = _passes_check(packet, check_errors)
+            rows.append((offset, packet.length) + tuple(_column_value(getattr(packet, name)) for name in columns)
+                        + (len(packet.DATA), valid))
+            consumed = packet.start + packet.length
+        else:
+            consumed = packet.start #garbage
+            if read_offset >= size or buffer_offset + consumed >= end:
+                break #no more packets can start in this range
+            raw_packet.extend(capture[read_offset:read_offset + WINDOW])
+            read_offset += WINDOW
+        del raw_packet[:consumed]
+        buffer_offset += consumed
+    return rows
+
+
+def _decode_range_star(args):
+    return decode_range(*args)
+
+
+def decode(path, protocol, kind='ResponsePacket', columns=None, processes=None, chunk_size=16 * 2**20):
+    """Decode all packets in the capture file at *path* in a pool of processes
+
+    Parameters
+    ----------
+    path : str
+        capture file
+    protocol : str or module
+        protocol module, its registered name or import path, see :func:`registry.load_protocol`
+    kind : str, optional
+        'ResponsePacket' or 'RequestPacket'
+    columns : list of str, optional
+        element names to decode, by default all but DATA
+    processes : int, optional
+        number of worker processes, by default the number of CPUs
+    chunk_size : int, optional
+        approximate size of the chunks decoded by one worker at once
+
+    Returns
+    -------
+    columns : list of str
+        names of the columns of the rows
+    rows : list of tuples
+        one row for each packet, see :func:`decode_range`
+    """
+    protocol_module = registry.load_protocol(protocol)
+    packet_class = getattr(protocol_module, kind)
+    if columns is None:
+        columns = default_columns(packet_class)
+    if not isinstance(protocol, basestring):
+        protocol = protocol.__name__ #modules cannot be pickled
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    size = os.path.getsize(path)
+    boundaries = find_boundaries(path, packet_class, max(size / chunk_size, processes), _check_errors(protocol_module))
+    tasks = [(path, protocol, kind, columns, start, end) for start, end in zip(boundaries[:-1], boundaries[1:])]
+    if processes == 1 or len(tasks) == 1:
+        results = map(_decode_range_star, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_decode_range_star, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    rows = []
+    for result in results:
+        rows.extend(result)
+    return ['offset', 'length'] + list(columns) + ['DATA_length', 'valid'], rows
+
+
+def to_structured_array(names, rows):
+    """Convert the decoded rows into a numpy structured array, requires numpy"""
+    import numpy
+    formats = []
+    for i, name in enumerate(names):
+        if name == 'valid':
+            formats.append(numpy.bool_)
+        elif all(isinstance(row[i], (int, long)) for row in rows):
+            formats.append(numpy.int64)
+        else:
+            formats.append('S%i' % max([len(str(row[i])) for row in rows] + [1]))
+    return numpy.array(rows, dtype=zip(names, formats))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode packets captured in a file")
+    parser.add_argument('capture', help="capture file")
+    parser.add_argument('protocol', help="protocol module, e.g. spinel97 or pydcpf.protocols.evr116")
+    parser.add_argument('-k', '--kind', choices=['response', 'request'], default='response', help="kind of packets in the capture")
+    parser.add_argument('-c', '--columns', help="comma separated element names to decode")
+    parser.add_argument('-j', '--processes', type=int, help="number of worker processes")
+    parser.add_argument('-o', '--output', help="output file, .npy for a numpy structured array, CSV otherwise (default stdout)")
+    args = parser.parse_args(argv)
+    columns = None if args.columns is None else args.columns.split(',')
+    names, rows = decode(args.capture, args.protocol, args.kind.capitalize() + 'Packet', columns, args.processes)
+    if args.output is not None and args.output.endswith('.npy'):
+        import numpy
+        numpy.save(args.output, to_structured_array(names, rows))
+        return
+    import sys
+    output = sys.stdout if args.output is None else open(args.output, 'wb')
+    try:
+        writer = csv.writer(output)
+        writer.writerow(names)
+        writer.writerows(rows)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
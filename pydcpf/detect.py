@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""Protocol auto-detection by sniffing the incoming byte stream
+
+The same bytes are fed to a candidate of every registered protocol (see :mod:`registry`),
+which frames them with the find method of its packets and checks the found packets.
+A candidate scores for each packet passing the check, less for packets with valid framing
+failing the check for another reason (e.g. an error acknowledgment code)
+and loses score for corrupted packets (the *corruption_errors* of the protocol module) and for discarded garbage.
+The detector commits to the best candidate once it has enough valid packets and leads by a margin,
+or to the best positive one when the byte budget is exhausted::
+
+    detector = detect(interface)
+    if detector.result is not None:
+        device = core.Device(address, detector.result.module, connect=False)
+        device.interface = interface
+        device.data_buffer = detector.result.buffer # bytes of the next packet received so far
+"""
+
+__all__ = ['Detector', 'detect']
+
+import time
+
+from . import registry
+
+
+
+class Candidate(object):
+    """Framing and check statistics of one protocol
+
+    Attributes
+    ----------
+    name : str
+        registered name of the protocol
+    module : module
+        protocol module
+    buffer : bytearray
+        bytes not framed yet
+    packets : int
+        number of framed packets
+    valid : int
+        number of packets which passed the check
+    corrupted : int
+        number of packets failing the check with one of the *corruption_errors* of the protocol
+    discarded_bytes : int
+        number of bytes discarded as garbage
+    """
+
+
+    def __init__(self, name, module, kind='ResponsePacket'):
+        self.name = name
+        self.module = module
+        self.corruption_errors = getattr(module, 'corruption_errors', ())
+        self.packet = getattr(module, kind)()
+        self.packet.raw_packet = self.buffer = bytearray()
+        self.packets = 0
+        self.valid = 0
+        self.corrupted = 0
+        self.discarded_bytes = 0
+
+
+    def feed(self, data):
+        """Frame and check the packets completed by *data*"""
+        buffer, packet = self.buffer, self.packet
+        buffer.extend(data)
+        while True:
+            packet.start = 0
+            try:
+                found = packet.find()
+            except Exception: #not even framing works on this stream
+                found = False
+                packet.start = len(buffer)
+            start = packet.start
+            if not found:
+                if start > 0:
+                    del buffer[:start]
+                    self.discarded_bytes += start
+                return
+            self.discarded_bytes += start
+            self.packets += 1
+            try:
+                packet.check()
+            except self.corruption_errors:
+                self.corrupted += 1
+            except Exception: #framing is valid, but the packet reports an error
+                pass
+            else:
+                self.valid += 1
+            del buffer[:start + packet.length]
+
+
+    @property
+    def score(self):
+        """Valid packets count fully, other framed packets half, corrupted packets and every 16 discarded bytes count negatively"""
+        return self.valid + 0.5 * (self.packets - self.valid - self.corrupted) - self.corrupted - self.discarded_bytes / 16.0
+
+
+
+class Detector(object):
+    """Detects the protocol of a byte stream fed to it
+
+    Attributes
+    ----------
+    candidates : list of :class:`Candidate`
+        candidate for each protocol
+    result : :class:`Candidate` or None
+        the detected protocol, None if not detected (yet)
+    finished : bool
+        True if the detection finished, with or without a result
+    bytes_consumed : int
+        number of bytes fed to the detector
+    elapsed : float or None
+        seconds from the first fed bytes until the detection finished
+    """
+
+
+    def __init__(self, protocols=None, kind='ResponsePacket', byte_budget=4096, min_packets=3, margin=2.0):
+        """Initialize the detector
+
+        Parameters
+        ----------
+        protocols : list of str or modules, optional
+            protocols to consider, by default all registered protocols
+        kind : str, optional
+            'ResponsePacket' to detect the protocol of a device, 'RequestPacket' for a client
+        byte_budget : int, optional
+            the detection finishes after this many bytes at the latest (up to the end of the chunk crossing it)
+        min_packets : int, optional
+            number of valid packets needed to commit to a protocol before the budget is exhausted
+        margin : float, optional
+            score lead over the second best protocol needed to commit to a protocol before the budget is exhausted
+        """
+        if protocols is None:
+            protocols = sorted(registry.protocols)
+        self.candidates = []
+        for protocol in protocols:
+            module = registry.load_protocol(protocol)
+            name = protocol if isinstance(protocol, str) else module.__name__
+            self.candidates.append(Candidate(name, module, kind))
+        self.byte_budget = byte_budget
+        self.min_packets = min_packets
+        self.margin = margin
+        self.result = None
+        self.finished = False
+        self.bytes_consumed = 0
+        self.elapsed = None
+        self._started = None
+
+
+    def ranking(self):
+        """Return the candidates sorted from the best score"""
+        return sorted(self.candidates, key=lambda candidate: candidate.score, reverse=True)
+
+
+    def feed(self, data):
+        """Feed *data* to all candidates and return True if the detection finished"""
+        if self.finished:
+            return True
+        if self._started is None:
+            self._started = time.time()
+        self.bytes_consumed += len(data)
+        for candidate in self.candidates:
+            candidate.feed(data)
+        ranking = self.ranking()
+        best = ranking[0]
+        runner_up_score = ranking[1].score if len(ranking) > 1 else 0.0
+        if best.valid >= self.min_packets and best.score - runner_up_score >= self.margin:
+            self._finish(best)
+        elif self.bytes_consumed >= self.byte_budget:
+            if best.score > 0 and best.score > runner_up_score:
+                self._finish(best)
+            else:
+                self._finish(None)
+        return self.finished
+
+
+    def _finish(self, result):
+        self.result = result
+        self.finished = True
+        self.elapsed = time.time() - self._started
+
+
+
+def detect(interface, receive_byte_count=256, **detector_kwargs):
+    """Receive data from the connected *interface* until the protocol is detected or the byte budget is exhausted
+
+    Parameters
+    ----------
+    interface : :class:`interfaces.base.Interface`
+        connected interface
+    receive_byte_count : int, optional
+        size of byte chunks to receive at once
+    **detector_kwargs
+        passed to :class:`Detector`
+
+    Returns
+    -------
+    detector : :class:`Detector`
+        finished detector with the result, the consumed bytes count and the elapsed time
+    """
+    detector = Detector(**detector_kwargs)
+    while not detector.feed(interface.receive_data(receive_byte_count)):
+        pass
+    return detector
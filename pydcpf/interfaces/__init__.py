@@ -16,6 +16,6 @@
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 """This package provides the base :class:`base.Interface` class and several other Interface classes in submodules
 """
-from base import Interface
+from base import Interface, Timeout, ConnectionLost
 import base
 __all__ = base.__all__
@@ -16,12 +16,32 @@
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 """This module provides the base :class:`Interface` class for documentation purposes."""
 
-__all__ = ['Interface']
+__all__ = ['Interface', 'Timeout', 'ConnectionLost']
+
+
+
+class Timeout(IOError):
+    """Raised by :meth:`Interface.receive_data` when no data was received before the timeout"""
+    pass
+
+
+
+class ConnectionLost(IOError):
+    """Raised by :meth:`Interface.receive_data` when the other side closed the connection"""
+    pass
 
 
 class Interface(object):
-    """Base class for device data transmission"""
+    """Base class for device data transmission
+
+    Attributes
+    ----------
+    datagram : bool
+        True if :meth:`Interface.receive_data` returns exactly one whole packet (e.g. a UDP datagram),
+        so the received data need not be searched for packets and requests must be sent whole
+    """
 
+    datagram = False
     
     def __init__(self, timeout, **kwargs):
         """Initialize the interface using the keyword arguments (implementation dependent).
@@ -33,6 +53,17 @@ class Interface(object):
         pass
 
 
+    def set_timeout(self, timeout):
+        """Set the timeout in seconds for the following reads
+
+        Parameters
+        ----------
+        timeout : float
+            new timeout, same meaning as in :meth:`Interface.__init__`
+        """
+        pass
+
+
     def connect(self, address, serve):
         """Connect the interface to the address specified, possibly in a special way if serving.
         
@@ -63,7 +94,7 @@ class Interface(object):
 
         Parameters
         ----------
-        data : str or bytearray or bytes
+        data : str or bytearray or bytes or memoryview
             data to be sent
 
         Note
@@ -71,6 +102,22 @@ class Interface(object):
         This method is expected to send *ALL* data, so it may have to check whether all data was sent
         """
         pass
+
+
+    def send_data_many(self, chunks):
+        """Send several chunks of data (e.g. packets) in their order, with fewer system calls if possible
+
+        Parameters
+        ----------
+        chunks : list of str or bytearray or memoryview
+            data to be sent
+
+        Note
+        ----
+        The default implementation calls :meth:`Interface.send_data` for each chunk
+        """
+        for chunk in chunks:
+            self.send_data(chunk)
     
 
     def receive_data(self, byte_count):
@@ -85,6 +132,13 @@ class Interface(object):
         ------
         data : str or bytearray, or bytes
             received data
+
+        Raises
+        ------
+        Timeout
+            if no data was received before the timeout (or a subclass of it)
+        ConnectionLost
+            if the connection was closed by the other side
         """
         pass
     
@@ -15,38 +15,182 @@
 #You should have received a copy of the GNU General Public License
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 from . import base
+import array
+import io
+import os
+import select
 import serial
+import time
+
+
+POLL_INTERVAL = 0.001 #seconds between checks for received data on ports which cannot be selected
+ASYNC_LOW_LATENCY = 0x2000 #flag of the Linux serial_struct
+_FLAGS_INDEX = 4 #index of the flags int in the serial_struct read as an array of ints
 
 
 
 class Interface(base.Interface, serial.Serial):
     """Extended class of :class:`serial.Serial`.
 
-    It only translates some of the method names and takes care of connecting on demand
+    It translates some of the method names and takes care of connecting on demand.
+    It can also pace the writes according to the wire time of the serial line
+    and derive the read timeouts from the expected response length instead of using a fixed timeout.
+    Reads return the bytes already received instead of waiting for the requested count.
     """
 
 
-    def __init__(self, timeout, **kwargs):
+    def __init__(self, timeout, response_latency=None, response_length=None, write_chunk_size=0, low_latency=False, inter_byte_characters=None, **kwargs):
+        """Initialize the interface, but do not open the port
+
+        Parameters
+        ----------
+        timeout : float
+            timeout for reading and writing in seconds
+        response_latency : float, optional
+            time in seconds the device needs to start replying after receiving a request
+            defaults to *timeout*
+        response_length : int, optional
+            maximum expected length of a response in bytes
+            If specified, the read timeout is the wire time of the request still being transmitted and of *response_length* bytes plus *response_latency*
+            If not specified, the fixed *timeout* is used
+        write_chunk_size : int, optional
+            If not 0, data is written in chunks of this size and each chunk is written only after the previous one was transmitted on the wire,
+            so slow converters with small buffers are not overrun
+        low_latency : bool, optional
+            If True, the Linux ASYNC_LOW_LATENCY flag is set on connecting, so USB-serial adapters pass on received bytes immediately
+            instead of after their latency timer (typically 16 ms)
+        inter_byte_characters : float, optional
+            If specified, the inter-byte timeout is set to the time of this many characters on connecting
+            and a read blocks until a gap of that length in the received data instead of returning after the first byte
+        **kwargs
+            passed on to :class:`serial.Serial`, e.g. baudrate, bytesize, parity, stopbits
+        """
+        if response_latency is None:
+            response_latency = timeout
+        self.response_latency = response_latency
+        self.response_length = response_length
+        self.write_chunk_size = write_chunk_size
+        self.low_latency = low_latency
+        self.inter_byte_characters = inter_byte_characters
+        self._transmission_end = 0.0 #estimated time when all written data will have been transmitted
         kwargs["timeout"] = timeout
         try:
             del kwargs["port"] #make sure the interface does not connect immediately
         except KeyError:
             pass                          #if port was not set, no problem
-        super(Interface, self).__init__(**kwargs)
+        serial.Serial.__init__(self, **kwargs) #base.Interface.__init__ does not chain to it
     
         
     def connect(self, address, serve):
         self.setPort(address)
         self.open()
+        if self.inter_byte_characters is not None:
+            self.interCharTimeout = self.inter_byte_characters * self.character_time()
+        if self.low_latency:
+            self.set_low_latency(True)
+
+
+    def set_low_latency(self, enable):
+        """Set or clear the ASYNC_LOW_LATENCY flag of the open port, works only on Linux
+
+        Raises
+        ------
+        IOError
+            if the driver does not support it
+        """
+        import fcntl #only on Unix
+        import termios
+        serial_struct = array.array('i', [0] * 32) #larger than struct serial_struct
+        fcntl.ioctl(self.fileno(), termios.TIOCGSERIAL, serial_struct)
+        if enable:
+            serial_struct[_FLAGS_INDEX] |= ASYNC_LOW_LATENCY
+        else:
+            serial_struct[_FLAGS_INDEX] &= ~ASYNC_LOW_LATENCY
+        fcntl.ioctl(self.fileno(), termios.TIOCSSERIAL, serial_struct)
 
         
     def disconnect(self, address, serve):
         self.close()
 
         
+    def character_time(self):
+        """Return the time in seconds needed to transmit one character with the current line settings"""
+        bits = 1 + self.bytesize + self.stopbits #including the start bit
+        if self.parity != serial.PARITY_NONE:
+            bits += 1
+        return bits / float(self.baudrate)
+
+
+    def wire_time(self, byte_count):
+        """Return the time in seconds needed to transmit *byte_count* bytes"""
+        return byte_count * self.character_time()
+
+
+    def _schedule_transmission(self, byte_count):
+        """Update the estimated time when all written data will have been transmitted"""
+        self._transmission_end = max(self._transmission_end, time.time()) + self.wire_time(byte_count)
+
+        
+    def set_timeout(self, timeout):
+        """Set the fixed read timeout, or the *response_latency* if *response_length* was specified"""
+        if self.response_length is None:
+            self.timeout = timeout
+        else:
+            self.response_latency = timeout
+
+        
     def send_data(self, data):
-        self.write(data)
+        chunk_size = self.write_chunk_size
+        if chunk_size == 0:
+            self.write(data)
+            self._schedule_transmission(len(data))
+            return
+        for start in xrange(0, len(data), chunk_size):
+            delay = self._transmission_end - time.time()
+            if delay > 0: #previous chunk is still on the wire
+                time.sleep(delay)
+            chunk = data[start:start + chunk_size]
+            self.write(chunk)
+            self._schedule_transmission(len(chunk))
         
 
+    def _read_timeout(self, byte_count):
+        """Return the time in seconds to wait for the first byte of a read of *byte_count* bytes, None to wait forever"""
+        if self.response_length is None:
+            return self.timeout or None
+        return max(self._transmission_end - time.time(), 0) + self.wire_time(min(byte_count, self.response_length)) + self.response_latency
+
+
+    def _wait_readable(self, timeout):
+        """Wait until received data is waiting, return False if none arrived within *timeout* seconds (None waits forever)
+
+        The port settings are not changed, as changing the timeout of the port reconfigures it
+        """
+        if os.name == 'posix':
+            try:
+                fileno = self.fileno()
+            except (AttributeError, io.UnsupportedOperation, ValueError): #port classes without a selectable descriptor
+                pass
+            else:
+                return bool(select.select([fileno], [], [], timeout)[0])
+        deadline = None if timeout is None else time.time() + timeout
+        while not self.inWaiting():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+
     def receive_data(self, byte_count):
-        return self.read(byte_count)
+        waiting = self.inWaiting()
+        if waiting == 0: #wait only for the first byte, then take what arrived meanwhile
+            timeout = self._read_timeout(byte_count)
+            if not self._wait_readable(timeout):
+                raise base.Timeout("no data received within %g s" % timeout)
+            waiting = max(self.inWaiting(), 1)
+        data = self.read(min(waiting, byte_count))
+        gap = self.interCharTimeout
+        if gap is not None: #continue until a gap in the data, pyserial 2 read does not end on the inter-byte timeout itself
+            while len(data) < byte_count and self._wait_readable(gap):
+                data += self.read(min(max(self.inWaiting(), 1), byte_count - len(data)))
+        return data
@@ -18,21 +18,76 @@ from . import base
 import socket
 
 
+IOV_MAX = 1024 #maximum number of chunks in one sendmsg call on common platforms
+_INET_FAMILIES = (socket.AF_INET, getattr(socket, 'AF_INET6', socket.AF_INET))
+
+
+
+class Timeout(base.Timeout, socket.timeout):
+    """Timeout error which is both a :class:`base.Timeout` and a :class:`socket.timeout`"""
+    pass
+
+
+
 class Interface(base.Interface):
     """Wrapper class around :class:`socket.socket`.
 
     Wrapping it is necessary because after disconnecting a new socket must be created when connecting again a nad also when serving
 
-    Raises :class:`socket.timeout` error on timeout"""
+    Raises :class:`Timeout` error (a subclass of :class:`socket.timeout`) on timeout"""
 
 
     def _create_socket(self):
         self.socket = socket.socket(*self._socket_parameters)
         self.socket.settimeout(self._timeout)
+        self._configure_socket(self.socket)
+
+
+    def _configure_socket(self, sock):
+        """Set the socket options given on initialization, TCP options only for TCP sockets"""
+        if self.receive_buffer_size is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer_size)
+        if self.send_buffer_size is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_size)
+        family, type = self._socket_parameters[:2]
+        if type != socket.SOCK_STREAM or family not in _INET_FAMILIES:
+            return
+        if self.nodelay is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.nodelay))
+        keepalive = self.keepalive
+        if keepalive is None:
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(bool(keepalive)))
+        if isinstance(keepalive, tuple):
+            for option_name, value in zip(('TCP_KEEPIDLE', 'TCP_KEEPINTVL', 'TCP_KEEPCNT'), keepalive):
+                option = getattr(socket, option_name, None)
+                if option is not None: #not available on all platforms
+                    sock.setsockopt(socket.IPPROTO_TCP, option, int(value))
     
-    def __init__(self, timeout, family=socket.AF_INET, type=socket.SOCK_STREAM, protocol=0, _sock=None):
+    def __init__(self, timeout, family=socket.AF_INET, type=socket.SOCK_STREAM, protocol=0, _sock=None,
+                 nodelay=True, receive_buffer_size=None, send_buffer_size=None, keepalive=None):
+        """Initialize the interface
+
+        Parameters
+        ----------
+        timeout : float
+            timeout in seconds
+        family, type, protocol, _sock
+            passed to :class:`socket.socket`
+        nodelay : bool or None, optional
+            TCP_NODELAY, by default True so that small requests are not delayed by the Nagle algorithm, None leaves the system default
+        receive_buffer_size, send_buffer_size : int, optional
+            SO_RCVBUF and SO_SNDBUF sizes in bytes, None leaves the system defaults
+        keepalive : bool or tuple, optional
+            SO_KEEPALIVE, a (idle, interval, count) tuple also sets TCP_KEEPIDLE, TCP_KEEPINTVL and TCP_KEEPCNT where available,
+            None leaves the system default
+        """
         self._socket_parameters = (family, type, protocol, _sock) # needed in disconnecting
         self._timeout = timeout
+        self.nodelay = nodelay
+        self.receive_buffer_size = receive_buffer_size
+        self.send_buffer_size = send_buffer_size
+        self.keepalive = keepalive
         self._create_socket()
         
     def connect(self, address, serve):
@@ -40,6 +95,7 @@ class Interface(base.Interface):
             self.socket.bind(address)
             self.socket.listen()
             self.socket = self.socket.accept()[0]
+            self._configure_socket(self.socket)
         else:
             self.socket.connect(address)
             
@@ -48,9 +104,38 @@ class Interface(base.Interface):
         self.socket.close()
         self._create_socket()
 
+    def set_timeout(self, timeout):
+        self.socket.settimeout(timeout) #sockets created on reconnecting use the initial timeout again
+
+
     def send_data(self, data, flags=0):
         self.socket.sendall(data, flags)
+
+
+    def send_data_many(self, chunks):
+        """Send the chunks with scatter-gather sendmsg calls if available, otherwise join them and send them at once"""
+        sendmsg = getattr(self.socket, 'sendmsg', None)
+        if sendmsg is None: #e.g. Python 2, one copy is still cheaper than a system call per chunk
+            data = bytearray()
+            for chunk in chunks:
+                data += chunk
+            self.socket.sendall(data)
+            return
+        chunks = [memoryview(chunk) for chunk in chunks]
+        while chunks:
+            sent = sendmsg(chunks[:IOV_MAX])
+            while chunks and sent >= len(chunks[0]):
+                sent -= len(chunks[0])
+                del chunks[0]
+            if sent > 0: #partially sent chunk
+                chunks[0] = chunks[0][sent:]
         
 
     def receive_data(self, byte_count, flags=0):
-        return self.socket.recv(byte_count, flags)
+        try:
+            data = self.socket.recv(byte_count, flags)
+        except socket.timeout as e:
+            raise Timeout(*e.args)
+        if not data and byte_count > 0: #orderly shutdown by the other side
+            raise base.ConnectionLost("connection closed by the other side")
+        return data
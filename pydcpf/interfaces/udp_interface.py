@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""UDP interface for devices sending one packet per datagram
+
+Each datagram is one whole packet, so :class:`core.Device` does not search the received data for packets.
+Many devices may share one socket through a :class:`Hub`, which routes the received datagrams by their source address::
+
+    hub = udp_interface.Hub()
+    devices = [core.Device('udp://192.168.1.%i:10001' % i, 'spinel97', hub=hub) for i in xrange(10, 20)]
+"""
+
+__all__ = ['Interface', 'Hub', 'Timeout']
+
+import collections
+import socket
+import threading
+import time
+
+from . import base
+from .socket_interface import Timeout
+
+
+MAX_DATAGRAM_SIZE = 65535
+
+
+
+class Hub(object):
+    """UDP socket shared by several interfaces, received datagrams are queued for the interface connected to their source address
+
+    Datagrams from other addresses are dropped and counted in :attr:`Hub.dropped`.
+    Any thread waiting for a datagram reads the socket and dispatches what it receives, the others wait for their queues.
+    After a receive timed out, the datagrams from that address arriving until the next send are late replies and are dropped.
+    """
+
+
+    def __init__(self, local_address=('', 0), family=socket.AF_INET, receive_buffer_size=None, queue_size=64):
+        """Create and bind the socket
+
+        Parameters
+        ----------
+        local_address : tuple, optional
+            address to bind to, by default any interface and a free port
+        family : int, optional
+            socket address family
+        receive_buffer_size : int, optional
+            SO_RCVBUF size in bytes, the system default if None
+        queue_size : int, optional
+            maximum number of datagrams queued for one address, the oldest ones are dropped
+        """
+        self.family = family
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        if receive_buffer_size is not None:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer_size)
+        self.socket.bind(local_address)
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queues = {}
+        self._registrations = {} #number of interfaces registered for each address
+        self._timed_out = set() #addresses whose queues are flushed on the next send
+        self._condition = threading.Condition(threading.Lock())
+        self._reading = False #True while a thread reads the socket
+
+
+    def register(self, address):
+        """Start queuing datagrams from *address*
+
+        Interfaces registered for the same address share its queue
+        """
+        with self._condition:
+            count = self._registrations.get(address, 0)
+            if count == 0:
+                self._queues[address] = collections.deque(maxlen=self.queue_size)
+            self._registrations[address] = count + 1
+
+
+    def unregister(self, address):
+        """Undo one :meth:`Hub.register`, the datagrams are no longer queued and those queued are dropped after the last one"""
+        with self._condition:
+            count = self._registrations.get(address, 0) - 1
+            if count > 0:
+                self._registrations[address] = count
+            elif count == 0:
+                del self._registrations[address]
+                del self._queues[address]
+                self._timed_out.discard(address)
+                self._condition.notify_all() #waiting receivers fail
+
+
+    def send(self, data, address):
+        """Send the datagram *data* to *address*, first drop the late datagrams from it if its last receive timed out"""
+        with self._condition:
+            if address in self._timed_out:
+                self._timed_out.discard(address)
+                if not self._reading: #otherwise the reading thread dispatches the waiting datagrams
+                    self._dispatch_waiting()
+                queue = self._queues.get(address)
+                if queue is not None:
+                    queue.clear()
+        self.socket.sendto(data, address)
+
+
+    def _dispatch(self, data, source):
+        """Queue the datagram *data* for its *source* address or drop it, the condition must be held"""
+        source_queue = self._queues.get(source[:2])
+        if source_queue is None:
+            self.dropped += 1
+        else:
+            source_queue.append(data)
+
+
+    def _dispatch_waiting(self):
+        """Dispatch the datagrams waiting in the socket without blocking, the condition must be held and no thread may be reading"""
+        self.socket.settimeout(0.0)
+        while True:
+            try:
+                data, source = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+            except socket.error: #no more datagrams
+                break
+            self._dispatch(data, source)
+
+
+    def receive(self, address, timeout):
+        """Return the next datagram from *address*, wait at most *timeout* seconds (forever if None)
+
+        Raises
+        ------
+        Timeout
+            if no datagram arrived in time, the queue of *address* is flushed then and again on the next :meth:`Hub.send` to it
+        ConnectionLost
+            if *address* is not registered (any more)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        condition = self._condition
+        with condition:
+            while True:
+                queue = self._queues.get(address)
+                if queue is None:
+                    raise base.ConnectionLost("%r is not registered at the hub" % (address,))
+                if queue:
+                    return queue.popleft()
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        queue.clear()
+                        self._timed_out.add(address)
+                        raise Timeout("timed out")
+                if self._reading: #another thread reads and dispatches
+                    condition.wait(remaining)
+                    continue
+                self._reading = True
+                condition.release()
+                try:
+                    self.socket.settimeout(remaining)
+                    try:
+                        data, source = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+                    except socket.timeout:
+                        data = None
+                finally:
+                    condition.acquire()
+                    self._reading = False
+                if data is not None:
+                    self._dispatch(data, source)
+                condition.notify_all()
+
+
+    def close(self):
+        self.socket.close()
+
+
+
+class Interface(base.Interface):
+    """UDP interface exchanging datagrams with one device address
+
+    :meth:`Interface.receive_data` returns one whole datagram regardless of the byte count,
+    so the requests must not be split (*send_byte_count* of :class:`core.Device` must be 0).
+    Serving is not supported.
+    """
+
+    datagram = True
+
+
+    def __init__(self, timeout, hub=None, local_address=('', 0), receive_buffer_size=None):
+        """Initialize the interface
+
+        Parameters
+        ----------
+        timeout : float
+            read timeout in seconds, if 0 no timeout is set
+        hub : :class:`Hub`, optional
+            shared socket, if None the interface creates its own one bound to *local_address*
+        local_address : tuple, optional
+            address to bind the own socket to
+        receive_buffer_size : int, optional
+            SO_RCVBUF size of the own socket
+        """
+        self._own_hub = hub is None
+        if hub is None:
+            hub = Hub(local_address, receive_buffer_size=receive_buffer_size)
+        self.hub = hub
+        self.set_timeout(timeout)
+        self.peer = None
+
+
+    def set_timeout(self, timeout):
+        self._timeout = timeout or None
+
+
+    def connect(self, address, serve):
+        if serve:
+            raise ValueError("the UDP interface cannot serve")
+        host, port = address
+        self.peer = socket.getaddrinfo(host, port, self.hub.family, socket.SOCK_DGRAM)[0][4][:2] #source address of the replies
+        self.hub.register(self.peer)
+
+
+    def disconnect(self, address, serve):
+        if self.peer is not None:
+            self.hub.unregister(self.peer)
+            self.peer = None
+
+
+    def send_data(self, data):
+        self.hub.send(data, self.peer)
+
+
+    def receive_data(self, byte_count):
+        if self.peer is None:
+            raise base.ConnectionLost("not connected")
+        return self.hub.receive(self.peer, self._timeout)
+
+
+    def close(self):
+        """Disconnect and close the socket unless it is a shared hub"""
+        self.disconnect(None, False)
+        if self._own_hub:
+            self.hub.close()
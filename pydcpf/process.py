@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""This module provides the :class:`DeviceProcess` class which runs a :class:`core.Device` in a dedicated worker process
+
+Decoding and checking large data transfers then does not compete for the GIL with the main process.
+Requests are passed to the worker through a pipe, bulk data returned by the device methods is written into a shared memory block
+(a file mapped by both processes), so the main process reads it in place without unpickling.
+"""
+
+__all__ = ['DeviceProcess']
+
+import collections
+import mmap
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+
+
+
+class _SharedData(object):
+    """Reference to a result published in the shared memory block"""
+
+
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+
+
+
+def _publish(value, shared_memory, shared_threshold, offset, end):
+    """Write large byte strings contained in *value* into *shared_memory* between *offset* and *end*
+
+    Returns a (value, offset) tuple, where the published byte strings in value are replaced by :class:`_SharedData` references
+    and offset is the first free position in the shared memory
+    """
+    if isinstance(value, (str, bytearray, buffer)):
+        length = len(value)
+        if 0 < length and length >= shared_threshold and offset + length <= end:
+            shared_memory.seek(offset)
+            shared_memory.write(buffer(value)) #the only copy, mmap.write accepts only read-only buffers
+            return _SharedData(offset, length), offset + length
+        return str(value), offset #buffers cannot be pickled
+    if isinstance(value, (list, tuple)):
+        published = []
+        for item in value:
+            item, offset = _publish(item, shared_memory, shared_threshold, offset, end)
+            published.append(item)
+        if isinstance(value, tuple):
+            published = tuple(published)
+        return published, offset
+    return value, offset
+
+
+def _picklable_exception(exception):
+    """Return the *exception* if it survives pickling, otherwise a :class:`RuntimeError` describing it"""
+    try:
+        pickle.loads(pickle.dumps(exception, pickle.HIGHEST_PROTOCOL))
+        return exception
+    except Exception:
+        return RuntimeError("%s: %s" % (exception.__class__.__name__, exception))
+
+
+def _serve(device_class, device_args, device_kwargs, connection, shared_memory_path, shared_memory_size, shared_threshold):
+    """Main loop of the worker process"""
+    with open(shared_memory_path, 'r+b') as shared_file: #opened by name, so it works without fork too
+        shared_memory = mmap.mmap(shared_file.fileno(), shared_memory_size)
+    try:
+        device = device_class(*device_args, **device_kwargs)
+    except Exception as e:
+        connection.send((False, _picklable_exception(e)))
+        return
+    connection.send((True, None))
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None: # close request
+            break
+        action, name, args, kwargs, (start, end) = request
+        try:
+            if action == 'call':
+                result = getattr(device, name)(*args, **kwargs)
+            elif action == 'get':
+                result = getattr(device, name)
+            else: # must be 'set'
+                result = setattr(device, name, args[0])
+            connection.send((True, _publish(result, shared_memory, shared_threshold, start, end)[0]))
+        except Exception as e:
+            connection.send((False, _picklable_exception(e)))
+    connection.close()
+    shared_memory.close()
+
+
+
+class DeviceProcess(object):
+    """Proxy for a :class:`core.Device` (or subclass) instance running in a dedicated worker process
+
+    Methods and attributes of the device are accessed the same way as on the device itself.
+    Byte strings (also inside returned lists or tuples) of at least *shared_threshold* bytes
+    are returned as read-only buffers into the shared memory block. The block is used as a ring,
+    the region of a result is not reused until the result is passed to :meth:`DeviceProcess.release`.
+    When no free region is large enough, the results are pickled (copied) instead.
+    Exceptions raised by the device are re-raised in the calling process.
+    """
+
+
+    def __init__(self, device_class, device_args=(), device_kwargs=None, shared_memory_size=16 * 2**20, shared_threshold=1024):
+        """Start the worker process and initialize the device in it
+
+        Parameters
+        ----------
+        device_class : class
+            :class:`core.Device` class or subclass to instantiate in the worker process
+        device_args : tuple, optional
+            positional arguments passed to *device_class*
+        device_kwargs : dict, optional
+            keyword arguments passed to *device_class*
+        shared_memory_size : int, optional
+            size of the shared memory block for publishing results in bytes, defaults to 16 MiB
+            results which do not fit are pickled instead
+        shared_threshold : int, optional
+            byte strings shorter than this are pickled instead of published in the shared memory
+        """
+        if device_kwargs is None:
+            device_kwargs = {}
+        self._device_class = device_class
+        self._lock = threading.Lock()
+        self._regions = collections.OrderedDict() #id of a published buffer : (buffer, offset, end), oldest first
+        shared_file_descriptor, self._shared_memory_path = tempfile.mkstemp(prefix='pydcpf-')
+        with os.fdopen(shared_file_descriptor, 'r+b') as shared_file:
+            shared_file.truncate(shared_memory_size)
+            self._shared_memory = mmap.mmap(shared_file.fileno(), shared_memory_size)
+        self._connection, worker_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(device_class, device_args, device_kwargs, worker_connection,
+                                                                      self._shared_memory_path, shared_memory_size, shared_threshold))
+        self._process.daemon = True
+        self._process.start()
+        worker_connection.close()
+        try:
+            self._receive()
+        finally:
+            if os.name == 'posix': #both processes have mapped it, the file can go
+                self._remove_shared_file()
+
+
+    def _remove_shared_file(self):
+        if self._shared_memory_path is not None:
+            os.remove(self._shared_memory_path)
+            self._shared_memory_path = None
+
+
+    def _free_region(self):
+        """Return the (start, end) region of the shared memory block which the worker may write into"""
+        size = len(self._shared_memory)
+        if not self._regions:
+            return 0, size
+        oldest_start = next(self._regions.itervalues())[1]
+        newest_end = self._regions[next(reversed(self._regions))][2]
+        if newest_end <= oldest_start: #wrapped around, the space between the newest and the oldest result is free
+            return newest_end, oldest_start
+        if size - newest_end >= oldest_start: #the larger of the space after the newest and before the oldest result
+            return newest_end, size
+        return 0, oldest_start
+
+
+    def release(self, *results):
+        """Allow the shared memory regions of the *results* (buffers returned by the device methods) to be reused
+
+        The buffers must not be used afterwards, other results are ignored
+        """
+        with self._lock:
+            for result in results:
+                self._regions.pop(id(result), None)
+
+
+    def _receive(self):
+        """Receive a reply from the worker, return its result or raise its exception"""
+        success, result = self._connection.recv()
+        if not success:
+            raise result
+        return self._resolve(result)
+
+
+    def _resolve(self, value):
+        """Replace :class:`_SharedData` references in *value* with read-only buffers into the shared memory and reserve their regions"""
+        if isinstance(value, _SharedData):
+            data = buffer(self._shared_memory, value.offset, value.length)
+            self._regions[id(data)] = (data, value.offset, value.offset + value.length) #keeps the id unique while reserved
+            return data
+        if isinstance(value, list):
+            return [self._resolve(item) for item in value]
+        if isinstance(value, tuple):
+            return tuple(self._resolve(item) for item in value)
+        return value
+
+
+    def _request(self, action, name, args=(), kwargs={}):
+        with self._lock:
+            self._connection.send((action, name, args, kwargs, self._free_region()))
+            return self._receive()
+
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        class_attribute = getattr(self._device_class, name, None)
+        if callable(class_attribute):
+            def method(*args, **kwargs):
+                return self._request('call', name, args, kwargs)
+            method.__name__ = name
+            method.__doc__ = class_attribute.__doc__
+            return method
+        return self._request('get', name)
+
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            self._request('set', name, (value,))
+
+
+    def close(self):
+        """Stop the worker process and release the shared memory block
+
+        The device is not disconnected automatically, call its disconnect method first if necessary
+        """
+        with self._lock:
+            self._connection.send(None)
+            self._connection.close()
+            self._process.join()
+            self._regions.clear()
+        self._shared_memory.close()
+        self._remove_shared_file()
@@ -15,6 +15,9 @@
 #You should have received a copy of the GNU General Public License
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 from . import base
+from . import framing
+
+instruction_element = 'DATA' #commands are text in the DATA element
 
 
 def _hexify(value):
@@ -29,6 +32,8 @@ def _dehexify(hexbytestring):
 
 class _basePacket(base.RequestPacket):
 
+    __slots__ = ()
+
 
     def _set_address(self, address):
         self.raw_packet[1:3] = _hexify(address)
@@ -45,6 +50,8 @@ _basePacket.register_element("CR", "terminating character", start_position=-1, l
 
 class RequestPacket(_basePacket):
 
+    __slots__ = ()
+
 
     def __init__(self, ADR=10, DATA=''):
         super(RequestPacket, self).__init__(INIT='@', ADR=ADR, DATA=DATA, CR='\r')
@@ -73,24 +80,15 @@ RequestPacket.register_element("CTRLSUM", "control sum in decimal", set_function
 
 
 
-class ResponsePacket(_basePacket):
+class ResponsePacket(_basePacket, base.ResponsePacket):
 
+    __slots__ = ()
+
+    framer = framing.DelimitedFramer('#', '\r')
 
-    def find(self):
-        raw_packet = self.raw_packet #minimize attr lookups
-        try:
-            start = raw_packet.index('#')
-            end = raw_packet.index('\r', start)
-        except ValueError:
-            return False
-        self.start, self.length = start, end - start + 1
-        return True
 
     def check(self):
         pass
     
 
-import copy
-#to prevent conflicts with previous DATA definition
-ResponsePacket.elements_definitions_dict = copy.copy(ResponsePacket.elements_definitions_dict)
 ResponsePacket.register_element("DATA", "data contained in packet", start_position=3, end_position=-1)
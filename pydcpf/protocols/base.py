@@ -21,6 +21,54 @@ __all__ = ["RequestPacket", "ResponsePacket"]
 
 import struct
 
+from . import framing
+
+
+_numpy_type_codes = {'b' : 'i1', 'B' : 'u1', 'h' : 'i2', 'H' : 'u2', 'i' : 'i4', 'I' : 'u4', 'l' : 'i4', 'L' : 'u4',
+                     'q' : 'i8', 'Q' : 'u8', 'f' : 'f4', 'd' : 'f8', 'c' : 'S1', '?' : 'b1'}
+
+
+def _numpy_format(code):
+    """Return the numpy type string equivalent to the struct *code* of a single value, or None if there is none"""
+    byte_order = '='
+    if code[0] in '<>!=@':
+        byte_order = {'!' : '>', '@' : '='}.get(code[0], code[0])
+        code = code[1:]
+    try:
+        return byte_order + _numpy_type_codes[code]
+    except KeyError:
+        return None
+
+
+def _framed_lengths(framer, raw, offsets, limits):
+    """Return the lengths of the packets at *offsets* in the *raw* uint8 array read from their length fields all at once
+
+    The packets are verified like by the :class:`framing.LengthPrefixedFramer` *framer*, each must end before its limit.
+    Returns None if numpy has no type for the length field.
+
+    Raises
+    ------
+    ValueError
+        if there is no whole packet at one of the offsets
+    """
+    import numpy
+    length_format = _numpy_format(framer.length_struct.format)
+    if length_format is None:
+        return None
+    def verify(valid):
+        if not valid.all():
+            raise ValueError("no packet at offset %i" % offsets[numpy.argmin(valid)])
+    verify(offsets + framer.minimum_length <= limits) #so that the gathered fields are within raw
+    marker = numpy.frombuffer(framer.start_marker, numpy.uint8)
+    verify((raw[offsets[:, None] + numpy.arange(len(marker))] == marker).all(axis=1))
+    fields = raw[offsets[:, None] + framer.length_position + numpy.arange(framer.length_struct.size)] #one row of bytes for each packet
+    lengths = fields.view(length_format).reshape(len(offsets)).astype(numpy.int64) + framer.length_adjust
+    verify((lengths >= framer.minimum_length) & (offsets + lengths <= limits))
+    if framer.terminator:
+        terminator = numpy.frombuffer(framer.terminator, numpy.uint8)
+        verify((raw[(offsets + lengths - len(terminator))[:, None] + numpy.arange(len(terminator))] == terminator).all(axis=1))
+    return lengths
+
 
 
 class RequestPacket(object):
@@ -30,6 +78,8 @@ class RequestPacket(object):
 
     For most protocols this class may be the same as :class:`ResponsePacket`
     """
+
+    __slots__ = ('raw_packet', 'start', 'length') #no per-instance __dict__, subclasses must define __slots__ too
     
     
     def __init__(self, raw_packet=None, **packet_parameters):
@@ -67,9 +117,11 @@ class RequestPacket(object):
     def _get_element_substring(self, name):
         """Return a character or substring representing the named packet element"""
         start_position, length_or_code, end_position = self.__class__.elements_definitions_dict[name]
-        start_position += self.start
-        if start_position < 0:
-            start_position += self.length
+        start = self.start
+        if start_position < 0: #relative to the packet end
+            start_position += start + self.length
+        else:
+            start_position += start
         if isinstance(length_or_code, str): #is a code
             return struct.unpack_from(length_or_code, buffer(self.raw_packet), start_position)[0]
         if length_or_code > 1: #must be int then
@@ -77,27 +129,75 @@ class RequestPacket(object):
         elif length_or_code is not None: #must be 1 then
             return chr(self.raw_packet[start_position])
         if end_position > 0:
-            return buffer(self.raw_packet, start_position, end_position - start_position)
-        elif end_position is not None: #must be negative then
-            return buffer(self.raw_packet, start_position, self.length + end_position - start_position)
+            return buffer(self.raw_packet, start_position, start + end_position - start_position)
+        elif end_position is not None: #0 or negative, relative to the packet end
+            return buffer(self.raw_packet, start_position, start + self.length + end_position - start_position)
         
 
     def _set_element_substring(self, name, value):
         """Set the named packet element to a character or substring value"""
         start_position, length_or_code, end_position = self.__class__.elements_definitions_dict[name]
-        start_position += self.start
-        if start_position < 0:
-            start_position += self.length
+        start = self.start
+        if start_position < 0: #relative to the packet end
+            start_position += start + self.length
+        else:
+            start_position += start
         if isinstance(length_or_code, str): #is a code
             struct.pack_into(length_or_code, self.raw_packet, start_position, value)
         elif length_or_code > 1: #must be int then
             self.raw_packet[start_position:start_position + length_or_code] = value
         elif length_or_code is not None: #must be 1 then
             self.raw_packet[start_position] = value
-        elif end_position is not None: 
-            self.raw_packet[start_position:end_position] = value
+        elif end_position > 0:
+            self.raw_packet[start_position:start + end_position] = value
+        elif end_position is not None: #0 or negative, relative to the packet end
+            self.raw_packet[start_position:start + self.length + end_position] = value
             
 
+    def _element_span(self, name):
+        """Return the (start, stop) positions of the named element in the raw_packet"""
+        start_position, length_or_code, end_position = self.__class__.elements_definitions_dict[name]
+        if start_position is None:
+            raise ValueError("Element %s has no fixed position" % name)
+        start = self.start
+        if start_position < 0: #relative to the packet end
+            start_position += start + self.length
+        else:
+            start_position += start
+        if isinstance(length_or_code, str): #is a code
+            return start_position, start_position + struct.calcsize(length_or_code)
+        if length_or_code is not None:
+            return start_position, start_position + length_or_code
+        if end_position > 0:
+            return start_position, start + end_position
+        return start_position, start + self.length + end_position
+
+
+    def element_view(self, name):
+        """Return a :class:`memoryview` of the bytes of the named element without copying them
+
+        The view reflects later changes of the raw_packet and prevents it from being resized while it exists.
+        It is also available as the Packet.<name>_view property
+        """
+        start, stop = self._element_span(name)
+        return memoryview(self.raw_packet)[start:stop]
+
+
+    def element_int(self, name):
+        """Return the named element as an int without creating intermediate strings
+
+        Elements with a *code* are unpacked, others are read as a big-endian unsigned number
+        """
+        if isinstance(self.__class__.elements_definitions_dict[name][1], str): #is a code
+            return self._get_element_substring(name)
+        start, stop = self._element_span(name)
+        raw_packet = self.raw_packet
+        value = 0
+        for i in xrange(start, stop):
+            value = value << 8 | raw_packet[i]
+        return value
+
+
     def _del_element_substring(self, name):
         """Delete a character or substring in the raw_packet representing the named packet element"""
         length_or_code = self.__class__.elements_definitions_dict.pop(name)[1]
@@ -121,6 +221,7 @@ class RequestPacket(object):
         ----------
         name : str
             name of the property, will be accessible as Packet.name
+            if *start_position* is given, a read-only Packet.<name>_view property returning a :class:`memoryview` is made too
         docstring : str
             documentation for the property
         start_position : int, optional
@@ -131,7 +232,7 @@ class RequestPacket(object):
         end_position : int, optional
             index in the raw_packet buffer at which the value ends, in pythonic style
             mutually exclusive with *code*
-            may be negative as an index relative to the end
+            0 or negative as an index relative to the end (0 is the packet end)
         length : int, optional
             if the byte length cannot be deduced from *code* or *start_position* and *end_position* (e.g. if you specify your own functions or *end_position* is negative) it should be provided so :meth:`RequestPacket.__init__` allocates enough memory, otherwise it is calculated from the length of the provided arguments
         get_function : function, optional
@@ -151,10 +252,8 @@ class RequestPacket(object):
             cls.minimum_packet_length
         except AttributeError:
             cls.minimum_packet_length = 0
-        try:
-            cls.elements_definitions_dict
-        except AttributeError:
-            cls.elements_definitions_dict = {}
+        if 'elements_definitions_dict' not in cls.__dict__: #do not add elements to the superclass definitions
+            cls.elements_definitions_dict = dict(getattr(cls, 'elements_definitions_dict', {}))
 
         length_or_code = None
         if code is not None:
@@ -177,6 +276,108 @@ class RequestPacket(object):
             def del_function(self):
                 cls._del_element_substring(self, name)
         setattr(cls, name, property(fget=get_function, fset=set_function, fdel=del_function, doc=docstring))
+        if start_position is not None:
+            def view_function(self):
+                return self.element_view(name)
+            setattr(cls, name + '_view', property(fget=view_function, doc="memoryview of the %s element, see :meth:`RequestPacket.element_view`" % name))
+
+
+    @classmethod
+    def numpy_dtype(cls):
+        """Return a numpy structured dtype with a field for each element which can be decoded without creating a packet
+
+        The *offset* and *length* fields hold the position of the packet in the buffer.
+        Elements with a *code* become fields of the corresponding type, single bytes become uint8 fields
+        and other fixed length elements byte strings,
+        variable length elements like DATA are represented by *NAME_offset* and *NAME_length* fields
+        with the absolute position of the element in the buffer.
+        Elements with their own get functions are not included.
+        """
+        import numpy
+        fields = [('offset', numpy.int64), ('length', numpy.int64)]
+        for name in sorted(cls.elements_definitions_dict):
+            start_position, length_or_code, end_position = cls.elements_definitions_dict[name]
+            if start_position is None:
+                continue
+            if isinstance(length_or_code, str):
+                numpy_format = _numpy_format(length_or_code)
+                if numpy_format is None:
+                    numpy_format = 'S%i' % struct.calcsize(length_or_code)
+                fields.append((name, numpy_format))
+            elif length_or_code == 1:
+                fields.append((name, numpy.uint8)) #byte value, numpy strings lose trailing null bytes
+            elif length_or_code is not None:
+                fields.append((name, 'S%i' % length_or_code))
+            elif end_position is not None:
+                fields.extend([(name + '_offset', numpy.int64), (name + '_length', numpy.int64)])
+        return numpy.dtype(fields)
+
+
+    @classmethod
+    def decode_batch(cls, data, offsets, lengths=None):
+        """Decode the packets at *offsets* in *data* into a structured array of the :meth:`RequestPacket.numpy_dtype` dtype
+
+        Each field is gathered from all packets at once, no packet objects are created.
+        The packets are not checked.
+
+        Parameters
+        ----------
+        data : str, bytearray, buffer or mmap
+            buffer containing the packets
+        offsets : sequence of int
+            positions of the packets in *data*
+        lengths : sequence of int, optional
+            lengths of the packets, if not given they are read from the length fields of all packets at once
+            if the packets have a :class:`framing.LengthPrefixedFramer`, otherwise they are determined
+            with :meth:`ResponsePacket.find` at each offset in a copy of the bytes up to the next offset (or the end of *data*)
+
+        Returns
+        -------
+        packets : numpy.ndarray
+            structured array with one item per packet
+        """
+        import numpy
+        raw = numpy.frombuffer(data, numpy.uint8)
+        offsets = numpy.asarray(offsets, numpy.int64)
+        if lengths is None:
+            starts = numpy.unique(offsets) #sorted
+            limits = numpy.append(starts, len(raw))[numpy.searchsorted(starts, offsets, side='right')] #the next offsets
+            framer = getattr(cls, 'framer', None)
+            if isinstance(framer, framing.LengthPrefixedFramer):
+                lengths = _framed_lengths(framer, raw, offsets, limits)
+        if lengths is None:
+            packet = cls()
+            lengths = []
+            for offset, limit in zip(offsets, limits):
+                packet.raw_packet = bytearray(buffer(data, offset, limit - offset))
+                packet.start = 0
+                if not packet.find() or packet.start != 0:
+                    raise ValueError("no packet at offset %i" % offset)
+                lengths.append(packet.length)
+        lengths = numpy.asarray(lengths, numpy.int64)
+        dtype = cls.numpy_dtype()
+        packets = numpy.empty(len(offsets), dtype)
+        packets['offset'] = offsets
+        packets['length'] = lengths
+        for name, (start_position, length_or_code, end_position) in cls.elements_definitions_dict.iteritems():
+            if start_position is None:
+                continue
+            if start_position < 0: #relative to the packet end
+                positions = offsets + lengths + start_position
+            else:
+                positions = offsets + start_position
+            if name in dtype.names:
+                field = packets[name]
+                size = field.dtype.itemsize
+                gathered = raw[positions[:, None] + numpy.arange(size)] #one row of bytes for each packet
+                packets[name] = gathered.view(field.dtype).reshape(len(offsets))
+            elif name + '_offset' in dtype.names:
+                packets[name + '_offset'] = positions
+                if end_position > 0:
+                    packets[name + '_length'] = offsets + end_position - positions
+                else:
+                    packets[name + '_length'] = offsets + lengths + end_position - positions
+        return packets
 
 
     def __iter__(self):
@@ -194,18 +395,44 @@ class ResponsePacket(RequestPacket):
     For most protocols this class may be the same as :class:`RequestPacket`
     """
 
+    __slots__ = ()
+
+
+    framer = None #a framing.Framer used by find(), if the protocol declares its framing
 
-    def find(self):
-        """Try to find a WHOLE packet in :attr:`ResponsePacket.raw_packet`
+
+    def find(self, buffer_start=0):
+        """Try to find a WHOLE packet in :attr:`ResponsePacket.raw_packet` beginning at or after *buffer_start*
 
         This method must set :attr:`ResponsePacket.start` and :attr:`ResponsePacket.length`
+        If no packet was found, it should set :attr:`ResponsePacket.start` to the first position at which a packet may still begin,
+        all bytes before it are then discarded as garbage. If it leaves it at 0, nothing is discarded.
+        The default implementation uses the :attr:`ResponsePacket.framer` (see :mod:`framing`), protocols may override it instead
         
         Returns
         -------
         found : bool
             True if a whole packet was found, False otherwise
         """
-        pass
+        framer = self.framer
+        if framer is None:
+            return False
+        self.start, length = framer.find(self.raw_packet, buffer_start)
+        if length is None:
+            return False
+        self.length = length
+        return True
+
+
+    def missing_bytes(self):
+        """Return how many bytes are still missing from the packet at :attr:`ResponsePacket.start` after :meth:`ResponsePacket.find` failed
+
+        Returns None if unknown, e.g. if the packet has no length field. Protocols overriding find may override this too
+        """
+        framer = self.framer
+        if framer is None:
+            return None
+        return framer.missing(self.raw_packet, self.start)
 
 
     def check(self, **parameters):
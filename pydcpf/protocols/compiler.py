@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""This module compiles a declarative packet specification into a packet class
+
+The packet is described by a list of fields in their order in the packet,
+each field is a (name, docstring, code, default) tuple where code is a :mod:`struct` format without the byte order
+or :data:`VARIABLE` for the one variable length field (usually DATA)::
+
+    def checksum(raw_packet, start, end):
+        return (255 - sum(raw_packet[start:end])) % 256
+
+    RequestPacket = packet_class('RequestPacket', [
+            ('PRE', "Packet prefix character", 'c', '*'),
+            ('FRM', "Packet format number", 'B', 97),
+            ('NUM', "Number of bytes in packet after NUM", 'H', LENGTH),
+            ('ADR', "Module address number", 'B', 0xfe),
+            ('SIG', "Signature number", 'B', 2),
+            ('INST', "Device instruction code character", 'c', None),
+            ('DATA', "Data contained in packet", VARIABLE, ''),
+            ('SUMA', "Checksum number", 'B', CHECKSUM),
+            ('CR', "Ending mark character", 'c', '\\r'),
+        ], length_adjust=4, checksum=checksum)
+
+The default is used if the field is not given when the packet is created, None means the field is required,
+:data:`LENGTH` is the length of the packet minus *length_adjust*
+and :data:`CHECKSUM` is calculated by the *checksum* function from the bytes before the field.
+
+The offsets of all fields and the :class:`struct.Struct` instances for the fields before and after the variable field are computed once,
+so a packet is encoded with two pack_into calls. A framer (see :mod:`framing`) is chosen from the constant first and last fields
+and the length field.
+"""
+
+__all__ = ['packet_class', 'CompiledPacket', 'CheckSumError', 'VARIABLE', 'LENGTH', 'CHECKSUM']
+
+import struct
+
+from . import base
+from . import framing
+
+
+VARIABLE = 'variable' #code of the variable length field
+LENGTH = object() #default of the length field
+CHECKSUM = object() #default of the checksum field
+
+
+
+class CheckSumError(Exception):
+
+
+    def __init__(self, packet):
+        self.packet = packet
+
+
+    def __str__(self):
+        return "Packet checksum is 0x%02x, but the %s checksum field is 0x%02x" % (self.packet.calculate_checksum(), self.packet.checksum_field, getattr(self.packet, self.packet.checksum_field))
+
+
+
+class CompiledPacket(base.ResponsePacket):
+    """Base class of packet classes made by :func:`packet_class`, the class attributes are set by it"""
+
+    __slots__ = ()
+
+    header_struct = None #struct.Struct of the fields before the variable field
+    header_fields = () #(name, default) pairs of the fields before the variable field
+    trailer_struct = None #struct.Struct of the fields after the variable field
+    trailer_fields = ()
+    variable_field = None #(name, default) of the variable field or None
+    length_adjust = 0
+    checksum_field = None #name of the checksum field
+    checksum_function = None
+    checksum_struct = None #struct.Struct of the checksum field
+    checksum_offset = 0 #position of the checksum field relative to the packet end
+
+
+    def __init__(self, raw_packet=None, **packet_parameters):
+        """Initialize the packet from the *raw_packet* or encode it from the *packet_parameters* and field defaults
+
+        If neither is given, the packet is left empty (e.g. for receiving)
+        """
+        if raw_packet is not None:
+            super(CompiledPacket, self).__init__(raw_packet=raw_packet)
+        elif packet_parameters:
+            self.raw_packet = self.encode(**packet_parameters)
+            self.start, self.length = 0, len(self.raw_packet)
+
+
+    @classmethod
+    def _values(cls, fields, packet_parameters, length):
+        values = []
+        for name, default in fields:
+            value = packet_parameters.get(name, default)
+            if value is LENGTH:
+                value = length - cls.length_adjust
+            elif value is CHECKSUM:
+                value = 0 #packed again when the checksum is known
+            elif value is None:
+                raise ValueError("Field %s is required" % name)
+            values.append(value)
+        return values
+
+
+    @classmethod
+    def encode(cls, **packet_parameters):
+        """Return a bytearray with the packet encoded from the *packet_parameters* and field defaults"""
+        header_struct, trailer_struct = cls.header_struct, cls.trailer_struct
+        data = ''
+        if cls.variable_field is not None:
+            name, default = cls.variable_field
+            data = packet_parameters.get(name, default)
+        header_size = header_struct.size
+        length = header_size + len(data) + trailer_struct.size
+        raw_packet = bytearray(length)
+        header_struct.pack_into(raw_packet, 0, *cls._values(cls.header_fields, packet_parameters, length))
+        raw_packet[header_size:header_size + len(data)] = data
+        trailer_struct.pack_into(raw_packet, length - trailer_struct.size, *cls._values(cls.trailer_fields, packet_parameters, length))
+        if cls.checksum_field is not None and cls.checksum_field not in packet_parameters:
+            position = length + cls.checksum_offset
+            cls.checksum_struct.pack_into(raw_packet, position, cls.checksum_function(raw_packet, 0, position))
+        return raw_packet
+
+
+    def calculate_checksum(self):
+        """Return the checksum of the bytes before the checksum field"""
+        end = self.start + self.length + self.checksum_offset
+        return self.checksum_function(self.raw_packet, self.start, end)
+
+
+    def check(self):
+        if self.checksum_field is not None and getattr(self, self.checksum_field) != self.calculate_checksum():
+            raise CheckSumError(self)
+
+
+
+def packet_class(name, fields, byte_order='>', length_adjust=0, checksum=None, base_class=CompiledPacket, docstring=None):
+    """Compile the *fields* specification into a packet class
+
+    Parameters
+    ----------
+    name : str
+        name of the class
+    fields : list of (name, docstring, code, default) tuples
+        fields in the order in the packet, see the module documentation
+        the :data:`CHECKSUM` field must be after the :data:`VARIABLE` field
+    byte_order : str, optional
+        :mod:`struct` byte order character
+    length_adjust : int, optional
+        the :data:`LENGTH` field contains the length of the packet minus this number
+    checksum : function, optional
+        checksum(raw_packet, start, end) returns the checksum of raw_packet[start:end]
+        required if there is a :data:`CHECKSUM` field
+    base_class : class, optional
+        :class:`CompiledPacket` or its subclass, e.g. with additional checks
+    docstring : str, optional
+        documentation of the class
+
+    Returns
+    -------
+    cls : class
+        packet class which may be used both as a RequestPacket and a ResponsePacket
+    """
+    header, trailer, variable = [], [], None
+    for field in fields:
+        if field[2] == VARIABLE:
+            if variable is not None:
+                raise ValueError("Only one variable length field is supported")
+            variable = field
+        elif variable is None:
+            header.append(field)
+        else:
+            trailer.append(field)
+    header_struct = struct.Struct(byte_order + ''.join(field[2] for field in header))
+    trailer_struct = struct.Struct(byte_order + ''.join(field[2] for field in trailer))
+    attributes = {
+        '__slots__' : (),
+        '__doc__' : docstring,
+        'header_struct' : header_struct,
+        'header_fields' : tuple((field[0], field[3]) for field in header),
+        'trailer_struct' : trailer_struct,
+        'trailer_fields' : tuple((field[0], field[3]) for field in trailer),
+        'variable_field' : None if variable is None else (variable[0], variable[3]),
+        'length_adjust' : length_adjust,
+        'checksum_function' : staticmethod(checksum) if checksum is not None else None,
+        }
+    # offsets of the fields, trailer fields relative to the packet end
+    positions = {}
+    position = 0
+    for field in header:
+        positions[field[0]] = position
+        position += struct.calcsize(byte_order + field[2])
+    position = -trailer_struct.size
+    for field in trailer:
+        positions[field[0]] = position
+        position += struct.calcsize(byte_order + field[2])
+    length_field = None
+    for field in header + trailer:
+        if field[3] is LENGTH:
+            length_field = field
+        elif field[3] is CHECKSUM:
+            if field not in trailer:
+                raise ValueError("The checksum field must follow the variable length field")
+            if checksum is None:
+                raise ValueError("A checksum function is required for the checksum field")
+            attributes['checksum_field'] = field[0]
+            attributes['checksum_struct'] = struct.Struct(byte_order + field[2])
+            attributes['checksum_offset'] = positions[field[0]]
+    attributes['framer'] = _framer(header, trailer, positions, byte_order, length_adjust, header_struct.size + trailer_struct.size, length_field)
+    cls = type(name, (base_class,), attributes)
+    for field in header + trailer:
+        cls.register_element(field[0], field[1], start_position=positions[field[0]], code=byte_order + field[2])
+    if variable is not None: #without a trailer end_position is 0, i.e. the packet end
+        cls.register_element(variable[0], variable[1], start_position=header_struct.size, end_position=-trailer_struct.size)
+    return cls
+
+
+def _constant(field):
+    """Return the default of a field if it is a constant byte string, otherwise None"""
+    code, default = field[2], field[3]
+    if isinstance(default, str) and (code == 'c' or code.endswith('s')):
+        return default
+    return None
+
+
+def _framer(header, trailer, positions, byte_order, length_adjust, minimum_length, length_field):
+    """Return a framer matching the constant first and last fields and the length field, or None"""
+    start_marker = _constant(header[0]) if header else None
+    terminator = _constant(trailer[-1]) if trailer else None
+    if start_marker is not None and positions[header[0][0]] != 0:
+        start_marker = None
+    if start_marker is None:
+        if terminator is None:
+            return None
+        return framing.DelimitedFramer(None, terminator)
+    if length_field is not None and length_field in header:
+        return framing.LengthPrefixedFramer(start_marker, positions[length_field[0]], byte_order + length_field[2],
+                                            length_adjust=length_adjust, terminator=terminator, minimum_length=minimum_length)
+    if terminator is None:
+        return None
+    return framing.DelimitedFramer(start_marker, terminator)
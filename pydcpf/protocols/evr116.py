@@ -15,14 +15,22 @@
 #You should have received a copy of the GNU General Public License
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 
+import re
+
 from . import base
 
+instruction_element = 'IDENTIFIER' #name of the RequestPacket element identifying the instruction
+
 valid_command_characters = "hxyzijgstv" # request chars
 valid_command_characters += "p" + valid_command_characters.upper() # response chars
 
+_last_command_pattern = re.compile('[%s][^%s]*\r\n' % (valid_command_characters, valid_command_characters))
+
 
 class RequestPacket(base.RequestPacket):
 
+    __slots__ = ()
+
 
     def __init__(self, IDENTIFIER='x', DATA=''):
         super(RequestPacket, self).__init__(IDENTIFIER=IDENTIFIER, DATA=DATA, TERMINATOR='\r\n')
@@ -32,26 +40,20 @@ class RequestPacket(base.RequestPacket):
 
     def find(self, buffer_start=0):
         raw_packet = self.raw_packet
-        try:
-            end = raw_packet.index('\r\n', buffer_start) + 1
-        except ValueError:
+        end = raw_packet.find('\r\n', buffer_start) + 1
+        if end == 0:
             return False
-        possible_start = raw_packet.rfind('\r\n', buffer_start, end - 1)
-        if possible_start == -1:
-            possible_start = buffer_start
-        else:
-            possible_start += 2
-        possible_packet_buff = buffer(raw_packet, possible_start, end - possible_start - 1)
-        for char in reversed(possible_packet_buff):
-            if char in valid_command_characters:
-                self.start = raw_packet.rfind(char, possible_start, end - 2)
-                self.length = end - self.start + 1
-                return True
+        command = _last_command_pattern.search(raw_packet, buffer_start, end + 1)
+        if command is not None: #the packet starts with the last command character on the line
+            self.start = command.start()
+            self.length = end - self.start + 1
+            return True
         # might be a reposnse to 'p?' query - only 4 bytes with no identifier
-        if len(possible_packet_buff) == 4:
-            self.start = possible_start
-            self.length = end - possible_start + 1
+        if end - 1 - buffer_start == 4:
+            self.start = buffer_start
+            self.length = end - buffer_start + 1
             return True
+        self.start = end + 1 #garbage up to and including the terminator
         return False
 
 
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""This module provides framers which find whole packets in a receive buffer
+
+A packet class declares its framing with the *framer* class attribute
+and the default :meth:`base.ResponsePacket.find` uses it::
+
+    class ResponsePacket(base.ResponsePacket):
+        framer = framing.DelimitedFramer('#', '\\r')
+
+All scans are done with the C-level find methods of the buffer,
+so the cost per byte is low even for buffers full of garbage.
+"""
+
+__all__ = ['Framer', 'DelimitedFramer', 'LengthPrefixedFramer']
+
+import struct
+
+
+
+class Framer(object):
+    """Base framer class"""
+
+
+    def find(self, data, position=0):
+        """Find the first whole packet in *data* beginning at or after *position*
+
+        Parameters
+        ----------
+        data : bytearray, str or mmap
+            the receive buffer
+        position : int, optional
+            where to start the search, the search may be resumed after a rejected candidate
+
+        Returns
+        -------
+        start : int
+            position of the packet if one was found,
+            otherwise the first position at which a packet may still begin (all bytes before it are garbage)
+        length : int or None
+            length of the packet or None if no whole packet was found
+        """
+        raise NotImplementedError
+
+
+    def missing(self, data, start):
+        """Return how many bytes are still missing from the incomplete packet beginning at *start*, or None if unknown
+
+        Only the bytes needed for the packet are counted, the packet may still turn out to be a false candidate
+        """
+        return None
+
+
+
+class DelimitedFramer(Framer):
+    """Packets beginning with a start marker and ending with a terminator, both may be several bytes long
+
+    If the start marker is None, a packet begins right at the searched position, e.g. a line ending with '\\r\\n'
+    """
+
+
+    def __init__(self, start_marker, terminator):
+        self.start_marker = start_marker
+        self.terminator = terminator
+
+
+    def find(self, data, position=0):
+        start_marker = self.start_marker
+        if start_marker is None:
+            start = position
+            end = data.find(self.terminator, start)
+        else:
+            start = data.find(start_marker, position)
+            if start == -1: #a part of the start marker may be at the end
+                return max(position, len(data) - len(start_marker) + 1), None
+            end = data.find(self.terminator, start + len(start_marker))
+        if end == -1:
+            return start, None
+        return start, end + len(self.terminator) - start
+
+
+
+class LengthPrefixedFramer(Framer):
+    """Packets beginning with a start marker and containing a length field, optionally ending with a verified terminator
+
+    A candidate whose terminator is not at the position given by its length field is rejected and the search continues.
+    A candidate which is not complete yet does not stop the search, a following whole packet is still found,
+    as the length field of a false candidate in garbage may announce an arbitrarily long packet.
+    """
+
+
+    def __init__(self, start_marker, length_position, length_code, length_adjust=0, terminator=None, minimum_length=None):
+        """Initialize the framer
+
+        Parameters
+        ----------
+        start_marker : str
+            bytes at the beginning of each packet
+        length_position : int
+            position of the length field in the packet
+        length_code : str
+            struct format of the length field, e.g. '>H'
+        length_adjust : int, optional
+            added to the value of the length field to get the length of the whole packet
+        terminator : str, optional
+            bytes at the end of each packet
+        minimum_length : int, optional
+            length of the shortest packet, shorter candidates are rejected and bytes are not examined until that many arrived
+            defaults to the length of the packet up to the end of the length field plus the terminator
+        """
+        self.start_marker = start_marker
+        self.length_position = length_position
+        self.length_struct = struct.Struct(length_code)
+        self.length_adjust = length_adjust
+        self.terminator = terminator
+        if minimum_length is None:
+            minimum_length = length_position + self.length_struct.size + len(terminator or '')
+        self.minimum_length = minimum_length
+
+
+    def find(self, data, position=0):
+        start_marker, terminator, minimum_length = self.start_marker, self.terminator, self.minimum_length
+        unpack_from = self.length_struct.unpack_from
+        data_length = len(data)
+        first_incomplete_start = None
+        start = data.find(start_marker, position)
+        while start != -1:
+            if data_length - start < minimum_length: #this and all further candidates are incomplete
+                break
+            length = unpack_from(buffer(data), start + self.length_position)[0] + self.length_adjust
+            end = start + length
+            if length >= minimum_length:
+                if end <= data_length:
+                    if terminator is None or data.startswith(terminator, end - len(terminator)):
+                        return start, length
+                elif first_incomplete_start is None: #may still be completed by more data
+                    first_incomplete_start = start
+            start = data.find(start_marker, start + 1) #look for another candidate
+        if first_incomplete_start is not None:
+            return first_incomplete_start, None
+        if start == -1:
+            return max(position, data_length - len(start_marker) + 1), None
+        return start, None
+
+
+    def missing(self, data, start):
+        available = len(data) - start
+        length_end = self.length_position + self.length_struct.size
+        if available < length_end: #the length field has not arrived yet
+            return max(self.minimum_length - available, 1)
+        length = self.length_struct.unpack_from(buffer(data), start + self.length_position)[0] + self.length_adjust
+        if length < self.minimum_length or length <= available: #not a packet
+            return None
+        return length - available
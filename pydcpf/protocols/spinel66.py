@@ -18,10 +18,15 @@ from .spinelbase import SpinelBasePacket, ACKError
 
 __all__ = ["RequestPacket", "ResponsePacket"]
 
+instruction_element = 'INST' #name of the RequestPacket element identifying the instruction
+check_errors = (ACKError,) #all errors raised by check() for invalid packets
+
 
 
 class Spinel66BasePacket(SpinelBasePacket):
 
+    __slots__ = ()
+
     
     def check(self):
         if self.ACK != '0':
@@ -37,6 +42,8 @@ Spinel66BasePacket.register_element('DATA', "Data contained in packet", start_po
 class RequestPacket(Spinel66BasePacket):
     """RequestPacket class for the Spinel 66 protocol format"""
 
+    __slots__ = ()
+
     
     def __init__(self, INST=None, ADR='$', DATA='', raw_packet=None ):
         if INST is not None or raw_packet is not None:
@@ -51,6 +58,8 @@ RequestPacket.register_element('INST', "Device instruction code character", star
 class ResponsePacket(Spinel66BasePacket):
     """ResponsePacket class for the Spinel 66 protocol format"""
 
+    __slots__ = ()
+
     
     def __init__(self, ACK=None, ADR='$', DATA='', raw_packet=None ):
         if ACK is not None or raw_packet is not None:
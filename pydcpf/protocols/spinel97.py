@@ -15,10 +15,14 @@
 #You should have received a copy of the GNU General Public License
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 from .spinelbase import SpinelBasePacket, ACKError
+from .framing import LengthPrefixedFramer
 
 
 __all__ = ["RequestPacket", "ResponsePacket"]
 
+instruction_element = 'INST' #name of the RequestPacket element identifying the instruction
+match_element = 'SIG' #element copied by the device from the request into the response
+
 
 
 
@@ -35,8 +39,17 @@ class CheckSumError(Exception):
 
 
 
+corruption_errors = (CheckSumError,) #errors raised by check() for packets damaged in transmission
+check_errors = (CheckSumError, ACKError) #all errors raised by check() for invalid packets
+
+
+
 class Spinel97BasePacket(SpinelBasePacket):
 
+    __slots__ = ()
+
+    framer = LengthPrefixedFramer('*', 2, '>H', length_adjust=4, terminator='\r', minimum_length=9) #NUM counts the bytes after it
+
     
     def calculate_checksum(self):
         end = self.start + self.length - 2
@@ -57,26 +70,6 @@ class Spinel97BasePacket(SpinelBasePacket):
             pass # must be a RequestPacket which has INST instead of ACK
 
 
-    def find(self):
-        sup = super(Spinel97BasePacket, self)
-        full_buffer_length = len(self.raw_packet)
-        if sup.find(): #means we have a candidate at all
-            while full_buffer_length - self.start >= 9:
-                # first check whether it could be a valid packet
-                # based on the count of necessary bytes in packet
-                packet_len = self.NUM + 4
-                CR_position = self.start + packet_len - 1 #CR_position must be an index
-                if CR_position < full_buffer_length and self.raw_packet[CR_position] == 13:
-                    # if the last byte is CR as reported by NUM, ord('\r') == 13
-                    self.length = packet_len
-                    return True
-                if not sup.find(self.start + 1): #look for another candidate
-                    return False
-        else:
-            return False
-            
-
-
 Spinel97BasePacket.register_element('NUM', 'Number of bytes in packet after NUM', start_position=2, code='>H')
 Spinel97BasePacket.register_element('ADR', 'Module address number', start_position=4, code='>B')
 Spinel97BasePacket.register_element('SIG', 'Signature number', start_position=5, code='>B')
@@ -89,6 +82,8 @@ Spinel97BasePacket.register_element('SUMA', 'Checksum number', start_position=-2
 class RequestPacket(Spinel97BasePacket):
     """RequestPacket class for the Spinel 97 protocol format"""
 
+    __slots__ = ()
+
     
     def __init__(self, INST=None, ADR=0xfe, DATA='', NUM=None, SIG=None, SUMA=None, raw_packet=None ):
         if raw_packet is not None:
@@ -114,6 +109,8 @@ RequestPacket.register_element('INST', "Device instruction code character", star
 class ResponsePacket(Spinel97BasePacket):
     """ResponsePacket class for the Spinel 97 protocol format"""
 
+    __slots__ = ()
+
     
     def __init__(self, ACK=None, ADR=0xfe, DATA='', NUM=None, SIG=None, SUMA=None, raw_packet=None ):
         if ACK is not None or raw_packet is not None:
@@ -15,6 +15,7 @@
 #You should have received a copy of the GNU General Public License
 #along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
 from .base import ResponsePacket
+from .framing import DelimitedFramer
 
 
 
@@ -59,16 +60,10 @@ class ACKError(Exception):
     
 class SpinelBasePacket(ResponsePacket):
 
+    __slots__ = ()
+
+    framer = DelimitedFramer('*', '\r')
 
-    def find(self, buffer_start=0):
-        raw_packet = self.raw_packet #minimize attr lookups
-        try:
-            start = raw_packet.index('*', buffer_start)
-            end = raw_packet.index('\r', start)
-        except ValueError:
-            return False
-        self.start, self.length = start, end - start + 1
-        return True
 
 
 
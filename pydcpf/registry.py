@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""Registry of protocol and interface modules
+
+Protocols are registered by short names (e.g. 'spinel97') and interfaces by URL schemes (e.g. 'tcp'),
+the modules are imported only when they are first used and then cached.
+Other packages may provide protocols and interfaces through the 'pydcpf.protocols' and 'pydcpf.interfaces'
+entry point groups (setuptools), which are searched only for unknown names that cannot be imported::
+
+    entry_points={'pydcpf.protocols' : ['mydevice = mypackage.mydevice_protocol']}
+
+Device addresses may be given as URLs::
+
+    Device('tcp://192.168.1.254:10001', 'spinel97')
+    Device('serial:///dev/ttyUSB0', 'spinel66')
+    Device('udp://192.168.1.254:10001', 'spinel97')
+"""
+
+__all__ = ['register_protocol', 'register_interface', 'load_protocol', 'load_interface', 'parse_address']
+
+from types import ModuleType
+
+
+protocols = {
+    'spinel66' : 'pydcpf.protocols.spinel66',
+    'spinel97' : 'pydcpf.protocols.spinel97',
+    'evr116' : 'pydcpf.protocols.evr116',
+    'AC250Kxxx' : 'pydcpf.protocols.AC250Kxxx',
+    }
+
+interfaces = {
+    'tcp' : 'pydcpf.interfaces.socket_interface',
+    'udp' : 'pydcpf.interfaces.udp_interface',
+    'serial' : 'pydcpf.interfaces.serial_interface',
+    }
+
+_modules = {} #cache of imported modules by (group, name)
+
+
+
+def register_protocol(name, module):
+    """Register the protocol *module* (module or its import path) under *name*"""
+    protocols[name] = module
+    _modules.pop(('pydcpf.protocols', name), None)
+
+
+def register_interface(scheme, module):
+    """Register the interface *module* (module or its import path) for the URL *scheme*"""
+    interfaces[scheme] = module
+    _modules.pop(('pydcpf.interfaces', scheme), None)
+
+
+def _entry_point(group, name):
+    """Return the module provided by an entry point or None"""
+    try:
+        import pkg_resources #slow, so imported only when needed
+    except ImportError:
+        return None
+    for entry_point in pkg_resources.iter_entry_points(group, name):
+        return entry_point.load()
+    return None
+
+
+def _load(group, registered, name):
+    if isinstance(name, ModuleType):
+        return name
+    key = (group, name)
+    try:
+        return _modules[key]
+    except KeyError:
+        pass
+    module = registered.get(name)
+    if isinstance(module, ModuleType):
+        pass
+    elif module is not None:
+        module = __import__(module, fromlist=[''])
+    else:
+        module = None
+        if '.' in name: #an import path, the entry points need not be searched
+            try:
+                module = __import__(name, fromlist=[''])
+            except ImportError:
+                pass
+        if module is None:
+            module = _entry_point(group, name)
+        if module is None: #must be a top-level module or raise the ImportError
+            module = __import__(name, fromlist=[''])
+    _modules[key] = module
+    return module
+
+
+def load_protocol(name):
+    """Return the protocol module registered as *name*, provided by an entry point or imported from the path *name*
+
+    Modules are returned as they are
+    """
+    return _load('pydcpf.protocols', protocols, name)
+
+
+def load_interface(name):
+    """Return the interface module registered for the scheme *name*, provided by an entry point or imported from the path *name*
+
+    Modules are returned as they are
+    """
+    return _load('pydcpf.interfaces', interfaces, name)
+
+
+def parse_address(address):
+    """Return the (scheme, address) tuple for a device *address*
+
+    URLs 'tcp://host:port', 'udp://host:port' and 'serial://port' are split into the scheme and the address the interface expects,
+    otherwise the scheme is guessed from the address: 'serial' for a str or int referencing a serial port
+    (e.g. '/dev/ttyUSB0' or a port number), 'tcp' for a (str, int) socket address. The scheme is None if unknown.
+    """
+    if isinstance(address, str) and '://' in address:
+        scheme, location = address.split('://', 1)
+        if scheme in ('tcp', 'udp'):
+            host, port = location.rsplit(':', 1)
+            return scheme, (host, int(port))
+        return scheme, location
+    if isinstance(address, (int, str)): #seems to be a serial device
+        return 'serial', address
+    if isinstance(address, tuple) and len(address) == 2 and isinstance(address[0], str) and isinstance(address[1], int): #appears to be a socket address
+        return 'tcp', address
+    return None, address
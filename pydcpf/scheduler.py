@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""This module provides the :class:`Scheduler` class granting access to a shared link by priority
+
+A scheduler replaces the internal lock of the attached :class:`core.Device` instances.
+Each query holds the link only for one request and response, so a bulk transfer made of many queries
+(e.g. :meth:`appliances.DAS1210.Device.get_data` which requests one block per query)
+lets a waiting query of a higher priority class through after at most one block::
+
+    scheduler = Scheduler([das, valve])
+    # in the download thread
+    with scheduler.priority(BULK):
+        data = das.get_data(524288, 1)
+    # meanwhile in the control thread, the default NORMAL priority is higher than BULK
+    valve.close_valve()
+"""
+
+__all__ = ['Scheduler', 'URGENT', 'NORMAL', 'BULK']
+
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+
+URGENT = 0
+NORMAL = 1
+BULK = 2
+
+
+
+class LatencyStatistics(object):
+    """Latency measurements of one priority class
+
+    Attributes
+    ----------
+    count : int
+        number of completed link acquisitions
+    total_latency : float
+        sum of the latencies in seconds
+    max_latency : float
+        worst-case latency in seconds from requesting the link until releasing it
+    max_wait : float
+        worst-case time in seconds spent waiting for the link
+    """
+
+
+    def __init__(self):
+        self.count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.max_wait = 0.0
+
+
+    def add(self, wait, latency):
+        self.count += 1
+        self.total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+
+    @property
+    def mean_latency(self):
+        """Mean latency in seconds"""
+        if self.count == 0:
+            return 0.0
+        return self.total_latency / self.count
+
+
+
+class Scheduler(object):
+    """Reentrant lock granting a link to the waiting thread with the highest priority
+
+    Lower numbers mean higher priority, threads of the same priority are served in FIFO order.
+    The priority of a thread is set with :meth:`Scheduler.priority`, otherwise *default_priority* is used.
+    """
+
+
+    def __init__(self, devices=(), default_priority=NORMAL):
+        """Initialize the scheduler and attach it to the *devices* sharing one link
+
+        Parameters
+        ----------
+        devices : iterable of :class:`core.Device`, optional
+            devices to attach, see :meth:`Scheduler.attach`
+        default_priority : int, optional
+            priority of threads that did not set one with :meth:`Scheduler.priority`
+        """
+        self.default_priority = default_priority
+        self.statistics = {}
+        self._condition = threading.Condition(threading.Lock())
+        self._waiting = [] # heap of (priority, sequence number, thread ident)
+        self._sequence = itertools.count()
+        self._owner = None
+        self._count = 0
+        self._local = threading.local()
+        for device in devices:
+            self.attach(device)
+
+
+    def attach(self, device):
+        """Make the *device* thread-safe and use this scheduler as its lock"""
+        device.thread_safe = True
+        device._lock = self
+
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """Context manager setting the priority of link requests made by the current thread"""
+        local = self._local
+        previous = getattr(local, 'priority', None)
+        local.priority = priority
+        try:
+            yield
+        finally:
+            local.priority = previous
+
+
+    def acquire(self):
+        """Wait until the link is granted to the current thread"""
+        me = threading.current_thread().ident
+        if self._owner == me:
+            self._count += 1
+            return
+        priority = getattr(self._local, 'priority', None)
+        if priority is None:
+            priority = self.default_priority
+        entry = (priority, next(self._sequence), me)
+        requested = time.time()
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while self._owner is not None or self._waiting[0] is not entry:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._owner = me
+            self._count = 1
+        local = self._local
+        local.acquired_priority, local.requested, local.granted = priority, requested, time.time()
+
+
+    def release(self):
+        """Release the link, if it is not held recursively grant it to the next waiting thread"""
+        self._count -= 1
+        if self._count > 0:
+            return
+        local = self._local
+        released = time.time()
+        with self._condition:
+            self._owner = None
+            try:
+                statistics = self.statistics[local.acquired_priority]
+            except KeyError:
+                statistics = self.statistics[local.acquired_priority] = LatencyStatistics()
+            statistics.add(local.granted - local.requested, released - local.requested)
+            self._condition.notify_all()
+
+
+    def __enter__(self):
+        self.acquire()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+#Python device communications protocol framework (pydcpf)
+#Copyright (C) 2013  Ondřej Grover
+#
+#pydcpf is free software: you can redistribute it and/or modify
+#it under the terms of the GNU General Public License as published by
+#the Free Software Foundation, either version 3 of the License, or
+#(at your option) any later version.
+#
+#pydcpf is distributed in the hope that it will be useful,
+#but WITHOUT ANY WARRANTY; without even the implied warranty of
+#MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#GNU General Public License for more details.
+#
+#You should have received a copy of the GNU General Public License
+#along with pydcpf.  If not, see <http://www.gnu.org/licenses/>.
+"""This module provides sinks for storing acquired data blocks directly on disk
+
+A sink has a write_block(channel, sample_offset, data) method, so it can be passed
+e.g. to :class:`appliances.DAS1210.Download` instead of keeping the blocks in memory.
+
+Shot file format (all numbers big-endian)
+-----------------------------------------
+file header : magic 'PDCS', version (H), channel count (H), struct format of one sample (8s, NUL padded)
+channel headers : channel (H), sampling frequency in Hz (d), range in V (f), sample count (Q), offset of the data in the file (Q)
+data : the samples of each channel at its offset, offsets are aligned to :data:`ALIGNMENT` bytes
+
+Archive file format (all numbers big-endian)
+--------------------------------------------
+file header : magic 'PDCA', version (H), channel count (H), struct format of one sample (8s), compression (8s), delta encoding (B)
+channel headers : channel (H), sampling frequency in Hz (d), range in V (f), sample count (Q)
+chunks : chunk header with channel (H), sample offset (Q), sample count (I), compressed length (I) followed by the compressed block
+index : entry count (Q), for each chunk channel (H), sample offset (Q), sample count (I), offset of the compressed block (Q), compressed length (I)
+footer : offset of the index (Q), magic 'PDCI'
+"""
+
+__all__ = ['MemmapSink', 'read_header', 'open_shot', 'ArchiveSink', 'ArchiveReader']
+
+import bz2
+import mmap
+import Queue
+import struct
+import threading
+import zlib
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MAGIC = 'PDCS'
+VERSION = 1
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY #so that each channel can be mapped separately
+
+_file_header = struct.Struct('>4sHH8s')
+_channel_header = struct.Struct('>HdfQQ')
+
+
+
+def read_header(path):
+    """Read the header of a shot file
+
+    Returns
+    -------
+    sample_format : str
+        struct format of one sample, e.g. '>H'
+    channels : list of dict
+        for each channel a dict with the keys 'channel', 'sampling_frequency', 'range', 'sample_count' and 'offset'
+    """
+    with open(path, 'rb') as shot_file:
+        magic, version, channel_count, sample_format = _file_header.unpack(shot_file.read(_file_header.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %i shot file" % (path, VERSION))
+        channels = []
+        for i in xrange(channel_count):
+            channel, sampling_frequency, range_, sample_count, offset = _channel_header.unpack(shot_file.read(_channel_header.size))
+            channels.append(dict(channel=channel, sampling_frequency=sampling_frequency, range=range_, sample_count=sample_count, offset=offset))
+    return sample_format.rstrip('\x00'), channels
+
+
+def open_shot(path, mode='r'):
+    """Open a shot file as a dict of numpy.memmap arrays indexed by the channel number
+
+    The data is not read, the arrays map the file directly. Requires numpy.
+    """
+    import numpy
+    sample_format, channels = read_header(path)
+    dtype = numpy.dtype(sample_format)
+    return dict((info['channel'], numpy.memmap(path, dtype, mode, info['offset'], (info['sample_count'],)))
+                for info in channels)
+
+
+
+class MemmapSink(object):
+    """Sink writing data blocks into a preallocated memory-mapped shot file
+
+    The memory usage does not grow with the amount of data, the data is paged out by the operating system.
+    """
+
+
+    def __init__(self, path, channels=None, sample_format='>H'):
+        """Create a shot file or open an existing one
+
+        Parameters
+        ----------
+        path : str
+            shot file path
+        channels : list of (channel, range, sampling_frequency, sample_count) tuples, optional
+            channels to store, the file is created (or overwritten) and preallocated for them
+            If not specified, an existing file is opened, e.g. to resume a download
+        sample_format : str, optional
+            struct format of one sample, defaults to big-endian unsigned 16 bit integers
+        """
+        if channels is None:
+            sample_format, infos = read_header(path)
+            mode = 'r+b'
+        else:
+            infos = []
+            offset = _file_header.size + len(channels) * _channel_header.size
+            sample_size = struct.calcsize(sample_format)
+            for channel, range_, sampling_frequency, sample_count in channels:
+                offset += -offset % ALIGNMENT
+                infos.append(dict(channel=channel, sampling_frequency=sampling_frequency, range=range_, sample_count=sample_count, offset=offset))
+                offset += sample_count * sample_size
+            mode = 'w+b'
+        self.sample_format = sample_format
+        self.sample_size = struct.calcsize(sample_format)
+        self.channels = infos
+        self._offsets = dict((info['channel'], info['offset']) for info in infos)
+        self._sizes = dict((info['channel'], info['sample_count'] * self.sample_size) for info in infos) #in bytes
+        self._lock = threading.Lock()
+        with open(path, mode) as shot_file:
+            if channels is not None:
+                shot_file.write(_file_header.pack(MAGIC, VERSION, len(infos), sample_format))
+                for info in infos:
+                    shot_file.write(_channel_header.pack(info['channel'], info['sampling_frequency'], info['range'], info['sample_count'], info['offset']))
+                shot_file.truncate(offset) #preallocate, sparse where supported
+            self._map = mmap.mmap(shot_file.fileno(), 0)
+
+
+    def write_block(self, channel, sample_offset, data):
+        """Write the samples in *data* (str, bytearray or buffer) of *channel* starting at sample number *sample_offset*
+
+        Raises
+        ------
+        ValueError
+            if the block does not fit into the samples of the channel
+        """
+        start = sample_offset * self.sample_size
+        if sample_offset < 0 or start + len(data) > self._sizes[channel]:
+            raise ValueError("block of %i bytes at sample %i does not fit into the %i samples of channel %i"
+                             % (len(data), sample_offset, self._sizes[channel] / self.sample_size, channel))
+        with self._lock:
+            self._map.seek(self._offsets[channel] + start)
+            self._map.write(buffer(data)) #accepts only read-only buffers, but without copying
+
+
+    def flush(self):
+        """Flush the written data to the disk"""
+        self._map.flush()
+
+
+    def close(self):
+        """Flush and close the file"""
+        self._map.flush()
+        self._map.close()
+
+
+
+compressors = {
+    'none' : (str, str),
+    'zlib' : (zlib.compress, zlib.decompress),
+    'bz2' : (bz2.compress, bz2.decompress),
+    }
+if lzma is not None:
+    compressors['lzma'] = (lzma.compress, lzma.decompress)
+
+ARCHIVE_MAGIC = 'PDCA'
+INDEX_MAGIC = 'PDCI'
+
+_archive_header = struct.Struct('>4sHH8s8sB')
+_archive_channel_header = struct.Struct('>HdfQ')
+_chunk_header = struct.Struct('>HQII')
+_index_entry = struct.Struct('>HQIQI')
+_footer = struct.Struct('>Q4s')
+
+
+
+def _unsigned_format(sample_format):
+    """Return the struct format of unsigned integers of the same size as *sample_format*"""
+    code = sample_format[-1]
+    if code not in 'bBhHiIlLqQ':
+        raise ValueError("delta encoding needs integer samples, not %r" % sample_format)
+    return sample_format[:-1] + code.upper()
+
+
+def _unsigned_dtype(sample_format):
+    """Return the numpy dtype of the unsigned integers in *sample_format* and the same dtype in the native byte order"""
+    byte_order = {'>' : '>', '!' : '>', '<' : '<'}.get(sample_format[0], '=')
+    dtype = numpy.dtype('%su%i' % (byte_order, struct.calcsize(sample_format)))
+    return dtype, dtype.newbyteorder('=')
+
+
+def _delta_encode(data, sample_format):
+    """Replace each sample in *data* but the first with its difference from the previous one, modulo the integer range"""
+    sample_format = _unsigned_format(sample_format)
+    if numpy is not None:
+        dtype, native_dtype = _unsigned_dtype(sample_format)
+        values = numpy.frombuffer(data, dtype, len(data) / dtype.itemsize).astype(native_dtype)
+        values[1:] -= values[:-1].copy() #unsigned, wraps around
+        return values.astype(dtype).tostring()
+    count = len(data) / struct.calcsize(sample_format)
+    values = struct.unpack('%s%i%s' % (sample_format[:-1], count, sample_format[-1]), data)
+    mask = (1 << (8 * struct.calcsize(sample_format))) - 1
+    previous = 0
+    deltas = []
+    for value in values:
+        deltas.append((value - previous) & mask)
+        previous = value
+    return struct.pack('%s%i%s' % (sample_format[:-1], count, sample_format[-1]), *deltas)
+
+
+def _delta_decode(data, sample_format):
+    """Inverse of :func:`_delta_encode`"""
+    sample_format = _unsigned_format(sample_format)
+    if numpy is not None:
+        dtype, native_dtype = _unsigned_dtype(sample_format)
+        deltas = numpy.frombuffer(data, dtype, len(data) / dtype.itemsize)
+        return numpy.cumsum(deltas, dtype=native_dtype).astype(dtype).tostring() #wraps around like the encoding
+    count = len(data) / struct.calcsize(sample_format)
+    deltas = struct.unpack('%s%i%s' % (sample_format[:-1], count, sample_format[-1]), data)
+    mask = (1 << (8 * struct.calcsize(sample_format))) - 1
+    value = 0
+    values = []
+    for delta in deltas:
+        value = (value + delta) & mask
+        values.append(value)
+    return struct.pack('%s%i%s' % (sample_format[:-1], count, sample_format[-1]), *values)
+
+
+
+class ArchiveSink(object):
+    """Sink writing compressed data blocks into a seekable archive file
+
+    The blocks are compressed and written in a background thread, so that the download continues meanwhile.
+    An index of the blocks is written when the sink is closed, :class:`ArchiveReader` then decompresses only the blocks it needs.
+    """
+
+
+    def __init__(self, path, channels, sample_format='>H', compression='zlib', delta=False, queue_size=64):
+        """Create the archive file
+
+        Parameters
+        ----------
+        path : str
+            archive file path
+        channels : list of (channel, range, sampling_frequency, sample_count) tuples
+            channels to store
+        sample_format : str, optional
+            struct format of one sample, defaults to big-endian unsigned 16 bit integers
+        compression : str, optional
+            one of the keys of :data:`compressors`: 'none', 'zlib', 'bz2' and 'lzma' if available
+        delta : bool, optional
+            If True, the differences of consecutive integer samples are stored, which compress better for slowly changing signals
+        queue_size : int, optional
+            maximum number of blocks waiting for compression, :meth:`ArchiveSink.write_block` blocks when it is reached
+        """
+        self.sample_format = sample_format
+        self.sample_size = struct.calcsize(sample_format)
+        self.delta = delta
+        if delta:
+            _unsigned_format(sample_format) #fail early for non-integer samples
+        self._compress = compressors[compression][0]
+        self._file = open(path, 'wb')
+        self._file.write(_archive_header.pack(ARCHIVE_MAGIC, VERSION, len(channels), sample_format, compression, delta))
+        for channel, range_, sampling_frequency, sample_count in channels:
+            self._file.write(_archive_channel_header.pack(channel, sampling_frequency, range_, sample_count))
+        self.index = []
+        self._error = None
+        self._queue = Queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._compress_blocks)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def _compress_blocks(self):
+        """Main loop of the compressing thread"""
+        while True:
+            block = self._queue.get()
+            if block is None:
+                break
+            if self._error is not None:
+                continue #keep draining the queue so that writers do not block
+            channel, sample_offset, data = block
+            try:
+                if self.delta:
+                    data = _delta_encode(data, self.sample_format)
+                compressed = self._compress(data)
+                self._file.write(_chunk_header.pack(channel, sample_offset, len(data) / self.sample_size, len(compressed)))
+                self.index.append((channel, sample_offset, len(data) / self.sample_size, self._file.tell(), len(compressed)))
+                self._file.write(compressed)
+            except Exception as e:
+                self._error = e
+
+
+    def _raise_error(self):
+        """Re-raise an exception from the compressing thread"""
+        if self._error is not None:
+            raise self._error
+
+
+    def write_block(self, channel, sample_offset, data):
+        """Queue the samples in *data* (str, bytearray or buffer) of *channel* starting at sample number *sample_offset* for compression"""
+        self._raise_error()
+        self._queue.put((channel, sample_offset, str(data))) #copy, the buffer may be reused meanwhile
+
+
+    def close(self):
+        """Wait until all blocks are written, write the index and close the file"""
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._raise_error()
+            index_offset = self._file.tell()
+            self._file.write(struct.pack('>Q', len(self.index)))
+            for entry in self.index:
+                self._file.write(_index_entry.pack(*entry))
+            self._file.write(_footer.pack(index_offset, INDEX_MAGIC))
+        finally:
+            self._file.close()
+
+
+
+class ArchiveReader(object):
+    """Reader of archive files written by :class:`ArchiveSink`
+
+    Attributes
+    ----------
+    sample_format : str
+        struct format of one sample
+    channels : list of dict
+        for each channel a dict with the keys 'channel', 'sampling_frequency', 'range' and 'sample_count'
+    """
+
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        magic, version, channel_count, sample_format, compression, delta = _archive_header.unpack(self._file.read(_archive_header.size))
+        if magic != ARCHIVE_MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %i archive file" % (path, VERSION))
+        self.sample_format = sample_format.rstrip('\x00')
+        self.sample_size = struct.calcsize(self.sample_format)
+        self.delta = bool(delta)
+        self._decompress = compressors[compression.rstrip('\x00')][1]
+        self.channels = []
+        for i in xrange(channel_count):
+            channel, sampling_frequency, range_, sample_count = _archive_channel_header.unpack(self._file.read(_archive_channel_header.size))
+            self.channels.append(dict(channel=channel, sampling_frequency=sampling_frequency, range=range_, sample_count=sample_count))
+        self._sample_counts = dict((info['channel'], info['sample_count']) for info in self.channels)
+        self._file.seek(-_footer.size, 2)
+        index_offset, magic = _footer.unpack(self._file.read(_footer.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError("%s has no index, it was not closed properly" % path)
+        self._file.seek(index_offset)
+        entry_count = struct.unpack('>Q', self._file.read(8))[0]
+        self._index = {} #channel -> sorted list of (sample_offset, sample_count, offset, compressed_length)
+        for i in xrange(entry_count):
+            channel, sample_offset, sample_count, offset, compressed_length = _index_entry.unpack(self._file.read(_index_entry.size))
+            self._index.setdefault(channel, []).append((sample_offset, sample_count, offset, compressed_length))
+        for entries in self._index.itervalues():
+            entries.sort()
+
+
+    def read(self, channel, start=0, stop=None):
+        """Return the samples number *start* to *stop* (exclusive, the sample count of the channel by default) of *channel* as a str
+
+        Only the blocks overlapping the range are decompressed.
+
+        Raises
+        ------
+        ValueError
+            if some of the samples were not stored, e.g. because the download was interrupted
+        """
+        if stop is None:
+            stop = self._sample_counts[channel]
+        chunks = []
+        position = start #first sample not read yet
+        for sample_offset, sample_count, offset, compressed_length in self._index.get(channel, []):
+            if sample_offset + sample_count <= position or sample_offset >= stop:
+                continue
+            if sample_offset > position:
+                break
+            self._file.seek(offset)
+            data = self._decompress(self._file.read(compressed_length))
+            if self.delta:
+                data = _delta_decode(data, self.sample_format)
+            first = position - sample_offset
+            last = min(stop - sample_offset, sample_count)
+            chunks.append(data[first * self.sample_size:last * self.sample_size])
+            position = sample_offset + last
+        if position < stop:
+            raise ValueError("sample %i of channel %i was not stored" % (position, channel))
+        return ''.join(chunks)
+
+
+    def close(self):
+        self._file.close()
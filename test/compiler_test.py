@@ -0,0 +1,75 @@
+import unittest as ut
+
+import pydcpf.protocols.compiler as compiler
+import pydcpf.protocols.framing as framing
+import pydcpf.protocols.spinel97 as s97
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def checksum(raw_packet, start, end):
+    return (255 - sum(raw_packet[start:end])) % 256
+
+
+def spinel97_fields(code_name):
+    return [
+        ('PRE', "Packet prefix character", 'c', '*'),
+        ('FRM', "Packet format number", 'B', 97),
+        ('NUM', "Number of bytes in packet after NUM", 'H', compiler.LENGTH),
+        ('ADR', "Module address number", 'B', 0xfe),
+        ('SIG', "Signature number", 'B', 2),
+        (code_name, "Instruction or acknowledgment code", 'c', None),
+        ('DATA', "Data contained in packet", compiler.VARIABLE, ''),
+        ('SUMA', "Checksum number", 'B', compiler.CHECKSUM),
+        ('CR', "Ending mark character", 'c', '\r'),
+        ]
+
+
+RequestPacket = compiler.packet_class('RequestPacket', spinel97_fields('INST'), length_adjust=4, checksum=checksum)
+ResponsePacket = compiler.packet_class('ResponsePacket', spinel97_fields('ACK'), length_adjust=4, checksum=checksum)
+
+
+class TestCompiler(ut.TestCase):
+
+    def test_encode_matches_hand_written(self):
+        self.assertEqual(RequestPacket(INST='\x51', ADR=3, DATA='abc').raw_packet, s97.RequestPacket(INST='\x51', ADR=3, DATA='abc').raw_packet)
+        self.assertEqual(ResponsePacket(ACK='\x00').raw_packet, s97.ResponsePacket(ACK='\x00').raw_packet)
+        self.assertRaises(ValueError, RequestPacket, ADR=3)
+        self.assertFalse(hasattr(RequestPacket(INST='\x51'), '__dict__'))
+
+    def test_elements_and_check(self):
+        packet = ResponsePacket()
+        packet.raw_packet = bytearray('junk') + s97.ResponsePacket(ACK='\x00', ADR=5, DATA='xyz').raw_packet
+        self.assertTrue(isinstance(ResponsePacket.framer, framing.LengthPrefixedFramer))
+        self.assertTrue(packet.find())
+        self.assertEqual((packet.start, packet.ADR, str(packet.DATA), packet.NUM), (4, 5, 'xyz', 8))
+        packet.check()
+        packet.ADR = 6
+        self.assertRaises(compiler.CheckSumError, packet.check)
+
+    def test_delimited_without_trailer(self):
+        packet_class = compiler.packet_class('Line', [('TAG', "Tag", '2s', '>>'), ('DATA', "Data", compiler.VARIABLE, '')])
+        self.assertEqual(packet_class.framer, None) # no terminator to find the end with
+        packet = packet_class(DATA='hello')
+        self.assertEqual(str(packet.raw_packet), '>>hello')
+        self.assertEqual(str(packet.DATA), 'hello')
+        self.assertEqual(packet.DATA_view.tobytes(), 'hello')
+        packet.DATA = 'world'
+        self.assertEqual(str(packet.raw_packet), '>>world')
+
+    @ut.skipIf(numpy is None, "numpy not available")
+    def test_decode_batch_without_trailer(self):
+        packet_class = compiler.packet_class('Line', [('TAG', "Tag", '2s', '>>'), ('DATA', "Data", compiler.VARIABLE, '')])
+        self.assertEqual(packet_class.numpy_dtype().names, ('offset', 'length', 'DATA_offset', 'DATA_length', 'TAG'))
+        data = '>>hello>>hi'
+        batch = packet_class.decode_batch(data, [0, 7], [7, 4])
+        self.assertEqual(list(batch['DATA_offset']), [2, 9])
+        self.assertEqual(list(batch['DATA_length']), [5, 2])
+        self.assertEqual(list(batch['TAG']), ['>>', '>>'])
+
+
+if __name__ == "__main__":
+    ut.main()
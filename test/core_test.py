@@ -0,0 +1,312 @@
+import threading
+import time
+import types
+import unittest as ut
+
+import pydcpf.core as core
+import pydcpf.interfaces.base as interface_base
+import pydcpf.protocols.spinel97 as s97
+
+
+class LoopbackInterface(interface_base.Interface):
+    """Fake Spinel 97 device replying with the DATA of each request"""
+
+    def __init__(self, timeout, chunk_size=3):
+        self.timeout = timeout
+        self.timeouts = []
+        self.chunk_size = chunk_size
+        self.drop_count = 0 # number of following requests to leave unanswered
+        self.broken = False
+        self.connect_count = 0
+        self.connect_failures = 0 # number of following connection attempts to fail
+        self.garbage = '' # sent before the next reply
+        self.corrupt_count = 0 # number of following replies with a damaged byte
+        self.late_count = 0 # number of following replies sent after late_delay seconds
+        self.late_delay = 0.0
+        self.sent = []
+        self.batches = [] # number of chunks of each send_data_many call
+        self.requested = [] # byte count of each receive_data call
+        self.pending = bytearray()
+        self.condition = threading.Condition()
+
+    def connect(self, address, serve):
+        if self.connect_failures > 0:
+            self.connect_failures -= 1
+            raise IOError("connection refused")
+        self.connect_count += 1
+        self.broken = False
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+        self.timeouts.append(timeout)
+
+    def reply(self, raw_request):
+        request = s97.RequestPacket(raw_packet=bytearray(raw_request))
+        return s97.ResponsePacket(ACK='\x00', ADR=request.ADR, SIG=request.SIG, DATA=str(request.DATA)).raw_packet
+
+    def send_data(self, data):
+        with self.condition:
+            if self.broken:
+                raise interface_base.ConnectionLost("broken")
+            self.sent.append(bytes(data))
+            if self.drop_count > 0:
+                self.drop_count -= 1
+                return
+            self.pending.extend(self.garbage)
+            self.garbage = ''
+            reply = self.reply(data)
+            if self.corrupt_count > 0:
+                self.corrupt_count -= 1
+                reply[7] ^= 0xff
+            if self.late_count > 0:
+                self.late_count -= 1
+                timer = threading.Timer(self.late_delay, self.deliver, [reply])
+                timer.daemon = True
+                timer.start()
+                return
+            self.deliver(reply)
+
+    def deliver(self, reply):
+        with self.condition:
+            self.pending.extend(reply)
+            self.condition.notify_all()
+
+    def send_data_many(self, chunks):
+        self.batches.append(len(chunks))
+        interface_base.Interface.send_data_many(self, chunks)
+
+    def receive_data(self, byte_count):
+        self.requested.append(byte_count)
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(self.timeout)
+            if not self.pending:
+                raise interface_base.Timeout("timed out")
+            count = min(byte_count, self.chunk_size)
+            data = bytes(self.pending[:count])
+            del self.pending[:count]
+            return data
+
+
+loopback_module = types.ModuleType('loopback')
+loopback_module.Interface = LoopbackInterface
+
+
+class LineLoopbackInterface(LoopbackInterface):
+    """Fake EVR 116 device echoing each request line"""
+
+    def reply(self, raw_request):
+        return bytearray(raw_request)
+
+
+line_loopback_module = types.ModuleType('line_loopback')
+line_loopback_module.Interface = LineLoopbackInterface
+
+
+def make_device(device_class=core.Device, **kwargs):
+    return device_class(None, 'pydcpf.protocols.spinel97', interface_module=loopback_module, **kwargs)
+
+
+class EchoDevice(core.Device):
+    pass
+
+EchoDevice.register_command('echo', '\x51', [('value', 7), 'channel'], request_format='>H', response_format='>H', decoder=lambda value: value * 2)
+
+
+class TestDevice(ut.TestCase):
+
+    def test_query(self):
+        device = make_device()
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='abc')), 'abc')
+        self.assertEqual(device.interface.sent, [bytes(s97.RequestPacket(INST='\x51', ADR=3, DATA='abc', SIG=0).raw_packet)]) # SIG counts the queries
+
+    def test_query_packet(self):
+        device = make_device()
+        packet = device.query_packet(INST='\x51', ADR=3, DATA='\x05')
+        self.assertEqual(packet.element_int('DATA'), 5)
+        self.assertEqual(packet.ADR, 3)
+
+    def test_register_command(self):
+        device = make_device(EchoDevice)
+        self.assertEqual(device.echo(3, 5), 6)
+        self.assertEqual(device.echo(channel=5), 14)
+        self.assertEqual(s97.RequestPacket(raw_packet=bytearray(device.interface.sent[0])).ADR, 5)
+        self.assertRaises(TypeError, device.echo, 3)
+        self.assertRaises(TypeError, device.echo, 3, 5, channel=5)
+        device.interface.sent = []
+        self.assertEqual(device.echo_many([1, 2, 3], value=4), [8, 8, 8])
+        self.assertEqual([s97.RequestPacket(raw_packet=bytearray(raw)).ADR for raw in device.interface.sent], [1, 2, 3])
+
+    def test_register_command_uses_query(self):
+        class AddressingDevice(EchoDevice):
+            def query(self, send_byte_count=None, receive_byte_count=None, check_parameters=dict(), **packet_parameters):
+                packet_parameters['ADR'] = 9 # like a device inserting its own address
+                return super(AddressingDevice, self).query(send_byte_count, receive_byte_count, check_parameters, **packet_parameters)
+        device = make_device(AddressingDevice)
+        self.assertEqual(device.echo(3, 5), 6)
+        self.assertEqual(s97.RequestPacket(raw_packet=bytearray(device.interface.sent[0])).ADR, 9)
+        class BroadcastDevice(EchoDevice):
+            def query(self, send_byte_count=None, receive_byte_count=None, check_parameters=dict(), **packet_parameters):
+                self.send_request(send_byte_count, **packet_parameters) # no response expected
+        device = make_device(BroadcastDevice)
+        self.assertEqual(device.echo(3, 0xff), None)
+        self.assertEqual(len(device.interface.sent), 1)
+
+    def test_thread_safe_query(self):
+        device = make_device(thread_safe=True)
+        errors = []
+        def worker(name):
+            for i in xrange(50):
+                data = '%s%i' % (name, i)
+                reply = str(device.query(INST='\x51', ADR=3, DATA=data))
+                if reply != data:
+                    errors.append((data, reply))
+        threads = [threading.Thread(target=worker, args=(name,)) for name in 'abcd']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_adaptive_timeout(self):
+        device = make_device(timeout=0.5, adaptive_timeout=True, timeout_floor=0.01, instruction_timeouts={'\x52' : 2.0})
+        for i in xrange(20):
+            device.query(INST='\x51', ADR=3, DATA='a')
+        self.assertEqual(device.round_trip.timeout, 0.01)
+        self.assertEqual(device.interface.timeout, 0.01)
+        device.query(INST='\x52', ADR=3, DATA='a')
+        self.assertEqual(device.interface.timeout, 2.0)
+        self.assertEqual(device.round_trip.timeout, 0.01) # not measured
+        device.interface.drop_count = 1
+        self.assertRaises(interface_base.Timeout, device.query, INST='\x51', ADR=3, DATA='a')
+        self.assertEqual(device.round_trip.timeout, 0.02)
+
+    def test_retry_idempotent(self):
+        device = make_device(timeout=0.01, retries=1, idempotent_instructions=['\x51'])
+        device.interface.drop_count = 1
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='a')), 'a')
+        self.assertEqual(len(device.interface.sent), 2)
+        device.interface.drop_count = 1
+        self.assertRaises(interface_base.Timeout, device.query, INST='\x52', ADR=3, DATA='a')
+
+    def test_late_reply_drained(self):
+        device = make_device(timeout=0.05, retries=1, idempotent_instructions=['\x51'])
+        device.interface.late_count = 1
+        device.interface.late_delay = 0.08
+        self.assertEqual([str(device.query(INST='\x51', ADR=3, DATA=data)) for data in 'ABC'], ['A', 'B', 'C'])
+        self.assertEqual(len(device.interface.sent), 4)
+        self.assertEqual(device.statistics['discarded_bytes'], 10) # the late reply to the first attempt
+
+    def test_late_reply_dropped(self):
+        device = make_device(timeout=0.05)
+        device.interface.late_count = 1
+        device.interface.late_delay = 0.08
+        self.assertRaises(interface_base.Timeout, device.query, INST='\x51', ADR=3, DATA='A')
+        time.sleep(0.05) # the late reply is received before the next one
+        self.assertEqual([str(device.query(INST='\x51', ADR=3, DATA=data)) for data in 'BC'], ['B', 'C'])
+        self.assertEqual(device.statistics['stale_packets'], 1)
+
+    def test_reconnect(self):
+        device = make_device(reconnect=True, retries=1, idempotent_instructions=['\x51'], backoff_initial=0)
+        self.assertEqual(device.interface.connect_count, 1)
+        device.interface.broken = True
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='a')), 'a')
+        self.assertEqual(device.interface.connect_count, 2)
+        device.interface.broken = True
+        self.assertRaises(interface_base.ConnectionLost, device.query, INST='\x52', ADR=3, DATA='a')
+        self.assertEqual(device.interface.connect_count, 3)
+
+    def test_circuit_breaker(self):
+        device = make_device(reconnect=True, reconnect_attempts=2, backoff_initial=0, breaker_timeout=60)
+        device.interface.broken = True
+        device.interface.connect_failures = 2
+        self.assertRaises(core.DeviceUnavailable, device.query, INST='\x51', ADR=3, DATA='a')
+        self.assertRaises(core.DeviceUnavailable, device.query, INST='\x51', ADR=3, DATA='a')
+        self.assertEqual(device.interface.sent, [])
+        device._breaker_open_until = 0 # breaker timeout expired
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='a')), 'a')
+
+    def test_garbage_discarded(self):
+        device = make_device()
+        device.interface.garbage = 'noise*a\x00\x05\xfe\x02\x51\x00X' # followed by a candidate with wrong CR position
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='abc')), 'abc')
+        self.assertEqual(device.statistics['discarded_bytes'], 14)
+        self.assertEqual(device.data_buffer, bytearray())
+
+    def test_bounded_buffer(self):
+        device = make_device(max_buffer_size=32)
+        device.interface.garbage = '*a\xff\xff' + 'x' * 100 # candidate that would be complete only after 64k bytes
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='abc')), 'abc')
+        self.assertEqual(device.statistics['discarded_bytes'], 104)
+
+    def test_checksum_retries(self):
+        device = make_device(checksum_retries=2, idempotent_instructions=['\x51'])
+        device.interface.corrupt_count = 2
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='abc')), 'abc')
+        self.assertEqual(len(device.interface.sent), 3)
+        self.assertEqual(device.statistics['corrupted_packets'], 2)
+        self.assertEqual(device.statistics['retransmissions'], 2)
+        self.assertEqual(device.packet_error_rate(), 2 / 3.0)
+        device.interface.corrupt_count = 1
+        self.assertRaises(s97.CheckSumError, device.query, INST='\x52', ADR=3, DATA='abc')
+
+    def test_packet_pool(self):
+        device = make_device(packet_pool_size=1)
+        first = device.query(INST='\x51', ADR=3, DATA='abc')
+        packet = device._packet_pool[0]
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='def')), 'def')
+        self.assertTrue(device._packet_pool[0] is packet) # recycled
+        self.assertEqual(str(first), 'abc') # earlier DATA is not overwritten
+        device.send_request(INST='\x51', ADR=3, DATA='ghi')
+        self.assertTrue(device.receive_response_packet() is packet)
+        self.assertEqual(device._packet_pool, [])
+
+    def test_chunked_send(self):
+        device = make_device(send_byte_count=4)
+        chunks = []
+        device.interface.send_data = chunks.append
+        packet = s97.RequestPacket(INST='\x51', ADR=3, DATA='abcde')
+        device.send_request_packet(packet)
+        self.assertTrue(all(isinstance(chunk, memoryview) for chunk in chunks)) # no copies
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 4, 2])
+        self.assertEqual(''.join(chunk.tobytes() for chunk in chunks), str(packet.raw_packet))
+
+    def test_write_coalescing(self):
+        device = make_device(flush_size=30)
+        for data in ('a', 'b'):
+            device.send_request(flush=False, INST='\x51', ADR=3, DATA=data)
+        self.assertEqual(device.interface.sent, [])
+        self.assertEqual(str(device.receive_response()), 'a') # flushed before receiving
+        self.assertEqual(device.interface.batches, [2])
+        self.assertEqual(str(device.receive_response()), 'b')
+        for data in ('c', 'd', 'e'): # the third one reaches flush_size
+            device.send_request(flush=False, INST='\x51', ADR=3, DATA=data)
+        self.assertEqual(device.interface.batches, [2, 3])
+        device.send_request(flush=False, INST='\x51', ADR=3, DATA='f')
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='g')), 'g') # flushed before the immediate request
+        self.assertEqual(len(device.interface.sent), 7)
+        self.assertEqual(device.statistics['stale_packets'], 4) # the unreceived responses to c, d, e and f
+        device.flush() # nothing buffered
+        self.assertEqual(device.interface.batches, [2, 3, 1])
+
+    def test_adaptive_receive(self):
+        device = make_device(adaptive_receive=True, chunk_size=100)
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='abc')), 'abc')
+        self.assertEqual(device.interface.requested, [9, 3]) # the minimum length, then the rest announced by NUM
+        self.assertEqual(device.receive_calls_per_packet(), 2.0)
+        self.assertEqual(device.statistics['received_bytes'], 12)
+        self.assertEqual(device.statistics['chunk_sizes'], {16 : 1, 4 : 1})
+        device = make_device(chunk_size=100)
+        device.query(INST='\x51', ADR=3, DATA='abc')
+        self.assertEqual(device.interface.requested, [8192])
+
+    def test_adaptive_receive_without_framer(self):
+        device = core.Device(None, 'evr116', interface_module=line_loopback_module, adaptive_receive=True, chunk_size=100)
+        self.assertEqual(str(device.query(IDENTIFIER='h', DATA='abc')), 'abc') # estimates the length from now on
+        self.assertEqual(str(device.query(IDENTIFIER='h', DATA='d' * 40)), 'd' * 40)
+        self.assertEqual(device.interface.requested, [8192, 6, 8192]) # the rest of a longer packet at once
+        self.assertEqual(str(device.query(IDENTIFIER='h', DATA='e')), 'e')
+
+
+if __name__ == "__main__":
+    ut.main()
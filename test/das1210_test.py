@@ -0,0 +1,79 @@
+import os
+import struct
+import tempfile
+import unittest as ut
+
+import pydcpf.appliances.DAS1210 as DAS1210
+import pydcpf.interfaces.base as interface_base
+import pydcpf.storage as storage
+
+from core_test import LoopbackInterface
+
+
+class FlakyInterface(LoopbackInterface):
+    """Loopback failing to answer the request number *fail_at*"""
+
+    def __init__(self, timeout, fail_at):
+        LoopbackInterface.__init__(self, timeout)
+        self.fail_at = fail_at
+
+    def send_data(self, data):
+        if len(self.sent) == self.fail_at:
+            self.drop_count = 1
+        LoopbackInterface.send_data(self, data)
+
+
+class TestDownload(ut.TestCase):
+
+    def setUp(self):
+        self.device = DAS1210.Device('127.0.0.1', connect=False)
+        self.device.interface = FlakyInterface(0.01, fail_at=2)
+        self.bitmap_path = tempfile.mktemp()
+        self.shot_path = tempfile.mktemp()
+
+    def tearDown(self):
+        for path in (self.bitmap_path, self.shot_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def read_shot(self, sample_count):
+        with open(self.shot_path, 'rb') as shot_file:
+            shot_file.seek(storage.read_header(self.shot_path)[1][0]['offset'])
+            return struct.unpack('>%ii' % sample_count, shot_file.read(4 * sample_count))
+
+    def test_resume(self):
+        sink = storage.MemmapSink(self.shot_path, [(1, 10.0, 1e6, 20)], sample_format='>i')
+        download = DAS1210.Download(20, 1, packet_size=2, bitmap_path=self.bitmap_path, sink=sink)
+        self.assertRaises(interface_base.Timeout, self.device.download_data, download)
+        self.assertEqual(download.missing_blocks(), range(2, 10))
+        download.close()
+        sink.close()
+        sink = storage.MemmapSink(self.shot_path) # e.g. in a new process
+        download = DAS1210.Download(20, 1, packet_size=2, bitmap_path=self.bitmap_path, sink=sink)
+        self.assertEqual(download.missing_blocks(), range(2, 10))
+        self.device.download_data(download)
+        self.assertTrue(download.is_complete())
+        self.assertEqual(len(self.device.interface.sent), 11) # 2 + 1 lost + 8 remaining
+        download.close()
+        sink.close()
+        self.assertEqual(self.read_shot(20), sum([(i * 2, 2) for i in xrange(10)], ()))
+
+    def test_bitmap_requires_sink(self):
+        self.assertRaises(ValueError, DAS1210.Download, 20, 1, packet_size=2, bitmap_path=self.bitmap_path)
+
+    def test_in_memory(self):
+        self.device.interface.fail_at = None
+        blocks = self.device.download_data(DAS1210.Download(8, 1, packet_size=2))
+        self.assertEqual([struct.unpack('>ii', str(block)) for block in blocks], [(i * 2, 2) for i in xrange(4)])
+
+    def test_sink(self):
+        sink = storage.MemmapSink(self.shot_path, [(1, 10.0, 1e6, 16)], sample_format='>i')
+        download = DAS1210.Download(16, 1, packet_size=2, sink=sink)
+        self.device.interface.fail_at = None
+        self.assertEqual(self.device.download_data(download), None)
+        sink.close()
+        self.assertEqual(self.read_shot(16), sum([(i * 2, 2) for i in xrange(8)], ()))
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest as ut
+
+import pydcpf.decoder as decoder
+import pydcpf.protocols.spinel97 as s97
+
+
+class TestDecoder(ut.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        self.expected = []
+        with os.fdopen(handle, 'wb') as capture:
+            offset = 0
+            for i in xrange(300):
+                if i % 7 == 0:
+                    capture.write('junk*')
+                    offset += 5
+                packet = s97.ResponsePacket(ACK='\x00', ADR=i % 256, DATA='x' * (i % 13))
+                if i % 50 == 0:
+                    packet.raw_packet[-2] ^= 0xff # damaged checksum
+                capture.write(packet.raw_packet)
+                self.expected.append((offset, len(packet.raw_packet), i % 256, i % 13, i % 50 != 0))
+                offset += len(packet.raw_packet)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def check(self, names, rows):
+        self.assertEqual(names, ['offset', 'length', 'ADR', 'DATA_length', 'valid'])
+        self.assertEqual(rows, self.expected)
+
+    def test_decode_sequential(self):
+        self.check(*decoder.decode(self.path, 'spinel97', columns=['ADR'], processes=1))
+
+    def test_decode_parallel(self):
+        self.check(*decoder.decode(self.path, s97, columns=['ADR'], processes=3, chunk_size=512))
+
+    def test_packet_in_data(self):
+        embedded = str(s97.ResponsePacket(ACK='\x00', ADR=9, DATA='e' * 5).raw_packet)
+        packets = [s97.ResponsePacket(ACK='\x00', ADR=1, DATA='x' * 60 + embedded + 'y' * 10), s97.ResponsePacket(ACK='\x00', ADR=2, DATA='z')]
+        with open(self.path, 'wb') as capture:
+            for packet in packets:
+                capture.write(packet.raw_packet)
+        self.assertEqual(decoder.find_boundaries(self.path, s97.ResponsePacket, 2, s97.check_errors), [0, 93, 103]) # split at 51, before the embedded packet
+        names, rows = decoder.decode(self.path, s97, columns=['ADR'], processes=1, chunk_size=50)
+        self.assertEqual(rows, [(0, 93, 1, 84, True), (93, 10, 2, 1, True)])
+
+
+if __name__ == "__main__":
+    ut.main()
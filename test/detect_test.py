@@ -0,0 +1,47 @@
+import random
+import unittest as ut
+
+import pydcpf.detect as detect
+import pydcpf.protocols.spinel66 as s66
+import pydcpf.protocols.spinel97 as s97
+
+
+class StreamInterface(object):
+
+    def __init__(self, data, chunk_size=16):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    def receive_data(self, byte_count):
+        chunk = self.data[:min(byte_count, self.chunk_size)]
+        self.data = self.data[len(chunk):]
+        return chunk
+
+
+class TestDetect(ut.TestCase):
+
+    def test_spinel97(self):
+        stream = 'noise' + ''.join(str(s97.ResponsePacket(ACK='\x00', ADR=i, DATA='x' * i).raw_packet) for i in xrange(10))
+        detector = detect.detect(StreamInterface(stream))
+        self.assertEqual(detector.result.name, 'spinel97')
+        self.assertTrue(detector.bytes_consumed < len(stream))
+        self.assertTrue(detector.elapsed >= 0)
+
+    def test_spinel66(self):
+        stream = ''.join(str(s66.ResponsePacket(ACK='0', ADR='1', DATA='abc').raw_packet) for i in xrange(10))
+        self.assertEqual(detect.detect(StreamInterface(stream)).result.name, 'spinel66')
+
+    def test_evr116(self):
+        stream = 'X\r\nH\r\n1234\r\nZ12\r\nY\r\n'
+        self.assertEqual(detect.detect(StreamInterface(stream), byte_budget=len(stream)).result.name, 'evr116')
+
+    def test_budget(self):
+        rng = random.Random(1)
+        stream = ''.join(chr(rng.randint(0, 255)) for i in xrange(512))
+        detector = detect.detect(StreamInterface(stream), byte_budget=256)
+        self.assertEqual(detector.result, None)
+        self.assertEqual(detector.bytes_consumed, 256)
+
+
+if __name__ == "__main__":
+    ut.main()
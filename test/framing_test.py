@@ -0,0 +1,37 @@
+import unittest as ut
+
+import pydcpf.protocols.framing as framing
+
+
+class TestFraming(ut.TestCase):
+
+    def test_delimited(self):
+        framer = framing.DelimitedFramer('<<', '>>')
+        self.assertEqual(framer.find(bytearray('xx<<ab>>yy')), (2, 6))
+        self.assertEqual(framer.find(bytearray('xx<<ab>')), (2, None))
+        self.assertEqual(framer.find(bytearray('xxx<')), (3, None)) # may be the beginning of a start marker
+        self.assertEqual(framer.find(bytearray('<<a>><<b>>'), 5), (5, 5))
+
+    def test_delimited_lines(self):
+        framer = framing.DelimitedFramer(None, '\r\n')
+        self.assertEqual(framer.find(bytearray('abc\r\ndef')), (0, 5))
+        self.assertEqual(framer.find(bytearray('abc\r\ndef'), 5), (5, None))
+
+    def test_length_prefixed(self):
+        framer = framing.LengthPrefixedFramer('#', 1, '>B', length_adjust=3, terminator='!')
+        self.assertEqual(framer.find(bytearray('..#\x02ab!')), (2, 5))
+        self.assertEqual(framer.find(bytearray('#\x02ab?#\x00!')), (5, 3)) # wrong terminator position
+        self.assertEqual(framer.find(bytearray('#\xffab#\x00!')), (4, 3)) # incomplete false candidate
+        self.assertEqual(framer.find(bytearray('#\xffab#\x00')), (0, None))
+        self.assertEqual(framer.find(bytearray('abc')), (3, None))
+
+    def test_missing(self):
+        framer = framing.LengthPrefixedFramer('#', 1, '>B', length_adjust=3, terminator='!')
+        self.assertEqual(framer.missing(bytearray('..#'), 2), 2) # up to the minimum length
+        self.assertEqual(framer.missing(bytearray('..#\x02a'), 2), 2)
+        self.assertEqual(framer.missing(bytearray('#\x00!'), 0), None) # complete
+        self.assertEqual(framing.DelimitedFramer('#', '!').missing(bytearray('#a'), 0), None)
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -0,0 +1,48 @@
+import unittest as ut
+
+import pydcpf.core as core
+import pydcpf.process as process
+
+from core_test import loopback_module
+
+
+class TestDeviceProcess(ut.TestCase):
+
+    def setUp(self):
+        self.device = process.DeviceProcess(core.Device, (None, 'pydcpf.protocols.spinel97'),
+                                            dict(interface_module=loopback_module),
+                                            shared_memory_size=4096, shared_threshold=16)
+
+    def tearDown(self):
+        self.device.close()
+
+    def test_query(self):
+        self.assertEqual(self.device.query(INST='\x51', ADR=3, DATA='abc'), 'abc')
+        data = self.device.query(INST='\x51', ADR=3, DATA='x' * 100)
+        self.assertIsInstance(data, buffer)
+        self.assertEqual(str(data), 'x' * 100)
+        self.device.query(INST='\x51', ADR=3, DATA='y' * 50) # must not overwrite the unreleased result
+        self.assertEqual(str(data), 'x' * 100)
+
+    def test_release(self):
+        results = [self.device.query(INST='\x51', ADR=3, DATA=chr(ord('a') + i) * 1000) for i in xrange(4)]
+        self.assertEqual([type(result) for result in results], [buffer] * 4)
+        copied = self.device.query(INST='\x51', ADR=3, DATA='z' * 1000) # the block is full
+        self.assertIsInstance(copied, str)
+        self.assertEqual(copied, 'z' * 1000)
+        self.device.release(results[0], results[1])
+        shared = self.device.query(INST='\x51', ADR=3, DATA='w' * 1000) # reuses the released regions
+        self.assertIsInstance(shared, buffer)
+        self.assertEqual(str(shared), 'w' * 1000)
+        self.assertEqual([str(result) for result in results[2:]], ['c' * 1000, 'd' * 1000])
+
+    def test_attributes(self):
+        self.device.receive_byte_count = 10
+        self.assertEqual(self.device.receive_byte_count, 10)
+
+    def test_exception(self):
+        self.assertRaises(TypeError, self.device.query, INST='\x51', BOGUS=1)
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -0,0 +1,67 @@
+import types
+import unittest as ut
+
+import pydcpf.core as core
+import pydcpf.registry as registry
+import pydcpf.protocols.spinel97 as s97
+
+from core_test import LoopbackInterface
+
+
+class CountingInterface(LoopbackInterface):
+    created = 0
+
+    def __init__(self, timeout, **kwargs):
+        CountingInterface.created += 1
+        LoopbackInterface.__init__(self, timeout, **kwargs)
+
+
+counting_module = types.ModuleType('counting')
+counting_module.Interface = CountingInterface
+
+
+class TestRegistry(ut.TestCase):
+
+    def test_parse_address(self):
+        self.assertEqual(registry.parse_address('tcp://192.168.1.254:10001'), ('tcp', ('192.168.1.254', 10001)))
+        self.assertEqual(registry.parse_address('udp://192.168.1.254:10001'), ('udp', ('192.168.1.254', 10001)))
+        self.assertEqual(registry.parse_address('serial:///dev/ttyUSB0'), ('serial', '/dev/ttyUSB0'))
+        self.assertEqual(registry.parse_address('/dev/ttyS0'), ('serial', '/dev/ttyS0'))
+        self.assertEqual(registry.parse_address(('localhost', 10001)), ('tcp', ('localhost', 10001)))
+        self.assertEqual(registry.parse_address(None), (None, None))
+
+    def test_load_protocol(self):
+        self.assertTrue(registry.load_protocol('spinel97') is s97)
+        self.assertTrue(registry.load_protocol('pydcpf.protocols.spinel97') is s97)
+        self.assertTrue(registry.load_protocol(s97) is s97)
+
+    def test_entry_points(self):
+        searched = []
+        def entry_point(group, name):
+            searched.append(name)
+            return s97 if name == 'provided' else None
+        original_entry_point = registry._entry_point
+        registry._entry_point = entry_point
+        try:
+            self.assertTrue(registry.load_protocol('pydcpf.protocols.evr116').RequestPacket) # imported directly
+            self.assertTrue(registry.load_protocol('provided') is s97)
+            self.assertRaises(ImportError, registry.load_protocol, 'pydcpf.protocols.missing')
+        finally:
+            registry._entry_point = original_entry_point
+            registry._modules.pop(('pydcpf.protocols', 'provided'), None)
+        self.assertEqual(searched, ['provided', 'pydcpf.protocols.missing'])
+
+    def test_lazy_interface(self):
+        registry.register_interface('counting', counting_module)
+        CountingInterface.created = 0
+        device = core.Device('counting://somewhere', 'spinel97', connect=False, chunk_size=5)
+        self.assertEqual(CountingInterface.created, 0)
+        self.assertEqual(device.address, 'somewhere')
+        self.assertEqual(device.interface.chunk_size, 5)
+        self.assertEqual(CountingInterface.created, 1)
+        self.assertEqual(str(device.query(INST='\x51', ADR=3, DATA='abc')), 'abc')
+        self.assertEqual(CountingInterface.created, 1)
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -0,0 +1,49 @@
+import threading
+import time
+import unittest as ut
+
+import pydcpf.protocols.spinel97 as s97
+import pydcpf.scheduler as scheduler
+
+from core_test import make_device
+
+
+class TestScheduler(ut.TestCase):
+
+    def setUp(self):
+        self.device = make_device()
+        self.scheduler = scheduler.Scheduler([self.device])
+
+    def wait_for_waiters(self, count):
+        while len(self.scheduler._waiting) < count:
+            time.sleep(0.001)
+
+    def test_priority_order(self):
+        def worker(name, priority):
+            with self.scheduler.priority(priority):
+                self.device.query(INST='\x51', ADR=3, DATA=name)
+        self.scheduler.acquire() # occupy the link
+        threads = []
+        for i, (name, priority) in enumerate([('bulk', scheduler.BULK), ('normal', scheduler.NORMAL), ('urgent', scheduler.URGENT)]):
+            threads.append(threading.Thread(target=worker, args=(name, priority)))
+            threads[-1].start()
+            self.wait_for_waiters(i + 1)
+        self.scheduler.release()
+        for thread in threads:
+            thread.join()
+        order = [str(s97.RequestPacket(raw_packet=bytearray(raw)).DATA) for raw in self.device.interface.sent]
+        self.assertEqual(order, ['urgent', 'normal', 'bulk'])
+        self.assertEqual(self.scheduler.statistics[scheduler.URGENT].count, 1)
+        self.assertEqual(self.scheduler.statistics[scheduler.NORMAL].count, 2) # including the occupying main thread
+        self.assertEqual(self.scheduler.statistics[scheduler.BULK].count, 1)
+        self.assertTrue(self.scheduler.statistics[scheduler.BULK].max_wait >= self.scheduler.statistics[scheduler.URGENT].max_wait)
+
+    def test_reentrant(self):
+        with self.scheduler:
+            self.assertEqual(str(self.device.query(INST='\x51', ADR=3, DATA='a')), 'a')
+        self.assertEqual(self.scheduler._owner, None)
+        self.assertEqual(self.scheduler.statistics[scheduler.NORMAL].count, 1)
+
+
+if __name__ == "__main__":
+    ut.main()
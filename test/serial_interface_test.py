@@ -0,0 +1,127 @@
+import fcntl
+import io
+import os
+import termios
+import threading
+import time
+import unittest as ut
+
+try:
+    import pydcpf.interfaces.serial_interface as serial_interface
+except ImportError: # pyserial not available
+    serial_interface = None
+
+from pydcpf.interfaces import base
+
+
+@ut.skipIf(serial_interface is None, "pyserial not available")
+class TestSerialInterface(ut.TestCase):
+    """The interface is connected to the slave side of a pseudo terminal, the test plays the device on the master side"""
+
+    def connect(self, timeout=1.0, **kwargs):
+        master, slave = os.openpty()
+        self.master = master
+        self.addCleanup(os.close, master)
+        self.addCleanup(os.close, slave)
+        interface = serial_interface.Interface(timeout, baudrate=9600, **kwargs)
+        interface.connect(os.ttyname(slave), False)
+        self.addCleanup(interface.disconnect, None, False)
+        return interface
+
+    def receive(self, byte_count):
+        data = ''
+        while len(data) < byte_count:
+            data += os.read(self.master, byte_count - len(data))
+        return data
+
+    def test_write_pacing(self):
+        interface = self.connect(write_chunk_size=10)
+        started = time.time()
+        interface.send_data('x' * 40)
+        elapsed = time.time() - started
+        self.assertEqual(self.receive(40), 'x' * 40)
+        self.assertTrue(elapsed >= 3 * interface.wire_time(10), elapsed) # waits for the first three chunks
+
+    def test_response_timeout(self):
+        interface = self.connect(response_latency=0.05, response_length=10)
+        reconfigurations = []
+        interface._reconfigurePort = lambda: reconfigurations.append(True)
+        for i in xrange(3):
+            started = time.time()
+            self.assertRaises(base.Timeout, interface.receive_data, 100)
+            elapsed = time.time() - started
+            self.assertTrue(0.05 <= elapsed < 0.5, elapsed)
+        self.assertEqual(reconfigurations, []) # the port settings were not touched
+
+    def test_timeout(self):
+        interface = self.connect(timeout=0.05)
+        self.assertRaises(base.Timeout, interface.receive_data, 100)
+
+    def write_later(self, *chunks):
+        """Write the (delay, data) *chunks* to the master side in a thread, each delay after the previous write"""
+        def write():
+            for delay, data in chunks:
+                time.sleep(delay)
+                os.write(self.master, data)
+        thread = threading.Thread(target=write)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_waiting_data(self):
+        interface = self.connect()
+        os.write(self.master, 'abc')
+        while interface.inWaiting() < 3:
+            time.sleep(0.001)
+        self.assertEqual(interface.receive_data(2), 'ab') # no more than requested
+        self.assertEqual(interface.receive_data(100), 'c') # does not wait for the rest
+
+    def test_first_byte(self):
+        interface = self.connect()
+        self.write_later((0.05, 'ab'), (0.2, 'cd'))
+        started = time.time()
+        self.assertEqual(interface.receive_data(100), 'ab')
+        self.assertTrue(time.time() - started < 0.2)
+        self.assertEqual(interface.receive_data(100), 'cd')
+
+    def test_inter_byte_gap(self):
+        interface = self.connect(inter_byte_characters=50) # about 52 ms at 9600 Bd
+        self.write_later((0.02, 'ab'), (0.005, 'cd'), (0.2, 'ef'))
+        self.assertEqual(interface.receive_data(100), 'abcd')
+        self.assertEqual(interface.receive_data(100), 'ef')
+        self.write_later((0.0, 'gh'), (0.005, 'ij'))
+        self.assertEqual(interface.receive_data(3), 'ghi') # no more than requested
+        self.assertEqual(interface.receive_data(3), 'j')
+
+    def test_polling(self):
+        interface = self.connect(timeout=0.05)
+        def fileno():
+            raise io.UnsupportedOperation("fileno")
+        interface.fileno = fileno # as on ports without a selectable descriptor
+        started = time.time()
+        self.assertRaises(base.Timeout, interface.receive_data, 100)
+        self.assertTrue(0.05 <= time.time() - started < 0.5)
+        self.write_later((0.02, 'ab'))
+        self.assertEqual(interface.receive_data(100), 'ab')
+
+    def test_low_latency(self):
+        interface = self.connect()
+        self.assertRaises(IOError, interface.set_low_latency, True) # pseudo terminals do not support it
+        flags = [0x40]
+        def ioctl(fd, request, serial_struct):
+            if request == termios.TIOCGSERIAL:
+                serial_struct[serial_interface._FLAGS_INDEX] = flags[0]
+            else:
+                flags[0] = serial_struct[serial_interface._FLAGS_INDEX]
+        original_ioctl = fcntl.ioctl
+        fcntl.ioctl = ioctl
+        try:
+            interface.set_low_latency(True)
+            self.assertEqual(flags[0], 0x40 | serial_interface.ASYNC_LOW_LATENCY)
+            interface.set_low_latency(False)
+            self.assertEqual(flags[0], 0x40)
+        finally:
+            fcntl.ioctl = original_ioctl
+
+
+if __name__ == "__main__":
+    ut.main()
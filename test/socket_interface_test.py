@@ -0,0 +1,47 @@
+import socket
+import unittest as ut
+
+import pydcpf.interfaces.socket_interface as socket_interface
+
+
+class TestSocketInterface(ut.TestCase):
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+
+    def tearDown(self):
+        self.listener.close()
+
+    def connect(self, **kwargs):
+        interface = socket_interface.Interface(1.0, **kwargs)
+        interface.connect(self.listener.getsockname(), False)
+        peer = self.listener.accept()[0]
+        self.addCleanup(peer.close)
+        self.addCleanup(interface.socket.close)
+        return interface, peer
+
+    def test_options(self):
+        interface, peer = self.connect(receive_buffer_size=32768, keepalive=(60, 10, 3))
+        sock = interface.socket
+        self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 32768)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE), 60)
+        interface.disconnect(None, False) #options survive recreating the socket
+        self.assertTrue(interface.socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+    def test_send_data_many(self):
+        interface, peer = self.connect()
+        chunks = [bytearray('*a\\r'), 'bc', buffer(bytearray('xdefx'), 1, 3)]
+        interface.send_data_many(chunks)
+        received = ''
+        while len(received) < 8:
+            received += peer.recv(100)
+        self.assertEqual(received, '*a\\rbcdef')
+
+
+if __name__ == '__main__':
+    ut.main()
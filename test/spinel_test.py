@@ -1,6 +1,11 @@
 import unittest as ut
 import pydcpf.protocols.spinel97 as s97
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class TestSpinel97(ut.TestCase):
     
     def setUp(self):
@@ -26,6 +31,69 @@ class TestSpinel97(ut.TestCase):
         except Exception as e:
             self.fail("request_packet.check() raised " + repr(e))
 
+    def test_find_after_garbage(self):
+        packet = s97.ResponsePacket()
+        packet.raw_packet = bytearray(b'xx*a\x00\x05\xfe\x02\x00\x00X') + self.response_packet.raw_packet
+        self.assertTrue(packet.find())
+        self.assertEqual(packet.start, 11)
+        packet.check() # elements relative to the packet end are found too
+        packet.raw_packet = bytearray(b'xx*a\x00\x05\xfe\x02\x00\x00X*a\x00\x05\r')
+        self.assertFalse(packet.find())
+        self.assertEqual(packet.start, 11) # first position at which a packet may still begin
+
+    def test_element_views(self):
+        packet = s97.ResponsePacket()
+        packet.raw_packet = bytearray('xx') + s97.ResponsePacket(ACK='\x00', ADR=7, DATA='\x01\x02').raw_packet
+        packet.start, packet.length = 2, 11
+        self.assertEqual(packet.DATA_view.tobytes(), '\x01\x02')
+        self.assertEqual(packet.element_int('DATA'), 0x0102)
+        self.assertEqual(packet.element_int('ADR'), 7)
+        self.assertEqual(packet.element_int('NUM'), 7)
+        self.assertEqual(packet.SUMA_view.tobytes(), chr(packet.SUMA))
+        packet.raw_packet[10] = 3
+        self.assertEqual(packet.DATA_view.tobytes(), '\x01\x03') # not a copy
+
+    def test_elements_not_shared(self):
+        self.assertTrue('INST' in s97.RequestPacket.elements_definitions_dict)
+        self.assertFalse('INST' in s97.ResponsePacket.elements_definitions_dict)
+        self.assertFalse('ACK' in s97.Spinel97BasePacket.elements_definitions_dict)
+
+    @ut.skipIf(numpy is None, "numpy not available")
+    def test_decode_batch(self):
+        packets = [s97.ResponsePacket(ACK='\x00', ADR=i, DATA='d' * i) for i in xrange(5)]
+        data = bytearray('garbage').join(packet.raw_packet for packet in packets)
+        offsets = [data.find(packet.raw_packet) for packet in packets]
+        batch = s97.ResponsePacket.decode_batch(data, offsets)
+        self.assertEqual(list(batch['offset']), offsets)
+        self.assertEqual(list(batch['length']), [len(packet.raw_packet) for packet in packets])
+        self.assertEqual(list(batch['ADR']), range(5))
+        self.assertEqual(list(batch['NUM']), [packet.NUM for packet in packets])
+        self.assertEqual(list(batch['SUMA']), [packet.SUMA for packet in packets])
+        self.assertEqual(list(batch['ACK']), [0] * 5)
+        self.assertEqual([str(data[o:o + l]) for o, l in zip(batch['DATA_offset'], batch['DATA_length'])], ['d' * i for i in xrange(5)])
+        self.assertTrue((s97.ResponsePacket.decode_batch(data, offsets, batch['length']) == batch).all())
+        long_packet = s97.ResponsePacket(ACK='\x00', ADR=1, DATA='d' * 65530).raw_packet # longer than 64 KiB
+        batch = s97.ResponsePacket.decode_batch(long_packet + data, [0, len(long_packet)])
+        self.assertEqual(list(batch['length']), [65539, len(packets[0].raw_packet)])
+
+    @ut.skipIf(numpy is None, "numpy not available")
+    def test_decode_batch_lengths(self):
+        packets = [s97.ResponsePacket(ACK='\x00', ADR=i, DATA='d' * i) for i in xrange(5)]
+        data = bytearray('').join(packet.raw_packet for packet in packets)
+        offsets = [data.find(packet.raw_packet) for packet in packets]
+        def find(packet, buffer_start=0):
+            raise AssertionError("lengths not read from the length fields")
+        s97.ResponsePacket.find = find
+        try:
+            batch = s97.ResponsePacket.decode_batch(data, offsets[::-1])
+        finally:
+            del s97.ResponsePacket.find
+        self.assertEqual(list(batch['length']), [len(packet.raw_packet) for packet in packets[::-1]])
+        self.assertRaises(ValueError, s97.ResponsePacket.decode_batch, data, [offsets[1] + 1]) # no start marker
+        self.assertRaises(ValueError, s97.ResponsePacket.decode_batch, data, [offsets[1], offsets[1] + 5]) # overlapping
+        data[offsets[4] - 1] = 'x' # terminator of the fourth packet
+        self.assertRaises(ValueError, s97.ResponsePacket.decode_batch, data, offsets)
+
 
 if __name__ == "__main__":
     ut.main()
@@ -0,0 +1,115 @@
+import os
+import struct
+import tempfile
+import unittest as ut
+
+import pydcpf.storage as storage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestMemmapSink(ut.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mktemp()
+        self.channels = [(1, 10.0, 1e6, 16), (2, 0.5, 2.5e5, 8)]
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self):
+        sink = storage.MemmapSink(self.path, self.channels)
+        sink.write_block(1, 8, buffer(struct.pack('>8H', *range(8, 16))))
+        sink.write_block(2, 0, struct.pack('>8H', *range(100, 108)))
+        sink.close()
+        sink = storage.MemmapSink(self.path) # reopened to resume
+        sink.write_block(1, 0, bytearray(struct.pack('>8H', *range(8))))
+        sink.close()
+
+    def test_block_bounds(self):
+        sink = storage.MemmapSink(self.path, self.channels)
+        self.assertRaises(ValueError, sink.write_block, 1, 12, struct.pack('>8H', *range(8))) # would overwrite channel 2
+        self.assertRaises(ValueError, sink.write_block, 2, -1, struct.pack('>H', 0))
+        sink.write_block(2, 7, struct.pack('>H', 0)) # the last sample
+        sink.close()
+
+    def test_header(self):
+        self.write()
+        sample_format, channels = storage.read_header(self.path)
+        self.assertEqual(sample_format, '>H')
+        self.assertEqual([(info['channel'], info['range'], info['sampling_frequency'], info['sample_count']) for info in channels], self.channels)
+        self.assertEqual(channels[1]['offset'] % storage.ALIGNMENT, 0)
+        with open(self.path, 'rb') as shot_file:
+            shot_file.seek(channels[0]['offset'])
+            self.assertEqual(struct.unpack('>16H', shot_file.read(32)), tuple(range(16)))
+
+    @ut.skipIf(numpy is None, "numpy not available")
+    def test_open_shot(self):
+        self.write()
+        data = storage.open_shot(self.path)
+        self.assertEqual(list(data[1]), range(16))
+        self.assertEqual(list(data[2]), range(100, 108))
+
+
+class TestArchive(ut.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mktemp()
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def check_archive(self, **kwargs):
+        sink = storage.ArchiveSink(self.path, [(1, 10.0, 1e6, 64), (3, 5.0, 1e5, 8)], sample_format='>h', **kwargs)
+        samples = [(i * 37) % 1000 - 500 for i in xrange(64)]
+        for offset in (16, 0, 48, 32): # in any order
+            sink.write_block(1, offset, buffer(struct.pack('>16h', *samples[offset:offset + 16])))
+        sink.write_block(3, 0, struct.pack('>8h', *range(8)))
+        sink.close()
+        reader = storage.ArchiveReader(self.path)
+        self.assertEqual([info['channel'] for info in reader.channels], [1, 3])
+        self.assertEqual(struct.unpack('>64h', reader.read(1)), tuple(samples))
+        self.assertEqual(struct.unpack('>20h', reader.read(1, 10, 30)), tuple(samples[10:30]))
+        self.assertEqual(struct.unpack('>8h', reader.read(3)), tuple(range(8)))
+        reader.close()
+
+    def test_zlib(self):
+        self.check_archive()
+
+    def test_delta_bz2(self):
+        self.check_archive(compression='bz2', delta=True)
+
+    def test_gap(self):
+        sink = storage.ArchiveSink(self.path, [(1, 10.0, 1e6, 64)])
+        for offset in (0, 16, 48):
+            sink.write_block(1, offset, struct.pack('>16H', *range(offset, offset + 16)))
+        sink.close()
+        reader = storage.ArchiveReader(self.path)
+        self.assertEqual(struct.unpack('>24H', reader.read(1, 4, 28)), tuple(range(4, 28)))
+        self.assertEqual(struct.unpack('>8H', reader.read(1, 56)), tuple(range(56, 64)))
+        self.assertRaises(ValueError, reader.read, 1) # samples 32 to 47 are missing
+        self.assertRaises(ValueError, reader.read, 1, 20, 40)
+        reader.close()
+
+    def test_delta_encoding(self):
+        samples = [65535, 0, 1, 65534, 300, 300]
+        data = struct.pack('<6H', *samples)
+        encoded = storage._delta_encode(data, '<h')
+        self.assertEqual(struct.unpack('<6H', encoded), (65535, 1, 1, 65533, 302, 0)) # modulo 2**16
+        self.assertEqual(storage._delta_decode(encoded, '<h'), data)
+        if numpy is not None: # the same without numpy
+            storage.numpy = None
+            try:
+                self.assertEqual(storage._delta_encode(data, '<h'), encoded)
+                self.assertEqual(storage._delta_decode(encoded, '<h'), data)
+            finally:
+                storage.numpy = numpy
+
+
+if __name__ == "__main__":
+    ut.main()
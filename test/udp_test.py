@@ -0,0 +1,99 @@
+import socket
+import threading
+import time
+import unittest as ut
+
+import pydcpf.core as core
+import pydcpf.interfaces.base as base
+import pydcpf.interfaces.udp_interface as udp_interface
+import pydcpf.protocols.spinel97 as s97
+
+
+class FakeDevice(threading.Thread):
+    """Spinel 97 device on a localhost UDP port replying with its name and the DATA of each request"""
+
+    def __init__(self, name):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.device_name = name
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.address = self.socket.getsockname()
+
+    def run(self):
+        while True:
+            try:
+                data, source = self.socket.recvfrom(65535)
+            except socket.error:
+                return
+            request = s97.RequestPacket(raw_packet=bytearray(data))
+            reply = s97.ResponsePacket(ACK='\x00', ADR=request.ADR, SIG=request.SIG, DATA=self.device_name + str(request.DATA))
+            self.socket.sendto(bytes(reply.raw_packet), source)
+
+
+class TestUDP(ut.TestCase):
+
+    def setUp(self):
+        self.fake_devices = [FakeDevice(name) for name in ('a', 'b')]
+        for fake_device in self.fake_devices:
+            fake_device.start()
+        self.hub = udp_interface.Hub(('127.0.0.1', 0))
+
+    def tearDown(self):
+        for fake_device in self.fake_devices:
+            fake_device.socket.close()
+        self.hub.close()
+
+    def make_device(self, fake_device):
+        return core.Device('udp://%s:%i' % fake_device.address, 'spinel97', hub=self.hub)
+
+    def test_shared_socket(self):
+        devices = [self.make_device(fake_device) for fake_device in self.fake_devices]
+        self.assertTrue(devices[0].interface.hub is devices[1].interface.hub)
+        for i in xrange(3):
+            self.assertEqual(str(devices[0].query(INST='\x01', DATA='x%i' % i)), 'ax%i' % i)
+            self.assertEqual(str(devices[1].query(INST='\x01', DATA='y%i' % i)), 'by%i' % i)
+
+    def test_concurrent_queries(self):
+        devices = [self.make_device(fake_device) for fake_device in self.fake_devices]
+        results = {}
+        def worker(device, tag):
+            results[tag] = [str(device.query(INST='\x01', DATA='%s%i' % (tag, i))) for i in xrange(20)]
+        threads = [threading.Thread(target=worker, args=(device, tag)) for device, tag in zip(devices, 'xy')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results['x'], ['ax%i' % i for i in xrange(20)])
+        self.assertEqual(results['y'], ['by%i' % i for i in xrange(20)])
+
+    def test_shared_peer(self):
+        first, second = [udp_interface.Interface(0.05, hub=self.hub) for i in xrange(2)]
+        for interface in (first, second):
+            interface.connect(self.fake_devices[0].address, False)
+        first.disconnect(None, False)
+        self.assertRaises(udp_interface.Timeout, second.receive_data, 100) # the queue is still registered
+        second.disconnect(None, False)
+        second.peer = self.fake_devices[0].address
+        self.assertRaises(base.ConnectionLost, second.receive_data, 100)
+
+    def test_timeout(self):
+        hub = udp_interface.Hub(('127.0.0.1', 0))
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(('127.0.0.1', 0))
+        try:
+            interface = udp_interface.Interface(0.05, hub=hub)
+            interface.connect(silent.getsockname(), False)
+            self.assertRaises(udp_interface.Timeout, interface.receive_data, 100)
+            silent.sendto('late', hub.socket.getsockname()) # the reply arrives after the timeout
+            time.sleep(0.01)
+            interface.send_data('request') # flushes it
+            self.assertRaises(udp_interface.Timeout, interface.receive_data, 100)
+            self.assertRaises(ValueError, interface.connect, silent.getsockname(), True)
+        finally:
+            silent.close()
+            hub.close()
+
+
+if __name__ == '__main__':
+    ut.main()